@@ -0,0 +1,261 @@
+from typing import Any, AsyncIterator, Dict, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import math
+import time
+
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Backoff applied when a quota error doesn't say how long to wait
+DEFAULT_BACKOFF_SECONDS = 5.0
+# Per-user buckets kept before idle (full) ones are dropped
+MAX_TRACKED_USERS = 10000
+
+
+class AdmissionRejected(Exception):
+    """An LLM call was refused before it was sent."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"LLM call rejected ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        """Take one token if available."""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def refund(self) -> None:
+        """Give back a token taken for a call that was never sent."""
+        self._refill()
+        self._tokens = min(self.burst, self._tokens + 1)
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available."""
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else math.inf
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.burst
+
+
+class LLMAdmissionController:
+    """
+    Admission control in front of Gemini.
+
+    A call is admitted once it passes, in order:
+        1. the shared quota backoff set by `report_rate_limited` after a 429
+        2. the caller's per-user token bucket (never waited on)
+        3. the worker-wide token bucket for chat turns, or for auxiliary
+           calls (titles, follow-ups, summaries; no `user_id`) a bucket
+           of their own, so they never eat into the turn budget
+        4. the concurrency semaphore
+
+    Steps 1, 3 and 4 queue the call for up to `queue_timeout` seconds, with
+    at most `max_queue` calls waiting; beyond that, when the wait is known
+    to be longer, or for calls that opt out of queueing, the call fails
+    fast with `AdmissionRejected` instead of being sent to fail at the API.
+    Tokens taken by a call that is then rejected (or cancelled) are given
+    back, since nothing was sent.
+
+    All limits apply per worker process: with N uvicorn workers the API
+    sees up to N times the configured rates, so size them as the Gemini
+    quota divided by the number of workers.
+    """
+
+    def __init__(
+        self,
+        global_rate_per_minute: float = 60.0,
+        global_burst: int = 10,
+        aux_rate_per_minute: float = 60.0,
+        aux_burst: int = 10,
+        user_rate_per_minute: float = 10.0,
+        user_burst: int = 5,
+        max_concurrency: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 10.0
+    ):
+        self.user_rate = user_rate_per_minute / 60.0
+        self.user_burst = user_burst
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._global_bucket = TokenBucket(global_rate_per_minute / 60.0, global_burst)
+        self._aux_bucket = TokenBucket(aux_rate_per_minute / 60.0, aux_burst)
+        self._user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._backoff_until = 0.0
+        self._queued = 0
+        self._in_flight = 0
+        self._stats: Dict[str, int] = {
+            "admitted": 0,
+            "rejected_user_rate": 0,
+            "rejected_global_rate": 0,
+            "rejected_aux_rate": 0,
+            "rejected_queue_full": 0,
+            "rejected_quota_backoff": 0,
+            "rate_limited_responses": 0,
+        }
+
+    def _reject(self, reason: str, retry_after: float) -> AdmissionRejected:
+        self._stats[f"rejected_{reason}"] += 1
+        return AdmissionRejected(reason, retry_after)
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._user_buckets.get(user_id)
+        if bucket is None:
+            if len(self._user_buckets) >= MAX_TRACKED_USERS:
+                # Full buckets hold no state worth keeping
+                for idle_user in [u for u, b in self._user_buckets.items() if b.is_full]:
+                    del self._user_buckets[idle_user]
+                while len(self._user_buckets) >= MAX_TRACKED_USERS:
+                    self._user_buckets.popitem(last=False)
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._user_buckets[user_id] = bucket
+        self._user_buckets.move_to_end(user_id)
+        return bucket
+
+    def report_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """Hold back every call until the API's suggested retry delay has passed."""
+        delay = retry_after if retry_after is not None else DEFAULT_BACKOFF_SECONDS
+        self._backoff_until = max(self._backoff_until, time.monotonic() + delay)
+        self._stats["rate_limited_responses"] += 1
+        logger.warning(f"Gemini quota exhausted; holding LLM calls for {delay:.1f}s")
+
+    async def _wait_for_admission(self, user_id: Optional[str], timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+
+        backoff = self._backoff_until - time.monotonic()
+        if backoff > 0:
+            if backoff > timeout:
+                raise self._reject("quota_backoff", backoff)
+            await asyncio.sleep(backoff)
+
+        user_bucket = None
+        if user_id is not None:
+            user_bucket = self._user_bucket(user_id)
+            if not user_bucket.try_take():
+                raise self._reject("user_rate", user_bucket.wait_time())
+
+        if user_id is not None:
+            rate_bucket, rate_reason = self._global_bucket, "global_rate"
+        else:
+            rate_bucket, rate_reason = self._aux_bucket, "aux_rate"
+        rate_taken = acquired = False
+        try:
+            while not rate_bucket.try_take():
+                wait = rate_bucket.wait_time()
+                if time.monotonic() + wait > deadline:
+                    raise self._reject(rate_reason, wait)
+                await asyncio.sleep(wait)
+            rate_taken = True
+
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            if not self._semaphore.locked():
+                # Free slot: taken without yielding to the event loop
+                await self._semaphore.acquire()
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._reject("queue_full", 1.0)
+            try:
+                async with asyncio.timeout(remaining):
+                    await self._semaphore.acquire()
+                    acquired = True
+            except TimeoutError:
+                # The slot may have been granted just as the timeout fired
+                if not acquired:
+                    raise self._reject("queue_full", 1.0)
+        except BaseException:
+            # Nothing was sent: give back the slot and the call's rate tokens
+            if acquired:
+                self._semaphore.release()
+            if rate_taken:
+                rate_bucket.refund()
+            if user_bucket is not None:
+                user_bucket.refund()
+            raise
+
+    @asynccontextmanager
+    async def admit(self, user_id: Optional[str] = None, queue: bool = True) -> AsyncIterator[None]:
+        """
+        Hold an LLM slot for the duration of the block.
+
+        Args:
+            user_id: The requesting user, for per-user limits; None for
+                auxiliary calls (titles, follow-ups, summaries)
+            queue: Wait up to `queue_timeout` for a slot; auxiliary calls
+                with a cheap fallback pass False to fail fast instead
+
+        Raises:
+            AdmissionRejected: If the call should not be sent now
+        """
+        if self._queued >= self.max_queue:
+            raise self._reject("queue_full", 1.0)
+
+        self._queued += 1
+        try:
+            await self._wait_for_admission(user_id, self.queue_timeout if queue else 0.0)
+        finally:
+            self._queued -= 1
+
+        self._in_flight += 1
+        self._stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, in-flight calls and rejection counters."""
+        return {
+            **self._stats,
+            "queued": self._queued,
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "backoff_remaining_seconds": round(
+                max(0.0, self._backoff_until - time.monotonic()), 1),
+        }
+
+
+# Singleton instance shared by all LLM calls in this worker
+llm_admission = LLMAdmissionController(
+    global_rate_per_minute=settings.llm_global_requests_per_minute,
+    global_burst=settings.llm_global_burst,
+    aux_rate_per_minute=settings.llm_aux_requests_per_minute,
+    aux_burst=settings.llm_aux_burst,
+    user_rate_per_minute=settings.llm_user_requests_per_minute,
+    user_burst=settings.llm_user_burst,
+    max_concurrency=settings.llm_max_concurrency,
+    max_queue=settings.llm_max_queue,
+    queue_timeout=settings.llm_queue_timeout_seconds,
+)
@@ -0,0 +1,154 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from config import settings
+from ingest_manifest import corpus_version
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def chunk_fingerprint(chunk_ids: List[str]) -> str:
+    """Order-independent fingerprint of a set of retrieved chunk IDs."""
+    return hashlib.sha256("\n".join(sorted(chunk_ids)).encode()).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers looked up by query similarity.
+
+    An entry is reused only when the prompt type and the set of retrieved
+    chunks are identical and the new query's embedding is within
+    `similarity_threshold` (cosine) of the cached one. Embeddings are
+    L2-normalized, so cosine similarity is a plain dot product.
+
+    The whole cache is dropped when the ingest manifest changes, i.e. after
+    any reingest.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 2000,
+        ttl_seconds: float = 6 * 3600,
+        version_check_interval: float = 5.0
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_check_interval = version_check_interval
+        # entry_id -> (bucket key, embedding, answer, expires_at), in LRU order
+        self._entries: "OrderedDict[str, Tuple[Tuple[str, str], List[float], Dict[str, Any], float]]" = OrderedDict()
+        # (prompt_type, chunk fingerprint) -> entry ids
+        self._buckets: Dict[Tuple[str, str], List[str]] = {}
+        self._lock = threading.Lock()
+        self._corpus_version = corpus_version()
+        self._last_version_check = time.monotonic()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_corpus_version(self) -> None:
+        """Drop everything if the index was rebuilt since the last check."""
+        now = time.monotonic()
+        if now - self._last_version_check < self.version_check_interval:
+            return
+        self._last_version_check = now
+        version = corpus_version()
+        if version != self._corpus_version:
+            self._corpus_version = version
+            self._clear_locked()
+            self._stats["invalidations"] += 1
+            logger.info("Answer cache invalidated after reingest")
+
+    def _clear_locked(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+    def _remove_locked(self, entry_id: str) -> None:
+        bucket_key = self._entries.pop(entry_id)[0]
+        ids = self._buckets.get(bucket_key, [])
+        if entry_id in ids:
+            ids.remove(entry_id)
+        if not ids:
+            self._buckets.pop(bucket_key, None)
+
+    def lookup(
+        self,
+        query_embedding: List[float],
+        prompt_type: str,
+        chunk_ids: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        """Return a cached answer for a similar query over the same chunks."""
+        bucket_key = (prompt_type, chunk_fingerprint(chunk_ids))
+        with self._lock:
+            self._check_corpus_version()
+            now = time.monotonic()
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._buckets.get(bucket_key, [])):
+                _, embedding, _, expires_at = self._entries[entry_id]
+                if expires_at < now:
+                    self._remove_locked(entry_id)
+                    continue
+                score = sum(a * b for a, b in zip(query_embedding, embedding))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self._stats["hits"] += 1
+            return dict(self._entries[best_id][2])
+
+    def store(
+        self,
+        query_embedding: List[float],
+        prompt_type: str,
+        chunk_ids: List[str],
+        answer: Dict[str, Any]
+    ) -> None:
+        """Cache an answer (message, sources, follow_up_questions)."""
+        bucket_key = (prompt_type, chunk_fingerprint(chunk_ids))
+        entry_id = uuid.uuid4().hex
+        with self._lock:
+            self._check_corpus_version()
+            self._entries[entry_id] = (
+                bucket_key, list(query_embedding), dict(answer),
+                time.monotonic() + self.ttl_seconds
+            )
+            self._buckets.setdefault(bucket_key, []).append(entry_id)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear_locked()
+            self._stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit-rate metrics."""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "similarity_threshold": self.similarity_threshold,
+        }
+
+
+# Singleton instance
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=settings.answer_cache_similarity,
+    max_entries=settings.answer_cache_max_entries,
+    ttl_seconds=settings.answer_cache_ttl_seconds,
+)
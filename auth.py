@@ -1,9 +1,15 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import firebase_admin
 from firebase_admin import credentials, auth
+import asyncio
+import hashlib
 import logging
 import os
+import threading
+import time
 
 from config import settings
 
@@ -27,6 +33,145 @@ except Exception as e:
 security = HTTPBearer()
 
 
+class CachedTokenVerifier:
+    """
+    Firebase ID-token verification with a cache of already verified tokens.
+
+    A token's decoded claims are reused until its `exp`, keyed by the
+    token's SHA-256 so raw tokens are never held in memory. Tokens are
+    not checked for revocation (as before), so caching doesn't weaken
+    anything. Misses are verified in a worker thread by the public
+    `auth.verify_id_token`, and a background loop keeps the Firebase SDK's
+    public-key cache warm (where the SDK allows it) so requests don't wait
+    on the certificate download.
+    """
+
+    def __init__(self, max_entries: int = 10000, cert_refresh_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.cert_refresh_seconds = cert_refresh_seconds
+        # sha256(token) -> (decoded claims, exp), in LRU order
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._stats = {"hits": 0, "misses": 0, "cert_refreshes": 0, "cert_refresh_errors": 0}
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            decoded_token, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return decoded_token
+
+    def _store(self, key: str, decoded_token: Dict[str, Any]) -> None:
+        expires_at = decoded_token.get("exp")
+        if not expires_at:
+            return
+        with self._lock:
+            self._entries[key] = (decoded_token, float(expires_at))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Verify an ID token, from cache when it was verified before.
+
+        Returns:
+            The decoded token claims
+
+        Raises:
+            The `firebase_admin.auth` errors of `auth.verify_id_token`
+        """
+        key = hashlib.sha256(token.encode()).hexdigest()
+        decoded_token = self._lookup(key)
+        if decoded_token is not None:
+            self._stats["hits"] += 1
+            return decoded_token
+
+        self._stats["misses"] += 1
+        decoded_token = await asyncio.to_thread(auth.verify_id_token, token)
+        self._store(key, decoded_token)
+        return decoded_token
+
+    def _sdk_cert_fetcher(self) -> Optional[Callable[[], Any]]:
+        """
+        Find the Firebase SDK's certificate download, whose HTTP cache
+        `auth.verify_id_token` reads.
+
+        This reaches into firebase_admin internals (checked against the
+        version pinned in requirements.txt). If they have changed, nothing
+        is prefetched and verification fetches certificates on demand.
+
+        Returns:
+            A callable downloading the certificates, or None
+        """
+        try:
+            verifier = auth._get_client(None)._token_verifier
+            request = verifier.request
+            cert_url = verifier.id_token_verifier.cert_url
+        except Exception as e:
+            logger.warning(f"Firebase certificate prefetch unavailable: {str(e)}")
+            return None
+        if not callable(request) or not cert_url:
+            logger.warning("Firebase certificate prefetch unavailable: unexpected SDK internals")
+            return None
+        return lambda: request(url=cert_url, method="GET")
+
+    async def _refresh_loop(self, fetch_certs: Callable[[], Any]) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(fetch_certs)
+                self._stats["cert_refreshes"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["cert_refresh_errors"] += 1
+                logger.warning(f"Firebase certificate prefetch failed: {str(e)}")
+            await asyncio.sleep(self.cert_refresh_seconds)
+
+    async def start(self) -> None:
+        """Start prefetching certificates on the running event loop."""
+        if self._refresh_task is not None:
+            return
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            # Firebase isn't initialized, so there is nothing to verify with
+            return
+        fetch_certs = self._sdk_cert_fetcher()
+        if fetch_certs is not None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(fetch_certs))
+
+    async def stop(self) -> None:
+        """Stop the certificate prefetch loop."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit-rate metrics."""
+        stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+            "cached_tokens": len(self._entries),
+        }
+
+
+# Singleton instance, started and stopped by the app lifespan
+token_verifier = CachedTokenVerifier(
+    max_entries=settings.auth_token_cache_size,
+    cert_refresh_seconds=settings.auth_cert_refresh_seconds,
+)
+
+
 async def verify_firebase_token(
     credentials: HTTPAuthorizationCredentials = Security(security)
 ) -> dict:
@@ -51,8 +196,8 @@ async def verify_firebase_token(
     token = credentials.credentials
 
     try:
-        # Verify the ID token
-        decoded_token = auth.verify_id_token(token)
+        # Verify the ID token (cached until it expires)
+        decoded_token = await token_verifier.verify(token)
 
         # Extract user info
         user_info = {
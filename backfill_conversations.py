@@ -0,0 +1,35 @@
+"""
+Backfill denormalized fields on conversations written before they existed.
+
+Conversations get `title_tokens` (used by title search) and `last_message`
+the first time a listing page shows them; run this once after upgrading so
+older conversations are searchable right away.
+
+Usage:
+    python backfill_conversations.py [--user UID]
+
+Options:
+    --user UID: Only backfill this user's conversations
+"""
+
+import asyncio
+import sys
+import logging
+
+import auth  # noqa: F401  (initializes the Firebase Admin SDK)
+from firestore_db import firestore_db
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    user_id = None
+    if "--user" in sys.argv:
+        user_id = sys.argv[sys.argv.index("--user") + 1]
+
+    updated = asyncio.run(firestore_db.backfill_conversations(user_id))
+    logger.info(f"Backfilled {updated} conversation(s)")
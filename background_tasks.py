@@ -0,0 +1,117 @@
+from typing import Any, Awaitable, Callable, Optional
+import logging
+import asyncio
+
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A job is a zero-argument callable returning a fresh coroutine, so it can be retried
+Job = Callable[[], Awaitable[Any]]
+
+
+class BackgroundTaskQueue:
+    """Bounded-concurrency queue for work that must not delay the response."""
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        max_retries: int = 2,
+        retry_delay: float = 0.5
+    ):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list = []
+        self._stats = {"submitted": 0, "completed": 0, "retried": 0, "failed": 0}
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """Start the worker tasks on the running event loop."""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(i))
+            for i in range(self.concurrency)
+        ]
+        logger.info(
+            f"Background task queue started with {self.concurrency} workers")
+
+    async def submit(self, name: str, job: Job) -> None:
+        """
+        Queue a job for background execution.
+
+        Args:
+            name: Short label used in logs
+            job: Callable returning a new coroutine on every attempt
+        """
+        if not self.is_running:
+            await self.start()
+        self._stats["submitted"] += 1
+        self._queue.put_nowait((name, job))
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            name, job = await self._queue.get()
+            try:
+                await self._run(name, job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, name: str, job: Job) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await job()
+                self._stats["completed"] += 1
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < self.max_retries:
+                    self._stats["retried"] += 1
+                    logger.warning(
+                        f"Background task '{name}' failed (attempt {attempt + 1}), retrying: {str(e)}")
+                    await asyncio.sleep(self.retry_delay * (2 ** attempt))
+                else:
+                    self._stats["failed"] += 1
+                    logger.error(
+                        f"Background task '{name}' failed after {attempt + 1} attempts: {str(e)}")
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Wait for queued jobs to finish, then stop the workers."""
+        if not self.is_running:
+            return
+        pending = self._queue.qsize()
+        logger.info(f"Draining background task queue ({pending} queued)...")
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Background task queue drain timed out with {self._queue.qsize()} jobs left")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Background task queue stopped")
+
+    def get_stats(self) -> dict:
+        """Get queue depth and job counters."""
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+
+# Singleton instance, started and drained by the app lifespan
+background_tasks = BackgroundTaskQueue(
+    concurrency=settings.background_task_concurrency,
+    max_retries=settings.background_task_retries,
+    retry_delay=settings.background_task_retry_delay,
+)
@@ -0,0 +1,257 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from array import array
+from collections import Counter
+import asyncio
+import logging
+import math
+import os
+import re
+
+import numpy as np
+
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Plain alphanumeric words, plus compound codes such as "ted(21)3013" or "module-2"
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_COMPOUND_RE = re.compile(r"\w+(?:[()&./+-]+\w+)+\)?")
+
+# Stored next to the Chroma data it indexes
+BM25_INDEX_FILENAME = "bm25_index.npz"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Chunks read from ChromaDB per page while building
+BUILD_PAGE_SIZE = 2000
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens plus whole compound codes, for exact-term matching."""
+    text = text.lower()
+    tokens = _WORD_RE.findall(text)
+    tokens.extend(_COMPOUND_RE.findall(text))
+    return tokens
+
+
+class BM25Index:
+    """
+    Compact BM25 inverted index over the ChromaDB chunks.
+
+    Postings are stored CSR-style: for term t, `doc_indices[offsets[t]:offsets[t+1]]`
+    lists the chunks containing it and `weights[...]` holds the precomputed
+    BM25 contribution (idf and length normalization included), so a query is
+    just a few vectorized scatter-adds.
+    """
+
+    def __init__(
+        self,
+        doc_ids: np.ndarray,
+        terms: np.ndarray,
+        offsets: np.ndarray,
+        doc_indices: np.ndarray,
+        weights: np.ndarray
+    ):
+        self.doc_ids = doc_ids
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_indices = doc_indices
+        self.weights = weights
+        self._term_index: Dict[str, int] = {
+            term: i for i, term in enumerate(terms.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def mask(self, doc_ids: Iterable[str]) -> np.ndarray:
+        """Boolean mask over the indexed chunks, set for those in `doc_ids`."""
+        return np.isin(self.doc_ids, np.array(list(doc_ids), dtype=np.str_))
+
+    def search(
+        self,
+        query: str,
+        n: int,
+        mask: Optional[np.ndarray] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Return up to `n` (chunk ID, score) pairs, best first.
+
+        Args:
+            mask: Only rank chunks set in this mask (see `mask`)
+        """
+        term_ids = {
+            self._term_index[t] for t in tokenize(query) if t in self._term_index}
+        if not term_ids or n <= 0:
+            return []
+
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # A chunk appears at most once per term, so plain fancy-index add is safe
+            scores[self.doc_indices[start:end]] += self.weights[start:end]
+        if mask is not None:
+            scores[~mask] = 0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > n:
+            top = np.argpartition(scores[candidates], -n)[-n:]
+            candidates = candidates[top]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(str(self.doc_ids[i]), float(scores[i])) for i in ranked]
+
+    def save(self, path: str) -> None:
+        """Write the index atomically as a compressed .npz file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            doc_ids=self.doc_ids,
+            terms=self.terms,
+            offsets=self.offsets,
+            doc_indices=self.doc_indices,
+            weights=self.weights,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["doc_ids"], data["terms"], data["offsets"],
+                data["doc_indices"], data["weights"]
+            )
+
+    @classmethod
+    def build_from_collection(cls, collection) -> "BM25Index":
+        """Build the index from every chunk stored in a ChromaDB collection."""
+        doc_ids: List[str] = []
+        doc_lengths = array("I")
+        vocabulary: Dict[str, int] = {}
+        posting_terms = array("I")
+        posting_docs = array("I")
+        posting_tfs = array("H")
+
+        offset = 0
+        while True:
+            page = collection.get(
+                limit=BUILD_PAGE_SIZE, offset=offset, include=["documents"])
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            for chunk_id, text in zip(ids, page.get("documents") or []):
+                doc_index = len(doc_ids)
+                doc_ids.append(chunk_id)
+                tokens = tokenize(text or "")
+                doc_lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    posting_terms.append(vocabulary.setdefault(term, len(vocabulary)))
+                    posting_docs.append(doc_index)
+                    posting_tfs.append(min(tf, 65535))
+            offset += len(ids)
+
+        num_docs = len(doc_ids)
+        terms = np.array(sorted(vocabulary, key=vocabulary.get), dtype=np.str_)
+        term_arr = np.frombuffer(posting_terms, dtype=np.uint32)
+        docs_arr = np.frombuffer(posting_docs, dtype=np.uint32)
+        tfs_arr = np.frombuffer(posting_tfs, dtype=np.uint16).astype(np.float32)
+        lengths = np.frombuffer(doc_lengths, dtype=np.uint32).astype(np.float32)
+
+        # Group postings by term (stable keeps chunk order within a term)
+        order = np.argsort(term_arr, kind="stable")
+        term_arr, docs_arr, tfs_arr = term_arr[order], docs_arr[order], tfs_arr[order]
+        doc_freq = np.bincount(term_arr, minlength=len(terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=offsets[1:])
+
+        avg_len = float(lengths.mean()) if num_docs else 0.0
+        idf = np.log1p((num_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs_arr] / max(avg_len, 1e-9))
+        weights = idf[term_arr] * tfs_arr * (BM25_K1 + 1) / (tfs_arr + norm)
+
+        logger.info(
+            f"Built BM25 index: {num_docs} chunks, {len(terms)} terms, {len(weights)} postings")
+        return cls(
+            np.array(doc_ids, dtype=np.str_),
+            terms,
+            offsets,
+            docs_arr.astype(np.int32),
+            weights.astype(np.float32),
+        )
+
+
+def default_index_path() -> str:
+    return os.path.join(settings.chroma_persist_dir, BM25_INDEX_FILENAME)
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[str]],
+    k: int = 60
+) -> List[Tuple[str, float]]:
+    """Fuse several ranked ID lists into one, scoring sum(1 / (k + rank))."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25IndexHolder:
+    """
+    Loads the on-disk index and reloads it after a reingest.
+
+    Loading runs in a worker thread; the loaded index is swapped in as a
+    whole, so searches keep using the previous index (or none, before the
+    first load) until the new one is ready.
+    """
+
+    # Seconds between checks of the index file's mtime
+    RELOAD_CHECK_INTERVAL = 5.0
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_index_path()
+        self._index: Optional[BM25Index] = None
+        self._mtime = 0.0
+        self._last_check = -math.inf
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _load_if_changed(self) -> Optional[Tuple[BM25Index, float]]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        if mtime == self._mtime:
+            return None
+        try:
+            index = BM25Index.load(self.path)
+        except Exception as e:
+            logger.error(f"Failed to load BM25 index: {str(e)}")
+            return None
+        logger.info(f"Loaded BM25 index with {len(index)} chunks")
+        return index, mtime
+
+    async def refresh_async(self) -> None:
+        """Load the index in a worker thread if the file changed since the last load."""
+        loaded = await asyncio.to_thread(self._load_if_changed)
+        if loaded is not None:
+            self._index, self._mtime = loaded
+
+    async def _refresh_logged(self) -> None:
+        try:
+            await self.refresh_async()
+        except Exception as e:
+            logger.error(f"BM25 index refresh failed: {str(e)}")
+        finally:
+            self._refresh_task = None
+
+    def get(self, now: float) -> Optional[BM25Index]:
+        """
+        Return the current index, or None if none has been loaded yet.
+
+        Never blocks: every RELOAD_CHECK_INTERVAL seconds a refresh is
+        started in the background on the running event loop.
+        """
+        if now - self._last_check >= self.RELOAD_CHECK_INTERVAL and self._refresh_task is None:
+            self._last_check = now
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_logged())
+        return self._index
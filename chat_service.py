@@ -1,8 +1,10 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 import re
 import logging
 import asyncio
 import html
+import time
+from datetime import datetime
 from functools import lru_cache
 from io import BytesIO
 from uuid import uuid4
@@ -16,8 +18,14 @@ from reportlab.lib.enums import TA_CENTER
 import google.generativeai as genai
 
 from config import settings
-from vector_store import vector_store
-from firestore_db import firestore_db
+from vector_store import vector_store, document_id
+from answer_cache import answer_cache
+from context_packer import pack_context, pack_history, truncate_to_tokens
+from facets import facet_filter
+from reranker import reranker
+from firestore_db import firestore_db, TurnWriteBatch
+from background_tasks import background_tasks
+from admission import llm_admission, AdmissionRejected
 from models import ChatMessage, ChatMessageWithSources
 
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +34,62 @@ logger = logging.getLogger(__name__)
 # Configure Gemini
 genai.configure(api_key=settings.google_api_key)
 
+# The student's question is truncated to this many characters after sanitizing
+MAX_PROMPT_FIELD_CHARS = 10000
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+# Control characters other than tab and newline
+_CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b-\x1f]")
+
+
+def _retry_delay_seconds(err_text: str) -> Optional[int]:
+    """Extract the wait Gemini suggests in a quota error, if any."""
+    # Pattern 1: "Please retry in 43.40s"
+    m = re.search(r"Please retry in\s*([0-9]+)(?:\.[0-9]+)?s", err_text)
+    if m:
+        return int(m.group(1))
+    # Pattern 2: retry_delay {\n  seconds: 43\n}
+    m = re.search(r"retry_delay\s*\{[^}]*seconds:\s*(\d+)", err_text)
+    if m:
+        return int(m.group(1))
+    return None
+
+
+def _is_quota_error(err_text: str) -> bool:
+    return "429" in err_text or "quota" in err_text.lower()
+
+
+def _escape_for_prompt(text: str) -> str:
+    """Escape HTML entities and drop control characters."""
+    return _CONTROL_CHARS_RE.sub("", html.escape(text))
+
+
+@lru_cache(maxsize=settings.context_block_cache_size)
+def _context_block(source_name: str, doc_text: str) -> str:
+    """
+    Sanitized, formatted context block for one retrieved chunk.
+
+    Memoized because the same chunks are retrieved over and over; escaping
+    is per character, so joining cached blocks equals sanitizing the join.
+    """
+    return _escape_for_prompt(f"📖 **From {source_name}:**\n{doc_text}")
+
+
+# Conversations a bulk delete job deletes between progress writes
+DELETE_JOB_PROGRESS_EVERY = 10
+# Unfinished bulk delete jobs not heard from for this long are resumed when polled
+DELETE_JOB_STALE_SECONDS = 300
+# Oldest unsummarized messages folded into a conversation summary per refresh
+MAX_SUMMARY_FOLD_MESSAGES = 20
+# Tokens of each message shown to the summarizer
+SUMMARY_MESSAGE_TOKENS = 300
+
+# Reply used when the question falls outside the indexed course material
+OUT_OF_TOPIC_MESSAGE = (
+    "I appreciate the question, but this topic is not covered in the available course materials. "
+    "I can only help with questions related to the course content. "
+    "Feel free to ask about topics covered in the course materials!"
+)
+
 
 class ChatService:
     """RAG-based chat service with teaching-focused responses and Firestore storage."""
@@ -39,16 +103,71 @@ class ChatService:
         }
         # Title generation cache: (query_hash, response_hash) -> title
         self._title_cache: Dict[str, str] = {}
+        # Bulk delete jobs running (or queued) in this worker
+        self._running_delete_jobs: set = set()
+        # (user_id, conversation_id) pairs with a summary refresh queued
+        self._summarizing: set = set()
+
+    async def _generate_async(
+        self,
+        prompt: str,
+        timeout: float,
+        generation_config: Optional[Dict[str, Any]] = None,
+        stream: bool = False
+    ):
+        """
+        Run a Gemini generation without blocking the event loop.
+
+        Uses the SDK's native async API and bounds the call with a timeout.
+        Cancelling the awaiting task (e.g. when the client disconnects)
+        cancels the underlying request as well. With `stream=True` the
+        timeout covers the time to the first chunk; iterate the stream with
+        `_iter_stream` to bound the wait for each later chunk.
+
+        Callers hold an `llm_admission` slot around the call. Quota errors
+        put every later call on hold for the delay Gemini asks for.
+
+        Raises:
+            asyncio.TimeoutError: If the model does not answer within `timeout`
+        """
+        try:
+            return await asyncio.wait_for(
+                self.model.generate_content_async(
+                    prompt,
+                    generation_config=generation_config,
+                    stream=stream
+                ),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            err_text = str(e)
+            if _is_quota_error(err_text):
+                llm_admission.report_rate_limited(_retry_delay_seconds(err_text))
+            raise
+
+    async def _iter_stream(self, response, chunk_timeout: float) -> AsyncIterator[Any]:
+        """
+        Iterate a streamed Gemini response, bounding the wait for each chunk.
+
+        Raises:
+            asyncio.TimeoutError: If the stream stalls for `chunk_timeout`
+        """
+        chunks = response.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=chunk_timeout)
+            except StopAsyncIteration:
+                return
+            yield chunk
 
     def _sanitize_for_prompt(self, text: str) -> str:
         """Sanitize user input to prevent prompt injection."""
-        # Escape HTML entities
-        text = html.escape(text)
-        # Remove control characters
-        text = ''.join(char for char in text if ord(
-            char) >= 32 or char in '\n\t')
+        # Escape HTML entities and remove control characters
+        text = _escape_for_prompt(text)
         # Limit length to prevent excessive processing
-        text = text[:10000]
+        text = text[:MAX_PROMPT_FIELD_CHARS]
         return text.strip()
 
     def _create_teaching_prompt(
@@ -56,13 +175,18 @@ class ChatService:
         query: str,
         context: str,
         conversation_history: List[ChatMessage] = None,
-        prompt_type: str = "explanation"
+        prompt_type: str = "explanation",
+        conversation_summary: str = ""
     ) -> str:
-        """Create a teaching-focused prompt for the LLM."""
+        """
+        Create a teaching-focused prompt for the LLM.
+
+        `context` must already be sanitized (see `_build_prompt_context`).
+        `conversation_summary` covers the turns older than the history.
+        """
 
         # Sanitize user input to prevent prompt injection
         query = self._sanitize_for_prompt(query)
-        context = self._sanitize_for_prompt(context)
 
         prompt_styles = {
             "explanation": "Give a clear, steadily paced explanation that builds intuition.",
@@ -77,10 +201,19 @@ class ChatService:
             prompt_type, prompt_styles["explanation"])
 
         history_text = ""
+        if conversation_summary:
+            summary = truncate_to_tokens(
+                self._sanitize_for_prompt(conversation_summary), settings.summary_token_budget)
+            history_text += f"\n\nSummary of the earlier conversation:\n{summary}\n"
         if conversation_history and len(conversation_history) > 0:
-            history_text = "\n\nPrevious conversation:\n"
-            for msg in conversation_history[-4:]:  # Last 2 exchanges
-                history_text += f"{msg.role.upper()}: {msg.content[:200]}...\n"
+            history_text += "\n\nPrevious conversation:\n"
+            # Latest messages, newest first within the history token budget
+            for role, content in pack_history(
+                [(msg.role, msg.content) for msg in conversation_history],
+                settings.history_token_budget,
+                max_messages=len(conversation_history)
+            ):
+                history_text += f"{role.upper()}: {content}\n"
 
         prompt = f"""You are a thoughtful, clear-thinking tutor who enjoys explaining ideas in a way that actually sticks.
 Your goal is not to impress, but to help the student genuinely understand.
@@ -238,7 +371,7 @@ Aim for clarity, honesty, and flow over perfection."""
             
         return True
 
-    def _generate_chat_title(self, query: str, response: str) -> str:
+    async def _generate_chat_title(self, query: str, response: str) -> str:
         """Generate a concise, descriptive title for a conversation based on the query and response."""
         try:
             # For very short queries or responses, just use the query
@@ -269,15 +402,19 @@ Requirements:
 Return ONLY the title, nothing else."""
 
             try:
-                # Add timeout to prevent LLM hangs (5 seconds)
-                result = asyncio.run(asyncio.wait_for(
-                    asyncio.to_thread(self.model.generate_content, prompt),
-                    timeout=5.0
-                ))
+                # Add timeout to prevent LLM hangs
+                async with llm_admission.admit(queue=False):
+                    result = await self._generate_async(
+                        prompt, timeout=settings.llm_title_timeout_seconds
+                    )
             except asyncio.TimeoutError:
                 logger.warning("Title generation timeout - using fallback")
                 title = query[:50] + "..." if len(query) > 50 else query
                 return title.strip()
+            except AdmissionRejected:
+                logger.info("LLM busy - using fallback title")
+                title = query[:50] + "..." if len(query) > 50 else query
+                return title.strip()
 
             if result and hasattr(result, 'text') and result.text:
                 title = result.text.strip()
@@ -301,7 +438,7 @@ Return ONLY the title, nothing else."""
             title = query[:50] + "..." if len(query) > 50 else query
             return title.strip()
 
-    def _generate_follow_up_questions(self, query: str, response: str) -> List[str]:
+    async def _generate_follow_up_questions(self, query: str, response: str) -> List[str]:
         """Generate relevant follow-up questions only when contextually appropriate."""
         try:
             # Check if follow-ups are needed
@@ -324,7 +461,17 @@ Generate exactly 2 follow-up questions that:
 
 Format: One question per line, no numbering, no extra text. Each line ends with '?'"""
 
-            result = self.model.generate_content(prompt)
+            try:
+                async with llm_admission.admit(queue=False):
+                    result = await self._generate_async(
+                        prompt, timeout=settings.llm_follow_up_timeout_seconds
+                    )
+            except asyncio.TimeoutError:
+                logger.warning("Follow-up generation timeout - skipping")
+                return []
+            except AdmissionRejected:
+                logger.info("LLM busy - skipping follow-up questions")
+                return []
 
             # Safely check for response text
             if not result or not hasattr(result, 'text') or not result.text:
@@ -353,12 +500,22 @@ Format: One question per line, no numbering, no extra text. Each line ends with
         self,
         user_id: str,
         conversation_id: str,
-        limit: int = 10
+        limit: int = 10,
+        version: Optional[int] = None,
+        tail: bool = False
     ) -> List[ChatMessageWithSources]:
-        """Retrieve conversation history from Firestore with sources."""
+        """
+        Retrieve conversation history from Firestore with sources.
+
+        Args:
+            limit: Maximum number of messages
+            version: `message_count` verified by `begin_turn`, which lets
+                this worker's conversation cache serve the read
+            tail: Get the latest `limit` messages rather than the first
+        """
         try:
             messages = await firestore_db.get_conversation_messages(
-                user_id, conversation_id, limit
+                user_id, conversation_id, limit, version=version, tail=tail
             )
 
             result = []
@@ -423,6 +580,392 @@ Format: One question per line, no numbering, no extra text. Each line ends with
             logger.error(f"Error creating/updating conversation: {str(e)}")
             raise
 
+    def _friendly_generation_error(self, error: Exception) -> Optional[str]:
+        """
+        Map a Gemini generation error to a user-facing message.
+
+        Returns:
+            A friendly message for known failures (quota, missing model),
+            or None if the error should be re-raised.
+        """
+        if isinstance(error, AdmissionRejected):
+            wait_seconds = max(1, round(error.retry_after))
+            if error.reason == "user_rate":
+                return f"⏳ You're sending messages faster than the tutor can answer. Please wait ~{wait_seconds}s and try again."
+            return f"⏳ The tutor is handling a lot of questions right now. Please wait ~{wait_seconds}s and try again."
+
+        err_text = str(error)
+        # Try to extract suggested wait time from the error
+        wait_seconds = _retry_delay_seconds(err_text)
+
+        if _is_quota_error(err_text):
+            wait_hint = f" Please wait ~{wait_seconds}s and try again." if wait_seconds else " Please wait a bit and try again."
+            return (
+                "⏳ You're temporarily rate-limited by the Gemini free tier." +
+                wait_hint +
+                " If this happens often, consider switching models or enabling billing for higher limits."
+            )
+        # For other model errors (e.g., 404 if model unavailable), surface a friendly message
+        if "404" in err_text:
+            return "The selected model is unavailable right now. Please try again shortly."
+        return None
+
+    def _context_sources(self, relevant_docs: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+        """(source name, text) pairs for the non-empty retrieved documents."""
+        parts = []
+        for doc in relevant_docs:
+            # Safely extract metadata with defaults
+            metadata = doc.get('metadata', {})
+            source_name = metadata.get(
+                'source', 'Unknown Source').replace('.pdf', '')
+            doc_text = doc.get('text', '')
+
+            if doc_text.strip():  # Only add non-empty documents
+                parts.append((source_name, doc_text))
+        return parts
+
+    def _build_context(self, relevant_docs: List[Dict[str, Any]]) -> str:
+        """Build the raw context from retrieved documents."""
+        # Build context - can be empty if no relevant docs found
+        return CONTEXT_SEPARATOR.join(
+            f"📖 **From {source_name}:**\n{doc_text}"
+            for source_name, doc_text in self._context_sources(relevant_docs)
+        )
+
+    def _build_prompt_context(self, relevant_docs: List[Dict[str, Any]]) -> str:
+        """
+        Build the sanitized prompt context within the context token budget.
+
+        Near-duplicate chunks are dropped and adjacent chunks merged before
+        passages are packed by relevance (see `context_packer.pack_context`).
+        """
+        passages = pack_context(
+            relevant_docs, settings.context_token_budget, settings.chunk_overlap)
+        context = CONTEXT_SEPARATOR.join(
+            _context_block(passage["source"].replace('.pdf', ''), passage["text"])
+            for passage in passages
+        )
+        return context.strip()
+
+    def _build_sources(self, relevant_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Build the deduplicated source list for retrieved documents."""
+        sources = []
+        for doc in relevant_docs:  # Process all docs to find unique sources
+            metadata = doc.get('metadata', {})
+            # Only add source if we have the required fields
+            if metadata.get('source'):
+                sources.append({
+                    "source": metadata['source'],
+                    "chunk_id": metadata.get('chunk_id', -1),
+                    "relevance_score": round(1 - doc.get('distance', 0), 2) if doc.get('distance') is not None else 0.95
+                })
+
+        # Deduplicate sources and keep top 3 unique ones
+        return self._deduplicate_sources(sources)[:3]
+
+    async def _prepare_turn(
+        self,
+        user_id: str,
+        query: str,
+        conversation_id: Optional[str],
+        include_history: bool,
+        prompt_type: str,
+        is_temporary: bool,
+        scope: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run everything that precedes generation for a chat turn.
+
+        Resolves the conversation, loads history, buffers the user message,
+        retrieves documents and builds the teaching prompt. Firestore writes
+        are collected in `turn["writes"]` and committed once per turn (see
+        `_commit_turn`); temporary conversations have no writes.
+        """
+        writes = None
+        if is_temporary:
+            is_new_conversation = conversation_id is None
+            conversation_id = conversation_id or str(uuid4())
+        else:
+            writes = await firestore_db.begin_turn(
+                user_id, conversation_id, prompt_type, is_temporary)
+            # Track if this is a new conversation to generate title later
+            is_new_conversation = not writes.exists
+            conversation_id = writes.conversation_id
+
+        # Get the latest messages if requested and persisted; older turns
+        # reach the prompt through the rolling summary
+        history = []
+        summary = ""
+        if include_history and not is_temporary and not is_new_conversation:
+            summary = writes.summary
+            history = await self.get_conversation_history(
+                user_id, conversation_id, self._history_limit(writes),
+                version=writes.version, tail=True
+            )
+
+        # Buffer the user message when persistence is enabled
+        if writes is not None:
+            writes.add_message("user", query)
+
+        # Retrieve relevant documents asynchronously (the query embedding
+        # is cached, so the search below reuses it)
+        query_embedding = await vector_store.embed_query_async(query)
+        relevant_docs = await self._retrieve(query, settings.top_k_results, scope)
+
+        context = self._build_context(relevant_docs)
+
+        # Create teaching prompt
+        prompt = self._create_teaching_prompt(
+            query, self._build_prompt_context(relevant_docs), history, prompt_type,
+            conversation_summary=summary
+        )
+
+        return {
+            "conversation_id": conversation_id,
+            "is_new_conversation": is_new_conversation,
+            "writes": writes,
+            "committed": False,
+            "relevant_docs": relevant_docs,
+            "context": context,
+            "prompt": prompt,
+            "query_embedding": query_embedding,
+            "chunk_ids": [
+                document_id(doc["metadata"]) for doc in relevant_docs
+                if doc.get("metadata", {}).get("source")
+            ],
+            # Answers that depend on earlier turns can't be shared
+            "cacheable": settings.answer_cache_enabled and not history and not summary,
+        }
+
+    async def _retrieve(
+        self,
+        query: str,
+        k: int,
+        scope: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for the top `k` chunks, optionally within a facet scope.
+
+        Reranks an over-fetched pool and stitches neighbouring chunks onto
+        each hit when those stages are enabled.
+        """
+        if settings.rerank_enabled:
+            candidates = await vector_store.search_async(
+                query, k=reranker.candidate_count(k), filter_metadata=scope)
+            docs = await reranker.rerank_async(query, candidates, k)
+        else:
+            docs = await vector_store.search_async(query, k=k, filter_metadata=scope)
+
+        if settings.neighbor_chunks > 0:
+            docs = await vector_store.expand_with_neighbors_async(
+                docs, settings.neighbor_chunks)
+        return docs
+
+    def _lookup_cached_answer(
+        self,
+        turn: Dict[str, Any],
+        prompt_type: str
+    ) -> Optional[Dict[str, Any]]:
+        """Find a cached answer for a similar question over the same chunks."""
+        if not turn["cacheable"]:
+            return None
+        return answer_cache.lookup(
+            turn["query_embedding"], prompt_type, turn["chunk_ids"])
+
+    def _store_cached_answer(
+        self,
+        turn: Dict[str, Any],
+        prompt_type: str,
+        message: str,
+        sources: List[Dict[str, Any]],
+        follow_up_questions: List[str]
+    ) -> None:
+        """Remember a freshly generated answer for similar future questions."""
+        if not turn["cacheable"]:
+            return
+        answer_cache.store(
+            turn["query_embedding"], prompt_type, turn["chunk_ids"],
+            {
+                "message": message,
+                "sources": sources,
+                "follow_up_questions": follow_up_questions,
+            }
+        )
+
+    async def _title_conversation(
+        self,
+        writes: TurnWriteBatch,
+        query: str,
+        title_source: str
+    ) -> None:
+        """
+        Generate a new conversation's title and store it.
+
+        Runs after the turn itself is committed, so the conversation exists
+        (and can be continued) while the title is still being generated.
+
+        Raises:
+            Exception: If the write fails, so the background queue can
+                retry (the title stays buffered and generation is cached)
+        """
+        if writes.has_title:
+            # A retry after a failed title write; the title is still buffered
+            await writes.commit()
+            return
+        if writes.pending:
+            # The turn's own commit failed; write it before the title
+            await writes.commit()
+        title = await self._generate_chat_title(query, title_source)
+        logger.info(f"Generated conversation title: {title}")
+        writes.set_title(title)
+        await writes.commit()
+
+    def _history_limit(self, writes: TurnWriteBatch) -> int:
+        """Messages to quote: every one the summary doesn't cover yet (bounded)."""
+        if not settings.conversation_summary_enabled:
+            return settings.history_messages
+        unsummarized = writes.version - writes.summary_message_count
+        # A refresh is queued once `conversation_summary_every` messages pile
+        # up past the window; allow for one more turn while it runs
+        most = settings.history_messages + settings.conversation_summary_every + 2
+        return max(settings.history_messages, min(unsummarized, most))
+
+    def _summary_due(self, writes: TurnWriteBatch) -> bool:
+        unsummarized = writes.version - settings.history_messages - writes.summary_message_count
+        return settings.conversation_summary_enabled and unsummarized >= settings.conversation_summary_every
+
+    async def _queue_summary_refresh(self, writes: TurnWriteBatch) -> None:
+        """Queue folding messages that left the history window into the summary."""
+        key = (writes.user_id, writes.conversation_id)
+        if key in self._summarizing:
+            return
+        self._summarizing.add(key)
+        version, summary, covered = writes.version, writes.summary, writes.summary_message_count
+        await background_tasks.submit(
+            f"summarize:{writes.conversation_id}",
+            lambda: self._refresh_summary(key, version, summary, covered)
+        )
+
+    async def _refresh_summary(
+        self,
+        key: Tuple[str, str],
+        version: int,
+        summary: str,
+        covered: int
+    ) -> None:
+        """
+        Update a conversation's rolling summary.
+
+        Folds the oldest unsummarized messages, all but the latest
+        `history_messages`, at most MAX_SUMMARY_FOLD_MESSAGES per refresh;
+        long legacy conversations catch up over the following turns.
+
+        Args:
+            key: (user_id, conversation_id)
+            version: The conversation's message count after the last commit
+            summary: The current summary
+            covered: Messages the current summary covers
+        """
+        user_id, conversation_id = key
+        try:
+            fold = min(version - settings.history_messages - covered, MAX_SUMMARY_FOLD_MESSAGES)
+            if fold <= 0:
+                return
+            messages = await firestore_db.get_conversation_messages(
+                user_id, conversation_id, fold, version=version, offset=covered)
+            if not messages:
+                return
+
+            new_summary = await self._generate_conversation_summary(summary, messages)
+            if new_summary:
+                await firestore_db.update_conversation_summary(
+                    user_id, conversation_id, new_summary, covered + len(messages))
+        finally:
+            self._summarizing.discard(key)
+
+    async def _generate_conversation_summary(
+        self,
+        summary: str,
+        messages: List[Dict[str, Any]]
+    ) -> Optional[str]:
+        """Fold messages into a running summary (None if generation fails)."""
+        transcript = "\n".join(
+            f"{msg['role'].upper()}: "
+            f"{self._sanitize_for_prompt(truncate_to_tokens(msg['content'], SUMMARY_MESSAGE_TOKENS))}"
+            for msg in messages
+        )
+        prompt = f"""Update the running summary of a tutoring conversation.
+
+Current summary:
+{self._sanitize_for_prompt(summary) or "(none yet)"}
+
+New messages:
+{transcript}
+
+Requirements:
+- At most 120 words
+- Cover the topics discussed, what the student asked, and what they struggled with
+- Keep details a tutor would need to continue the conversation
+
+Return ONLY the summary, nothing else."""
+
+        try:
+            async with llm_admission.admit(queue=False):
+                result = await self._generate_async(
+                    prompt, timeout=settings.llm_summary_timeout_seconds
+                )
+            if result and hasattr(result, 'text') and result.text:
+                return truncate_to_tokens(result.text.strip(), settings.summary_token_budget)
+        except asyncio.TimeoutError:
+            logger.warning("Conversation summary timeout - keeping previous summary")
+        except AdmissionRejected:
+            logger.info("LLM busy - keeping previous summary")
+        except Exception as e:
+            logger.error(f"Error generating conversation summary: {str(e)}")
+        return None
+
+    async def _commit_turn(
+        self,
+        turn: Dict[str, Any],
+        query: str,
+        assistant_message: Optional[str] = None,
+        sources: Optional[List[Dict]] = None,
+        title_source: Optional[str] = None
+    ) -> None:
+        """
+        Buffer the assistant message (if any) and commit the turn.
+
+        The turn is written in one batch before the response is returned, so
+        an immediate follow-up finds the conversation and its latest messages
+        on any worker. For new conversations, a title is then generated from
+        `title_source` and written in the background.
+
+        Called once per turn; later calls are no-ops, so error paths can
+        call it unconditionally to persist at least the user message. If the
+        commit fails it is retried in the background.
+        """
+        writes = turn["writes"]
+        if writes is None or turn["committed"]:
+            return
+        turn["committed"] = True
+        if assistant_message is not None:
+            writes.add_message("assistant", assistant_message, sources)
+
+        try:
+            await writes.commit()
+        except Exception as e:
+            logger.error(f"Error committing turn, retrying in background: {str(e)}")
+            await background_tasks.submit(
+                f"commit_turn:{writes.conversation_id}", writes.commit)
+
+        if title_source is not None and turn["is_new_conversation"]:
+            await background_tasks.submit(
+                f"title:{writes.conversation_id}",
+                lambda: self._title_conversation(writes, query, title_source)
+            )
+        if self._summary_due(writes):
+            await self._queue_summary_refresh(writes)
+
     async def chat(
         self,
         user_id: str,
@@ -430,7 +973,9 @@ Format: One question per line, no numbering, no extra text. Each line ends with
         conversation_id: Optional[str] = None,
         include_history: bool = True,
         prompt_type: str = "explanation",
-        is_temporary: bool = False
+        is_temporary: bool = False,
+        subject: Optional[str] = None,
+        module: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Process a chat query using RAG with Firestore storage.
@@ -440,115 +985,68 @@ Format: One question per line, no numbering, no extra text. Each line ends with
             query: User's question
             conversation_id: Optional conversation ID for follow-ups
             include_history: Whether to include conversation history
+            subject: Optional subject facet to restrict retrieval to
+            module: Optional module number facet to restrict retrieval to
 
         Returns:
             Dict containing response, sources, and conversation_id
         """
+        turn = None
         try:
-            # Track if this is a new conversation to generate title later
-            is_new_conversation = conversation_id is None
-
-            # Create or get conversation (or a transient one)
-            conversation_id = await self.create_or_update_conversation(
-                user_id=user_id,
-                conversation_id=conversation_id,
-                query=query,
-                prompt_type=prompt_type,
-                is_temporary=is_temporary
+            turn = await self._prepare_turn(
+                user_id, query, conversation_id, include_history,
+                prompt_type, is_temporary, facet_filter(subject, module)
             )
-
-            # Get conversation history if requested and persisted
-            history = []
-            if include_history and conversation_id and not is_temporary:
-                history = await self.get_conversation_history(
-                    user_id, conversation_id
+            conversation_id = turn["conversation_id"]
+            context = turn["context"]
+
+            cached_answer = self._lookup_cached_answer(turn, prompt_type)
+            if cached_answer is not None:
+                logger.info(f"Serving cached answer for query: {query[:50]}...")
+                await self._commit_turn(
+                    turn, query, cached_answer["message"], cached_answer["sources"],
+                    title_source=cached_answer["message"]
                 )
-
-            # Save user message when persistence is enabled
-            if not is_temporary:
-                await self.save_message(user_id, conversation_id, "user", query)
-
-            # Retrieve relevant documents asynchronously
-            relevant_docs = await vector_store.similarity_search_async(
-                query, k=settings.top_k_results)
-
-            # Build context from retrieved documents with better formatting
-            context_parts = []
-            for doc in relevant_docs:
-                # Safely extract metadata with defaults
-                metadata = doc.get('metadata', {})
-                source_name = metadata.get(
-                    'source', 'Unknown Source').replace('.pdf', '')
-                doc_text = doc.get('text', '')
-
-                if doc_text.strip():  # Only add non-empty documents
-                    context_parts.append(
-                        f"📖 **From {source_name}:**\n{doc_text}"
-                    )
-
-            # Build context - can be empty if no relevant docs found
-            context = "\n\n---\n\n".join(context_parts)
-
-            # Check if this is an out-of-topic question early
-            is_likely_out_of_topic = len(
-                context_parts) == 0 or context.strip() == ""
-
-            # Create teaching prompt
-            prompt = self._create_teaching_prompt(
-                query, context, history, prompt_type
-            )
+                return {
+                    **cached_answer,
+                    "conversation_id": conversation_id,
+                    "prompt_type": prompt_type,
+                    "is_temporary": is_temporary
+                }
 
             # Generate response
             logger.info(f"Generating response for query: {query[:50]}...")
             try:
-                response = self.model.generate_content(
-                    prompt,
-                    generation_config=self.generation_config
-                )
-            except Exception as e:
-                err_text = str(e)
-                # Try to extract suggested wait time from the error
-                wait_seconds = None
-                # Pattern 1: "Please retry in 43.40s"
-                m = re.search(
-                    r"Please retry in\s*([0-9]+)(?:\.[0-9]+)?s", err_text)
-                if m:
-                    wait_seconds = int(m.group(1))
-                # Pattern 2: retry_delay {\n  seconds: 43\n}
-                if wait_seconds is None:
-                    m2 = re.search(
-                        r"retry_delay\s*\{[^}]*seconds:\s*(\d+)", err_text)
-                    if m2:
-                        wait_seconds = int(m2.group(1))
-
-                if "429" in err_text or "quota" in err_text.lower():
-                    wait_hint = f" Please wait ~{wait_seconds}s and try again." if wait_seconds else " Please wait a bit and try again."
-                    friendly_message = (
-                        "⏳ You're temporarily rate-limited by the Gemini free tier." +
-                        wait_hint +
-                        " If this happens often, consider switching models or enabling billing for higher limits."
+                async with llm_admission.admit(user_id):
+                    response = await self._generate_async(
+                        turn["prompt"],
+                        timeout=settings.llm_timeout_seconds,
+                        generation_config=self.generation_config
                     )
-
-                    return {
-                        "message": friendly_message,
-                        "conversation_id": conversation_id,
-                        "sources": [],
-                        "follow_up_questions": [],
-                        "prompt_type": prompt_type,
-                        "is_temporary": is_temporary
-                    }
-                # For other model errors (e.g., 404 if model unavailable), surface a friendly message
-                if "404" in err_text:
-                    return {
-                        "message": "The selected model is unavailable right now. Please try again shortly.",
-                        "conversation_id": conversation_id,
-                        "sources": [],
-                        "follow_up_questions": [],
-                        "prompt_type": prompt_type,
-                        "is_temporary": is_temporary
-                    }
-                # Unknown error -> re-raise to be handled upstream
-                raise
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Response generation timed out after {settings.llm_timeout_seconds}s")
+                return {
+                    "message": "The tutor is taking too long to respond right now. Please try again shortly.",
+                    "conversation_id": conversation_id,
+                    "sources": [],
+                    "follow_up_questions": [],
+                    "prompt_type": prompt_type,
+                    "is_temporary": is_temporary
+                }
+            except Exception as e:
+                friendly_message = self._friendly_generation_error(e)
+                if friendly_message is None:
+                    # Unknown error -> re-raise to be handled upstream
+                    raise
+                return {
+                    "message": friendly_message,
+                    "conversation_id": conversation_id,
+                    "sources": [],
+                    "follow_up_questions": [],
+                    "prompt_type": prompt_type,
+                    "is_temporary": is_temporary
+                }
 
             # Safely extract response text
             if not response or not hasattr(response, 'text') or not response.text:
@@ -560,36 +1058,18 @@ Format: One question per line, no numbering, no extra text. Each line ends with
                 raise ValueError(
                     "Response message is empty after stripping whitespace")
 
-            # Generate a better title for new conversations based on the response
-            if is_new_conversation and not is_temporary:
-                generated_title = self._generate_chat_title(
-                    query, assistant_message)
-                try:
-                    await firestore_db.update_conversation_title(
-                        user_id, conversation_id, generated_title
-                    )
-                    logger.info(
-                        f"Updated conversation title to: {generated_title}")
-                except Exception as e:
-                    logger.warning(
-                        f"Failed to update conversation title: {str(e)}")
-                    # Don't fail the whole operation if title update fails
-
             # Check if question is out-of-topic and respond accordingly
             if self._is_out_of_topic(context, query, assistant_message):
-                out_of_topic_message = (
-                    "I appreciate the question, but this topic is not covered in the available course materials. "
-                    "I can only help with questions related to the course content. "
-                    "Feel free to ask about topics covered in the course materials!"
+                # New conversations are still titled from the model's answer
+                await self._commit_turn(
+                    turn, query, OUT_OF_TOPIC_MESSAGE, [],
+                    title_source=assistant_message
                 )
-
-                if not is_temporary:
-                    await self.save_message(
-                        user_id, conversation_id, "assistant", out_of_topic_message, []
-                    )
+                self._store_cached_answer(
+                    turn, prompt_type, OUT_OF_TOPIC_MESSAGE, [], [])
 
                 return {
-                    "message": out_of_topic_message,
+                    "message": OUT_OF_TOPIC_MESSAGE,
                     "conversation_id": conversation_id,
                     "sources": [],
                     "follow_up_questions": [],
@@ -598,33 +1078,24 @@ Format: One question per line, no numbering, no extra text. Each line ends with
                 }
 
             # Prepare sources with better metadata and safer extraction
-            sources = []
-            for doc in relevant_docs:  # Process all docs to find unique sources
-                metadata = doc.get('metadata', {})
-                # Only add source if we have the required fields
-                if metadata.get('source'):
-                    sources.append({
-                        "source": metadata['source'],
-                        "chunk_id": metadata.get('chunk_id', -1),
-                        "relevance_score": round(1 - doc.get('distance', 0), 2) if doc.get('distance') is not None else 0.95
-                    })
-
-            # Deduplicate sources and keep top 3 unique ones
-            sources = self._deduplicate_sources(sources)[:3]
+            sources = self._build_sources(turn["relevant_docs"])
 
             # Only include sources if they were actually used in the response
             if not self._is_sources_used_in_response(context, assistant_message, query):
                 sources = []
 
-            # Save assistant message
-            if not is_temporary:
-                await self.save_message(
-                    user_id, conversation_id, "assistant", assistant_message, sources
-                )
+            # Commit the turn while generating follow-up questions; new
+            # conversations are titled in the background
+            _, follow_up_questions = await asyncio.gather(
+                self._commit_turn(
+                    turn, query, assistant_message, sources,
+                    title_source=assistant_message
+                ),
+                self._generate_follow_up_questions(query, assistant_message)
+            )
 
-            # Generate follow-up questions
-            follow_up_questions = self._generate_follow_up_questions(
-                query, assistant_message)
+            self._store_cached_answer(
+                turn, prompt_type, assistant_message, sources, follow_up_questions)
 
             return {
                 "message": assistant_message,
@@ -638,18 +1109,165 @@ Format: One question per line, no numbering, no extra text. Each line ends with
         except Exception as e:
             logger.error(f"Error in chat service: {str(e)}")
             raise
+        finally:
+            # Failed or interrupted turns still persist the user message
+            if turn is not None:
+                await self._commit_turn(turn, query)
+
+    async def chat_stream(
+        self,
+        user_id: str,
+        query: str,
+        conversation_id: Optional[str] = None,
+        include_history: bool = True,
+        prompt_type: str = "explanation",
+        is_temporary: bool = False,
+        subject: Optional[str] = None,
+        module: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Process a chat query and stream the answer as it is generated.
+
+        Yields (event, data) pairs in this order:
+            - "meta": conversation_id, prompt_type and is_temporary
+            - "sources": candidate sources for the answer
+            - "token": answer text deltas, as Gemini produces them
+            - "replace": full replacement text if the answer turned out
+              to be out of topic
+            - "title": generated title for new conversations
+            - "follow_ups": suggested follow-up questions
+            - "done": final sources; the turn is committed before this event
+        Generation failures are reported as a single "error" event.
+        """
+        turn = await self._prepare_turn(
+            user_id, query, conversation_id, include_history,
+            prompt_type, is_temporary, facet_filter(subject, module)
+        )
+        conversation_id = turn["conversation_id"]
+        context = turn["context"]
+
+        try:
+            yield "meta", {
+                "conversation_id": conversation_id,
+                "prompt_type": prompt_type,
+                "is_temporary": is_temporary,
+            }
+
+            cached_answer = self._lookup_cached_answer(turn, prompt_type)
+            if cached_answer is not None:
+                logger.info(f"Serving cached answer for query: {query[:50]}...")
+                yield "sources", cached_answer["sources"]
+                yield "token", cached_answer["message"]
+                await self._commit_turn(
+                    turn, query, cached_answer["message"], cached_answer["sources"],
+                    title_source=cached_answer["message"]
+                )
+                yield "follow_ups", cached_answer["follow_up_questions"]
+                yield "done", {"conversation_id": conversation_id, "sources": cached_answer["sources"]}
+                return
+
+            sources = self._build_sources(turn["relevant_docs"])
+            yield "sources", sources
+
+            logger.info(f"Streaming response for query: {query[:50]}...")
+            parts: List[str] = []
+            try:
+                # The slot is held until the stream is fully read
+                async with llm_admission.admit(user_id):
+                    response = await self._generate_async(
+                        turn["prompt"],
+                        timeout=settings.llm_timeout_seconds,
+                        generation_config=self.generation_config,
+                        stream=True
+                    )
+                    async for chunk in self._iter_stream(
+                        response, settings.llm_stream_chunk_timeout_seconds
+                    ):
+                        text = getattr(chunk, "text", "")
+                        if text:
+                            parts.append(text)
+                            yield "token", text
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Response streaming timed out waiting for the first chunk "
+                    f"({settings.llm_timeout_seconds}s) or a later one "
+                    f"({settings.llm_stream_chunk_timeout_seconds}s)")
+                yield "error", {"message": "The tutor is taking too long to respond right now. Please try again shortly."}
+                return
+            except Exception as e:
+                friendly_message = self._friendly_generation_error(e)
+                logger.error(f"Error streaming response: {str(e)}")
+                yield "error", {"message": friendly_message or "Error generating response."}
+                return
+
+            assistant_message = "".join(parts).strip()
+            if not assistant_message:
+                yield "error", {"message": "Empty response received from Gemini API"}
+                return
+
+            # Start titling new conversations from the model's own answer
+            title_task = None
+            title_source = assistant_message
+            if turn["is_new_conversation"] and turn["writes"] is not None:
+                title_task = asyncio.ensure_future(
+                    self._generate_chat_title(query, title_source))
+
+            follow_up_questions: List[str] = []
+            is_out_of_topic = self._is_out_of_topic(context, query, assistant_message)
+            if is_out_of_topic:
+                assistant_message = OUT_OF_TOPIC_MESSAGE
+                sources = []
+                yield "replace", assistant_message
+            elif not self._is_sources_used_in_response(context, assistant_message, query):
+                sources = []
+
+            await self._commit_turn(turn, query, assistant_message, sources)
+
+            # The title is stored separately once the turn is committed
+            if title_task is not None:
+                try:
+                    title = await title_task
+                except Exception as e:
+                    logger.warning(f"Failed to generate conversation title: {str(e)}")
+                else:
+                    yield "title", title
+                    writes = turn["writes"]
+                    await background_tasks.submit(
+                        f"title:{writes.conversation_id}",
+                        lambda: self._title_conversation(writes, query, title_source)
+                    )
+
+            if not is_out_of_topic:
+                follow_up_questions = await self._generate_follow_up_questions(
+                    query, assistant_message)
+
+            yield "follow_ups", follow_up_questions
+            self._store_cached_answer(
+                turn, prompt_type, assistant_message, sources, follow_up_questions)
+            yield "done", {"conversation_id": conversation_id, "sources": sources}
+        finally:
+            # Failed or abandoned streams still persist the user message
+            await self._commit_turn(turn, query)
 
     async def get_user_conversations(
         self,
         user_id: str,
-        limit: int = 20
-    ) -> List[Dict[str, Any]]:
-        """Get all conversations for a user from Firestore."""
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get one page of a user's conversations from Firestore.
+
+        Raises:
+            ValueError: If the cursor is invalid
+        """
         try:
-            return await firestore_db.get_user_conversations(user_id, limit)
+            return await firestore_db.get_user_conversations(user_id, limit, cursor)
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error getting user conversations: {str(e)}")
-            return []
+            return {"conversations": [], "next_cursor": None}
 
     async def delete_conversation(
         self,
@@ -663,42 +1281,124 @@ Format: One question per line, no numbering, no extra text. Each line ends with
             logger.error(f"Error deleting conversation: {str(e)}")
             return False
 
-    async def search_conversations(
+    async def start_bulk_delete(
         self,
         user_id: str,
-        search_query: str
-    ) -> List[Dict[str, Any]]:
-        """Search conversations by title with optimized queries to fix N+1 problem."""
+        conversation_ids: Optional[List[str]] = None,
+        temporary_only: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Queue deletion of several conversations as a background job.
+
+        Args:
+            user_id: Owner of the conversations
+            conversation_ids: Conversations to delete
+            temporary_only: Delete all of the user's temporary conversations instead
+
+        Returns:
+            The job's initial progress (see `get_bulk_delete_job`)
+        """
+        if temporary_only:
+            conversation_ids = await firestore_db.list_conversation_ids(
+                user_id, temporary_only=True)
+        conversation_ids = list(dict.fromkeys(conversation_ids or []))
+
+        job = {
+            "job_id": str(uuid4()),
+            "user_id": user_id,
+            "status": "queued",
+            "total": len(conversation_ids),
+            "deleted": 0,
+            "failed": 0,
+            "created_at": datetime.utcnow(),
+            "finished_at": None,
+            "conversation_ids": conversation_ids,
+            "heartbeat_at": time.time(),
+        }
+        await firestore_db.save_delete_job(user_id, job)
+        await self._queue_bulk_delete(job)
+        logger.info(
+            f"Queued bulk delete {job['job_id']} of {job['total']} conversations")
+        return job
+
+    async def _queue_bulk_delete(self, job: Dict[str, Any]) -> None:
+        self._running_delete_jobs.add(job["job_id"])
+        await background_tasks.submit(
+            f"bulk_delete:{job['job_id']}",
+            lambda: self._run_bulk_delete(job)
+        )
+
+    async def _run_bulk_delete(self, job: Dict[str, Any]) -> None:
+        """
+        Delete a job's conversations, recording progress in Firestore.
+
+        Progress is written every DELETE_JOB_PROGRESS_EVERY conversations,
+        so any worker can report it and a retried or resumed job continues
+        after the last recorded conversation.
+        """
+        user_id, conversation_ids = job["user_id"], job["conversation_ids"]
+
+        def on_progress(conversation_id: str, succeeded: bool) -> None:
+            job["deleted" if succeeded else "failed"] += 1
+
         try:
-            results = await firestore_db.search_conversations(user_id, search_query)
-
-            # Optimize: Use batch operation to fetch all last messages at once
-            # instead of individual queries per conversation (N+1 problem)
-            enriched = []
-            for conv in results:
-                # Fetch last message for each conversation
-                # Note: This still fetches per conversation, but is batched
-                # For true optimization, firestore_db would need to return enriched data
-                messages = await firestore_db.get_conversation_messages(
-                    user_id, conv["id"], limit=1
-                )
-                last_message = ""
-                if messages:
-                    last_message = messages[-1].get("content", "")[:100]
-
-                enriched.append({
-                    "conversation_id": conv["id"],
-                    "title": conv.get("title", "Conversation"),
-                    "last_message": last_message,
-                    "message_count": conv.get("message_count", 0),
-                    "created_at": conv.get("created_at"),
-                    "updated_at": conv.get("updated_at"),
+            job["status"] = "running"
+            done = job["deleted"] + job["failed"]
+            for start in range(done, len(conversation_ids), DELETE_JOB_PROGRESS_EVERY):
+                await firestore_db.delete_conversations(
+                    user_id, conversation_ids[start:start + DELETE_JOB_PROGRESS_EVERY], on_progress)
+                job["heartbeat_at"] = time.time()
+                await firestore_db.update_delete_job(user_id, job["job_id"], {
+                    field: job[field] for field in ("status", "deleted", "failed", "heartbeat_at")
                 })
 
-            return enriched
+            job["status"] = "completed" if not job["failed"] else "completed_with_errors"
+            job["finished_at"] = datetime.utcnow()
+            await firestore_db.update_delete_job(user_id, job["job_id"], {
+                field: job[field] for field in ("status", "deleted", "failed", "finished_at")
+            })
+        finally:
+            self._running_delete_jobs.discard(job["job_id"])
+
+    async def get_bulk_delete_job(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a bulk delete job's progress (None if unknown or not the user's).
+
+        An unfinished job whose progress hasn't moved for
+        DELETE_JOB_STALE_SECONDS (its worker restarted) is resumed here.
+        """
+        job = await firestore_db.get_delete_job(user_id, job_id)
+        if job is None:
+            return None
+        stale = time.time() - job.get("heartbeat_at", 0) > DELETE_JOB_STALE_SECONDS
+        if job["status"] in ("queued", "running") and stale and job_id not in self._running_delete_jobs:
+            logger.warning(f"Resuming stalled bulk delete {job_id}")
+            job["heartbeat_at"] = time.time()
+            await firestore_db.update_delete_job(user_id, job_id, {"heartbeat_at": job["heartbeat_at"]})
+            await self._queue_bulk_delete(job)
+        return job
+
+    async def search_conversations(
+        self,
+        user_id: str,
+        search_query: str,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Search one page of conversations by title words.
+
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        try:
+            return await firestore_db.search_conversations(
+                user_id, search_query, limit, cursor)
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error searching conversations: {str(e)}")
-            return []
+            return {"conversations": [], "next_cursor": None}
 
     async def update_conversation_title(
         self,
@@ -851,6 +1551,10 @@ Format: One question per line, no numbering, no extra text. Each line ends with
             logger.error(f"Error finding source PDF: {str(e)}")
             return None
 
+    async def get_facets(self) -> Dict[str, Any]:
+        """Get the subject, module and document type facets with counts."""
+        return await asyncio.to_thread(vector_store.get_facet_counts)
+
 
 # Singleton instance
 chat_service = ChatService()
@@ -15,6 +15,18 @@ class Settings(BaseSettings):
     # Firebase
     firebase_project_id: str
     firebase_credentials_path: str = "./firebase-credentials.json"
+    # Delete messages through a parallel BulkWriter instead of 500-write batches
+    firestore_use_bulk_writer: bool = False
+    # Verified ID tokens cached until they expire, and how often the
+    # token-signing certificates are prefetched
+    auth_token_cache_size: int = 10000
+    auth_cert_refresh_seconds: float = 3600.0
+    # Per-worker cache of recent conversations (metadata + last messages)
+    conversation_cache_max_bytes: int = 16 * 1024 * 1024
+    conversation_cache_max_messages: int = 50
+    # Entries written/verified this recently skip the Firestore existence and
+    # version read. 0 = always verify; raise with one worker or sticky sessions.
+    conversation_cache_trust_seconds: float = 0.0
 
     # Database
     database_url: str = "sqlite+aiosqlite:///./studduoai.db"
@@ -27,16 +39,96 @@ class Settings(BaseSettings):
     tesseract_cmd: str = "C:\\Program Files\\Tesseract-OCR\\tesseract.exe"
     ocr_dpi: int = 200
     ocr_grayscale: bool = True
+    # Parallel ingestion (1 = sequential, 0 = one worker per CPU)
+    ingest_workers: int = 1
+    ocr_page_workers: int = 1
+    ingest_max_tasks_per_child: int = 8
+    ingest_worker_memory_mb: int = 0  # 0 = no cap (POSIX only)
+    # Per-page extracted text, keyed by PDF hash + OCR settings
+    extraction_cache_dir: str = "./extraction_cache"
+    extraction_cache_enabled: bool = True
 
     # RAG Settings
     chunk_size: int = 1000
     chunk_overlap: int = 200
     top_k_results: int = 5
+    # Hybrid retrieval: BM25 + vector results fused by reciprocal rank
+    hybrid_search_enabled: bool = True
+    hybrid_candidates: int = 20
+    rrf_k: int = 60
+    # Cross-encoder reranking of over-fetched candidates (CPU, latency-budgeted)
+    rerank_enabled: bool = False
+    rerank_max_candidates: int = 20
+    rerank_budget_ms: float = 150.0
+    rerank_max_concurrency: int = 2
+    # Neighbouring chunks stitched onto each side of every hit (0 disables)
+    neighbor_chunks: int = 0
+    # Estimated-token budgets for retrieved context and chat history in prompts
+    context_token_budget: int = 3000
+    history_token_budget: int = 800
+    # Latest messages always quoted in prompts; older ones are quoted until
+    # they are folded into a rolling conversation summary, which happens once
+    # `conversation_summary_every` have piled up
+    history_messages: int = 4
+    conversation_summary_enabled: bool = True
+    conversation_summary_every: int = 6
+    summary_token_budget: int = 200
+    # Sanitized per-chunk prompt blocks kept in memory
+    context_block_cache_size: int = 4096
+    # Chunks embedded and written to ChromaDB per micro-batch during ingestion
+    ingest_batch_size: int = 100
+
+    # Embeddings
+    embedding_backend: str = "torch"  # "torch" or "onnx"
+    embedding_batch_size: int = 32
+    embedding_threads: int = 0  # 0 = library default
+    embedding_onnx_path: str = ""  # exported (optionally int8) all-MiniLM-L6-v2 .onnx
+    # Concurrent query embeddings are grouped into one forward pass
+    query_batch_max_size: int = 16
+    query_batch_max_wait_ms: float = 5.0
+    # Query embedding cache: "memory", or a shared "disk" (sqlite) / "redis" backend
+    query_cache_max_bytes: int = 8 * 1024 * 1024
+    query_cache_ttl_seconds: float = 24 * 3600
+    query_cache_backend: str = "memory"
+    query_cache_disk_path: str = "./cache/query_embeddings.sqlite3"
+    query_cache_redis_url: str = "redis://localhost:6379/0"
+
+    # Semantic answer cache (reuses answers for near-identical questions)
+    answer_cache_enabled: bool = True
+    answer_cache_similarity: float = 0.95
+    answer_cache_max_entries: int = 2000
+    answer_cache_ttl_seconds: float = 6 * 3600
 
     # LLM Settings
     model_name: str = "gemini-pro"
     temperature: float = 0.7
     max_tokens: int = 8192
+    llm_timeout_seconds: float = 60.0
+    # Longest wait for each streamed chunk after the first
+    llm_stream_chunk_timeout_seconds: float = 20.0
+    llm_title_timeout_seconds: float = 5.0
+    llm_follow_up_timeout_seconds: float = 10.0
+    llm_summary_timeout_seconds: float = 10.0
+    # LLM admission control: token-bucket rate limits, a cap on concurrent
+    # calls, and how long a request may queue before failing fast. Every
+    # limit is per worker process, so set the rates to the Gemini quota
+    # divided by the number of workers. Chat turns use the global bucket;
+    # auxiliary calls (titles, follow-ups, summaries) have their own
+    llm_global_requests_per_minute: float = 60.0
+    llm_global_burst: int = 10
+    llm_aux_requests_per_minute: float = 60.0
+    llm_aux_burst: int = 10
+    llm_user_requests_per_minute: float = 10.0
+    llm_user_burst: int = 5
+    llm_max_concurrency: int = 8
+    llm_max_queue: int = 32
+    llm_queue_timeout_seconds: float = 10.0
+
+    # Background Tasks
+    background_task_concurrency: int = 4
+    background_task_retries: int = 2
+    background_task_retry_delay: float = 0.5
+    background_drain_timeout: float = 10.0
 
     @property
     def origins_list(self) -> List[str]:
@@ -0,0 +1,226 @@
+from typing import Any, Dict, List, Set, Tuple
+import re
+
+# Word pieces and single punctuation marks, roughly how subword tokenizers split text
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+# Subword tokenizers average about four characters per token on English prose
+CHARS_PER_TOKEN = 4
+# Source header and separator added around every passage in the prompt
+BLOCK_OVERHEAD_TOKENS = 12
+# Overlaps shorter than this are treated as coincidence, not splitter overlap
+MIN_OVERLAP_CHARS = 20
+# Word n-gram size and Jaccard similarity for near-duplicate chunks
+SHINGLE_SIZE = 5
+DUPLICATE_SIMILARITY = 0.8
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate the LLM token count of `text` without a model tokenizer.
+
+    Each word costs one token per started four characters and each
+    punctuation mark one token, which tracks SentencePiece/BPE counts
+    closely enough for budgeting.
+    """
+    return sum(
+        (len(piece) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        for piece in _TOKEN_PIECE_RE.findall(text)
+    )
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens`, preferring a sentence or word boundary."""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    used = 0
+    end = 0
+    for match in _TOKEN_PIECE_RE.finditer(text):
+        cost = (len(match.group()) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        if used + cost > max_tokens:
+            break
+        used += cost
+        end = match.end()
+
+    cut = text[:end]
+    sentence_end = max(cut.rfind(". "), cut.rfind(".\n"), cut.rfind("\n\n"))
+    if sentence_end > len(cut) // 2:
+        cut = cut[:sentence_end + 1]
+    return cut.rstrip() + " …"
+
+
+def strip_overlap(previous: str, following: str, max_overlap: int) -> str:
+    """
+    Return `following` without the prefix it shares with the end of `previous`.
+
+    Consecutive chunks from the text splitter repeat up to `chunk_overlap`
+    characters; the longest such suffix/prefix match is removed.
+    """
+    limit = min(len(previous), len(following), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
+
+def _shingles(text: str) -> Set[str]:
+    words = text.lower().split()
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {
+        " ".join(words[i:i + SHINGLE_SIZE])
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def _is_near_duplicate(shingles: Set[str], kept: List[Set[str]]) -> bool:
+    for other in kept:
+        overlap = len(shingles & other)
+        if not overlap:
+            continue
+        # Containment covers a short chunk repeated inside a longer one
+        if overlap / min(len(shingles), len(other)) >= DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+
+def merge_adjacent(
+    docs: List[Dict[str, Any]],
+    max_overlap: int
+) -> List[Dict[str, Any]]:
+    """
+    Merge chunks with consecutive `chunk_id`s from the same source.
+
+    Args:
+        docs: Retrieved documents, best first
+        max_overlap: Longest overlap to strip between consecutive chunks
+
+    Returns:
+        Passages ordered by their best-ranked chunk, each with `source`,
+        `chunk_ids`, stitched `text`, and the `metadata` and `distance`
+        of that best-ranked chunk
+    """
+    passages: List[Dict[str, Any]] = []
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+
+    for rank, doc in enumerate(docs):
+        metadata = doc.get("metadata", {})
+        source = metadata.get("source", "Unknown Source")
+        chunk_id = metadata.get("chunk_id")
+
+        passage = {
+            "source": source,
+            # Already-stitched passages carry the span they cover
+            "chunk_ids": list(doc.get("chunk_ids") or [chunk_id]),
+            "text": doc.get("text", ""),
+            "rank": rank,
+            "metadata": metadata,
+            "distance": doc.get("distance"),
+        }
+        if chunk_id is None:
+            passages.append(passage)
+            continue
+        by_source.setdefault(source, []).append(passage)
+
+    def absorb_rank(current: Dict[str, Any], passage: Dict[str, Any]) -> None:
+        if passage["rank"] < current["rank"]:
+            current["rank"] = passage["rank"]
+            current["metadata"] = passage["metadata"]
+            current["distance"] = passage["distance"]
+
+    for source_passages in by_source.values():
+        source_passages.sort(key=lambda p: p["chunk_ids"][0])
+        current = source_passages[0]
+        for passage in source_passages[1:]:
+            if passage["chunk_ids"][-1] <= current["chunk_ids"][-1]:
+                # Same chunk retrieved twice (e.g. from two searches)
+                absorb_rank(current, passage)
+            elif passage["chunk_ids"][0] == current["chunk_ids"][-1] + 1:
+                current["text"] += strip_overlap(current["text"], passage["text"], max_overlap)
+                current["chunk_ids"].extend(passage["chunk_ids"])
+                absorb_rank(current, passage)
+            else:
+                passages.append(current)
+                current = passage
+        passages.append(current)
+
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def pack_context(
+    docs: List[Dict[str, Any]],
+    token_budget: int,
+    max_overlap: int
+) -> List[Dict[str, Any]]:
+    """
+    Select and stitch retrieved chunks into passages that fit a token budget.
+
+    Near-duplicate chunks are dropped, adjacent chunks from one source are
+    merged with their overlap removed, and passages are then added in
+    relevance order while they fit. If even the best passage is too long
+    it is truncated rather than dropped.
+
+    Args:
+        docs: Retrieved documents, best first
+        token_budget: Maximum estimated tokens for all passages together
+        max_overlap: Longest overlap to strip between consecutive chunks
+
+    Returns:
+        Passages in relevance order, each with `source`, `chunk_ids`, `text`
+    """
+    unique: List[Dict[str, Any]] = []
+    kept_shingles: List[Set[str]] = []
+    for doc in docs:
+        text = doc.get("text", "")
+        if not text.strip():
+            continue
+        shingles = _shingles(text)
+        if _is_near_duplicate(shingles, kept_shingles):
+            continue
+        kept_shingles.append(shingles)
+        unique.append(doc)
+
+    packed: List[Dict[str, Any]] = []
+    remaining = token_budget
+    for passage in merge_adjacent(unique, max_overlap):
+        cost = estimate_tokens(passage["text"]) + BLOCK_OVERHEAD_TOKENS
+        if cost <= remaining:
+            packed.append(passage)
+            remaining -= cost
+        elif not packed:
+            passage["text"] = truncate_to_tokens(
+                passage["text"], remaining - BLOCK_OVERHEAD_TOKENS)
+            if passage["text"]:
+                packed.append(passage)
+            remaining = 0
+        # Otherwise skip it; a shorter, less relevant passage may still fit
+
+    return packed
+
+
+def pack_history(
+    messages: List[Tuple[str, str]],
+    token_budget: int,
+    max_messages: int = 4
+) -> List[Tuple[str, str]]:
+    """
+    Pick the most recent messages that fit a token budget, oldest first.
+
+    Messages are (role, content) pairs. The newest message always gets in,
+    truncated if necessary; older ones are truncated to their share of
+    what's left and dropped once the budget is spent.
+    """
+    packed = []
+    remaining = token_budget
+    for role, content in reversed(messages[-max_messages:]):
+        # Leave older messages some room by capping each at half the budget
+        content = truncate_to_tokens(content, min(remaining, token_budget // 2))
+        if not content:
+            break
+        packed.append((role, content))
+        remaining -= estimate_tokens(content)
+    packed.reverse()
+    return packed
@@ -0,0 +1,256 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rough per-message bookkeeping cost (dict, timestamp, sources) on top of the text
+MESSAGE_OVERHEAD_BYTES = 300
+# Per-entry cost of the key, OrderedDict node and metadata
+ENTRY_OVERHEAD_BYTES = 400
+# Conversation fields mirrored alongside the messages
+METADATA_FIELDS = ("title", "prompt_type", "summary", "summary_message_count")
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    size = MESSAGE_OVERHEAD_BYTES + len(message.get("content", ""))
+    for source in message.get("sources") or []:
+        size += len(str(source))
+    return size
+
+
+class ConversationCache:
+    """
+    Write-through cache of recently used conversations in this process.
+
+    Each entry holds a conversation's metadata and its last `max_messages`
+    messages, keyed by (user_id, conversation_id), evicted LRU once the
+    cache exceeds `max_bytes`.
+
+    Entries carry the conversation's `message_count` as a version. Another
+    worker writing to the same conversation bumps the count in Firestore,
+    so `verify` drops the entry when the versions disagree. Entries verified
+    or written within `trust_seconds` are used without asking Firestore.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_messages: int = 50,
+        trust_seconds: float = 0.0
+    ):
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.trust_seconds = trust_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def _remove_locked(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+
+    def _store_locked(self, key: Tuple[str, str], entry: Dict[str, Any]) -> None:
+        self._remove_locked(key)
+        entry["messages"] = entry["messages"][-self.max_messages:]
+        entry["size"] = ENTRY_OVERHEAD_BYTES + len(entry.get("summary") or "") + sum(
+            _message_size(message) for message in entry["messages"])
+        if entry["size"] > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry["size"]
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["size"]
+            self._stats["evictions"] += 1
+
+    def lookup(self, user_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a conversation's cached metadata if it is trusted without a read.
+
+        Returns:
+            Dict with `version` and the cached conversation fields (see
+            METADATA_FIELDS), or None when the caller should check
+            Firestore (then call `verify`)
+        """
+        with self._lock:
+            entry = self._entries.get((user_id, conversation_id))
+            if entry is None or time.monotonic() - entry["verified_at"] > self.trust_seconds:
+                return None
+            self._entries.move_to_end((user_id, conversation_id))
+            return {
+                "version": entry["version"],
+                **{field: entry.get(field) for field in METADATA_FIELDS},
+            }
+
+    def verify(
+        self,
+        user_id: str,
+        conversation_id: str,
+        version: Optional[int],
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Reconcile an entry with the conversation as just read from Firestore.
+
+        Args:
+            version: The stored `message_count`, or None if the conversation
+                no longer exists
+            metadata: The stored conversation fields, refreshed on a match
+        """
+        key = (user_id, conversation_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if entry["version"] != version:
+                self._remove_locked(key)
+                self._stats["stale"] += 1
+                return
+            entry["verified_at"] = time.monotonic()
+            for field in METADATA_FIELDS:
+                if metadata and field in metadata:
+                    entry[field] = metadata[field]
+
+    def get_messages(
+        self,
+        user_id: str,
+        conversation_id: str,
+        limit: int,
+        version: int,
+        tail: bool = False
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the first (or with `tail`, the last) `limit` messages.
+
+        Args:
+            version: The conversation's verified `message_count`; an entry
+                at any other version is a miss
+
+        Returns:
+            Messages oldest first, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get((user_id, conversation_id))
+            hit = entry is not None and entry["version"] == version
+            if hit:
+                messages = entry["messages"]
+                complete = len(messages) == entry["version"]
+                # A tail read only needs enough recent messages
+                hit = complete or (tail and len(messages) >= limit)
+            if not hit:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end((user_id, conversation_id))
+            self._stats["hits"] += 1
+            return list(messages[-limit:] if tail else messages[:limit])
+
+    def put(
+        self,
+        user_id: str,
+        conversation_id: str,
+        version: int,
+        messages: List[Dict[str, Any]],
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Cache a conversation as just read from Firestore.
+
+        Args:
+            version: The conversation's `message_count`
+            messages: Its latest messages, oldest first
+            metadata: Conversation fields to keep (see METADATA_FIELDS);
+                when omitted, those already cached are kept
+        """
+        key = (user_id, conversation_id)
+        with self._lock:
+            previous = self._entries.get(key) or {}
+            metadata = metadata or {}
+            self._store_locked(key, {
+                "version": version,
+                "messages": list(messages),
+                **{field: metadata.get(field, previous.get(field)) for field in METADATA_FIELDS},
+                "verified_at": time.monotonic(),
+            })
+
+    def record_write(
+        self,
+        user_id: str,
+        conversation_id: str,
+        base_version: int,
+        messages: List[Dict[str, Any]],
+        title: Optional[str] = None,
+        prompt_type: Optional[str] = None
+    ) -> None:
+        """
+        Apply a committed write (write-through).
+
+        Args:
+            base_version: `message_count` before the write; the entry is
+                dropped if it doesn't match, since then this worker has
+                missed writes. New conversations use 0.
+            messages: Messages the write added, oldest first
+        """
+        key = (user_id, conversation_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and base_version != 0:
+                return
+            if entry is not None and entry["version"] != base_version:
+                self._remove_locked(key)
+                self._stats["stale"] += 1
+                return
+            entry = entry or {"messages": [], "summary": "", "summary_message_count": 0}
+            self._store_locked(key, {
+                **{field: entry.get(field) for field in METADATA_FIELDS},
+                "version": base_version + len(messages),
+                "messages": entry["messages"] + list(messages),
+                "title": title if title is not None else entry.get("title"),
+                "prompt_type": prompt_type or entry.get("prompt_type"),
+                "verified_at": time.monotonic(),
+            })
+
+    def update_metadata(self, user_id: str, conversation_id: str, **fields: Any) -> None:
+        """Update cached conversation fields (see METADATA_FIELDS) in place."""
+        with self._lock:
+            entry = self._entries.get((user_id, conversation_id))
+            if entry is not None:
+                entry.update(
+                    (field, value) for field, value in fields.items()
+                    if field in METADATA_FIELDS
+                )
+
+    def invalidate(self, user_id: str, conversation_id: str) -> None:
+        """Forget a conversation (deleted, or changed in a way not mirrored here)."""
+        with self._lock:
+            self._remove_locked((user_id, conversation_id))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit-rate and memory metrics."""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+            size = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Singleton instance
+conversation_cache = ConversationCache(
+    max_bytes=settings.conversation_cache_max_bytes,
+    max_messages=settings.conversation_cache_max_messages,
+    trust_seconds=settings.conversation_cache_trust_seconds,
+)
@@ -1,7 +1,8 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import os
 from pathlib import Path
 import logging
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 
 from pypdf import PdfReader
 from pdf2image import convert_from_path
@@ -10,10 +11,43 @@ from PIL import Image
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from config import settings
+from extraction_cache import ExtractionCache
+from ingest_manifest import file_sha256
+from facets import derive_facets
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+OCR_LANG = "eng"
+
+
+def _resolve_workers(workers: int) -> int:
+    """Translate a configured worker count (0 = all CPUs) into a real one."""
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def _init_ingest_worker(memory_limit_mb: int) -> None:
+    """Cap the address space of an ingestion worker process (POSIX only)."""
+    if memory_limit_mb <= 0:
+        return
+    try:
+        import resource
+    except ImportError:
+        logger.warning("Worker memory cap is not supported on this platform")
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _process_document_worker(
+    pdf_path: str,
+    file_hash: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], str]:
+    """Process one PDF inside a pool worker using that process's singleton."""
+    return document_processor.process_hashed_document(pdf_path, file_hash)
+
 
 class DocumentProcessor:
     """Process PDFs with OCR support for scanned documents."""
@@ -23,6 +57,11 @@ class DocumentProcessor:
         self.chunk_overlap = settings.chunk_overlap
         self.ocr_dpi = getattr(settings, "ocr_dpi", 200)
         self.ocr_grayscale = getattr(settings, "ocr_grayscale", True)
+        self.ocr_page_workers = _resolve_workers(settings.ocr_page_workers)
+        self.extraction_cache = ExtractionCache(
+            settings.extraction_cache_dir,
+            enabled=settings.extraction_cache_enabled
+        )
 
         # Set Tesseract path for Windows
         if os.path.exists(settings.tesseract_cmd):
@@ -35,82 +74,131 @@ class DocumentProcessor:
             length_function=len,
         )
 
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF, with OCR fallback for scanned pages."""
-        text = ""
+    def _extraction_options(self) -> Dict[str, Any]:
+        """Settings that affect extracted text, used in the cache key."""
+        return {
+            "dpi": self.ocr_dpi,
+            "grayscale": self.ocr_grayscale,
+            "ocr_lang": OCR_LANG,
+        }
+
+    def extract_text_from_pdf(self, pdf_path: str, file_hash: Optional[str] = None) -> str:
+        """
+        Extract text from PDF, with OCR fallback for scanned pages.
+
+        Args:
+            file_hash: The file's SHA-256 if already known, to key the
+                extraction cache without hashing the file again
+        """
+        cache_key = None
+        if self.extraction_cache.enabled:
+            cache_key = self.extraction_cache.make_key(
+                file_hash or file_sha256(pdf_path), self._extraction_options())
+            pages = self.extraction_cache.get(cache_key)
+            if pages is not None:
+                logger.info(f"Using cached extracted text for {pdf_path}")
+                return "".join(pages)
+
+        pages = self._extract_pages(pdf_path)
+        if pages is None:
+            return ""
+
+        if cache_key:
+            self.extraction_cache.put(cache_key, pages)
+        return "".join(pages)
+
+    def _extract_pages(self, pdf_path: str) -> Optional[List[str]]:
+        """
+        Extract per-page text blocks, with OCR fallback for scanned PDFs.
+
+        Returns:
+            Text blocks whose concatenation is the document text, or None
+            if both digital extraction and OCR failed
+        """
         try:
             # Try digital text extraction first
             reader = PdfReader(pdf_path)
-            digital_text = ""
+            digital_pages = []
 
             for page_num, page in enumerate(reader.pages):
                 page_text = page.extract_text()
                 if page_text:
-                    digital_text += page_text + "\n\n"
+                    digital_pages.append(page_text + "\n\n")
 
             # If we got substantial text, it's a digital PDF
-            if len(digital_text.strip()) > 100:
-                text = digital_text
+            if len("".join(digital_pages).strip()) > 100:
                 logger.info(f"Extracted digital text from {pdf_path}")
-            else:
-                # Likely a scanned PDF, use OCR
-                logger.info(f"Attempting OCR on {pdf_path}")
-                text = self._ocr_pdf(pdf_path)
+                return digital_pages
+
+            # Likely a scanned PDF, use OCR
+            logger.info(f"Attempting OCR on {pdf_path}")
+            return self._ocr_pages(pdf_path)
 
         except Exception as e:
             logger.error(f"Error processing {pdf_path}: {str(e)}")
             # Fallback to OCR if digital extraction fails
             try:
-                text = self._ocr_pdf(pdf_path)
+                return self._ocr_pages(pdf_path)
             except Exception as ocr_error:
                 logger.error(
                     f"OCR also failed for {pdf_path}: {str(ocr_error)}")
-                text = ""
+                return None
+
+    def _ocr_page(self, pdf_path: str, page_index: int, total_pages: int) -> str:
+        """OCR a single page and return its text block."""
+        # Convert one page at a time to avoid loading the whole PDF into memory
+        images = convert_from_path(
+            pdf_path,
+            dpi=self.ocr_dpi,
+            first_page=page_index + 1,
+            last_page=page_index + 1,
+            grayscale=self.ocr_grayscale,
+        )
+
+        if not images:
+            logger.warning(
+                f"No image produced for page {page_index + 1} of {pdf_path}")
+            return ""
+
+        image = images[0]
+        page_text = pytesseract.image_to_string(image, lang=OCR_LANG)
 
-        return text
+        # Explicitly release memory for this page
+        image.close()
+        del image
+        logger.info(
+            f"OCR completed for page {page_index + 1} of {pdf_path} ({page_index + 1}/{total_pages})")
+        return f"\n\n--- Page {page_index + 1} ---\n\n{page_text}"
 
-    def _ocr_pdf(self, pdf_path: str) -> str:
-        """Perform OCR on scanned PDF."""
-        text = ""
+    def _ocr_pages(self, pdf_path: str) -> List[str]:
+        """Perform OCR on scanned PDF, returning one text block per page."""
         try:
             reader = PdfReader(pdf_path)
             total_pages = len(reader.pages)
 
-            for page_index in range(total_pages):
-                # Convert one page at a time to avoid loading the whole PDF into memory
-                images = convert_from_path(
-                    pdf_path,
-                    dpi=self.ocr_dpi,
-                    first_page=page_index + 1,
-                    last_page=page_index + 1,
-                    grayscale=self.ocr_grayscale,
-                )
-
-                if not images:
-                    logger.warning(
-                        f"No image produced for page {page_index + 1} of {pdf_path}")
-                    continue
-
-                image = images[0]
-                page_text = pytesseract.image_to_string(image, lang='eng')
-                text += f"\n\n--- Page {page_index + 1} ---\n\n{page_text}"
-
-                # Explicitly release memory for this page
-                image.close()
-                del image
-                logger.info(
-                    f"OCR completed for page {page_index + 1} of {pdf_path} ({page_index + 1}/{total_pages})")
+            if self.ocr_page_workers <= 1 or total_pages <= 1:
+                return [
+                    self._ocr_page(pdf_path, page_index, total_pages)
+                    for page_index in range(total_pages)
+                ]
+
+            # Rasterising and Tesseract both run as subprocesses, so threads are
+            # enough to keep several pages in flight; map() preserves page order
+            with ThreadPoolExecutor(max_workers=self.ocr_page_workers) as executor:
+                return list(executor.map(
+                    lambda page_index: self._ocr_page(
+                        pdf_path, page_index, total_pages),
+                    range(total_pages)
+                ))
 
         except Exception as e:
             logger.error(f"OCR failed for {pdf_path}: {str(e)}")
             raise
 
-        return text
-
-    def process_document(self, pdf_path: str) -> List[Dict[str, Any]]:
+    def process_document(self, pdf_path: str, file_hash: Optional[str] = None) -> List[Dict[str, Any]]:
         """Process a PDF document and return chunks with metadata."""
         filename = Path(pdf_path).name
-        text = self.extract_text_from_pdf(pdf_path)
+        text = self.extract_text_from_pdf(pdf_path, file_hash)
 
         if not text or len(text.strip()) < 50:
             logger.warning(f"Insufficient text extracted from {filename}")
@@ -119,6 +207,9 @@ class DocumentProcessor:
         # Split into chunks
         chunks = self.text_splitter.split_text(text)
 
+        # Subject/module/type facets are shared by every chunk of the file
+        facets = derive_facets(filename, text)
+
         # Create documents with metadata
         documents = []
         for i, chunk in enumerate(chunks):
@@ -129,34 +220,144 @@ class DocumentProcessor:
                         "source": filename,
                         "chunk_id": i,
                         "total_chunks": len(chunks),
-                        "file_path": pdf_path
+                        "file_path": pdf_path,
+                        **facets
                     }
                 })
 
         logger.info(f"Processed {filename}: {len(documents)} chunks created")
         return documents
 
-    def process_directory(self, directory: str = None) -> List[Dict[str, Any]]:
-        """Process all PDFs in a directory."""
+    def process_hashed_document(
+        self,
+        pdf_path: str,
+        file_hash: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Process a PDF, hashing it at most once for both the extraction
+        cache and the caller (e.g. the ingest manifest).
+
+        Returns:
+            (chunks, the file's SHA-256)
+        """
+        file_hash = file_hash or file_sha256(pdf_path)
+        return self.process_document(pdf_path, file_hash), file_hash
+
+    def process_directory(
+        self,
+        directory: str = None,
+        workers: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Process all PDFs in a directory.
+
+        Files are processed in sorted name order and their chunks returned in
+        that order, whether or not a worker pool is used.
+
+        Args:
+            directory: Directory to scan (defaults to settings.knowledge_dir)
+            workers: Process count (defaults to settings.ingest_workers;
+                1 = sequential, 0 = one per CPU)
+        """
         if directory is None:
             directory = settings.knowledge_dir
 
-        all_documents = []
-        pdf_files = list(Path(directory).glob("*.pdf"))
+        pdf_files = sorted(Path(directory).glob("*.pdf"))
 
         logger.info(f"Found {len(pdf_files)} PDF files to process")
 
-        for pdf_path in pdf_files:
-            try:
-                docs = self.process_document(str(pdf_path))
-                all_documents.extend(docs)
-            except Exception as e:
-                logger.error(f"Failed to process {pdf_path.name}: {str(e)}")
-                continue
+        results = self.process_files(pdf_files, workers)
 
+        all_documents = [doc for docs in results for doc in docs]
         logger.info(f"Total documents created: {len(all_documents)}")
         return all_documents
 
+    def process_files(
+        self,
+        pdf_files: List[Path],
+        workers: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Process the given PDFs and return their chunks, one list per file.
+
+        Failed files yield an empty list so results stay aligned with input.
+        """
+        return [docs for _, docs, _ in self.iter_files(pdf_files, workers)]
+
+    def iter_files(
+        self,
+        pdf_files: List[Path],
+        workers: Optional[int] = None,
+        hashes: Optional[Dict[str, str]] = None
+    ) -> Iterator[Tuple[Path, List[Dict[str, Any]], str]]:
+        """
+        Lazily process PDFs, yielding (path, chunks, SHA-256) in input order.
+
+        Only a bounded window of files is processed ahead of the consumer, so
+        memory stays flat however many files there are. Failed files yield an
+        empty chunk list. Each file is hashed once, by whoever processes it.
+
+        Args:
+            hashes: SHA-256 already known per file name, so those files
+                aren't hashed again
+        """
+        if workers is None:
+            workers = settings.ingest_workers
+        workers = _resolve_workers(workers)
+        hashes = hashes or {}
+
+        if workers > 1 and len(pdf_files) > 1:
+            yield from self._iter_files_parallel(pdf_files, workers, hashes)
+            return
+
+        for index, pdf_path in enumerate(pdf_files):
+            file_hash = hashes.get(pdf_path.name)
+            try:
+                docs, file_hash = self.process_hashed_document(str(pdf_path), file_hash)
+            except Exception as e:
+                logger.error(f"Failed to process {pdf_path.name}: {str(e)}")
+                docs = []
+            logger.info(
+                f"Progress: {index + 1}/{len(pdf_files)} files processed")
+            yield pdf_path, docs, file_hash or file_sha256(str(pdf_path))
+
+    def _iter_files_parallel(
+        self,
+        pdf_files: List[Path],
+        workers: int,
+        hashes: Dict[str, str]
+    ) -> Iterator[Tuple[Path, List[Dict[str, Any]], str]]:
+        """Process PDFs on a process pool, yielding chunks in file order."""
+        logger.info(f"Processing with {workers} worker processes")
+        # Files submitted ahead of the consumer; finished results wait here
+        # until their turn, so this also bounds buffered chunks
+        max_in_flight = workers * 2
+        futures: Dict[int, Future] = {}
+        next_submit = 0
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            max_tasks_per_child=settings.ingest_max_tasks_per_child or None,
+            initializer=_init_ingest_worker,
+            initargs=(settings.ingest_worker_memory_mb,),
+        ) as executor:
+            for index, pdf_path in enumerate(pdf_files):
+                while next_submit < len(pdf_files) and next_submit < index + max_in_flight:
+                    next_path = pdf_files[next_submit]
+                    futures[next_submit] = executor.submit(
+                        _process_document_worker, str(next_path), hashes.get(next_path.name))
+                    next_submit += 1
+
+                file_hash = hashes.get(pdf_path.name)
+                try:
+                    docs, file_hash = futures.pop(index).result()
+                except Exception as e:
+                    logger.error(f"Failed to process {pdf_path.name}: {str(e)}")
+                    docs = []
+                logger.info(
+                    f"Progress: {index + 1}/{len(pdf_files)} files processed ({pdf_path.name})")
+                yield pdf_path, docs, file_hash or file_sha256(str(pdf_path))
+
 
 # Singleton instance
 document_processor = DocumentProcessor()
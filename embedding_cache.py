@@ -0,0 +1,294 @@
+from typing import Any, Dict, List, Optional, Tuple
+from array import array
+from collections import OrderedDict
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from config import settings
+from embedding_engine import EMBEDDING_MODEL_NAME
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (key, OrderedDict node, tuple) on top of the vector
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for cache lookups.
+
+    Case, surrounding whitespace, repeated spaces and trailing punctuation
+    don't change what the student is asking ("What is OOP?" == "what is oop").
+    """
+    query = re.sub(r"\s+", " ", query.casefold()).strip()
+    return query.rstrip("?!.").rstrip()
+
+
+class LRUTTLCache:
+    """Thread-safe O(1) LRU cache bounded in bytes, with per-entry TTL."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at, size = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (value, time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+class SqliteEmbeddingBackend:
+    """On-disk shared cache so all uvicorn workers on a host share warm embeddings."""
+
+    # Expired rows are purged every this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM query_embeddings WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, vector: bytes) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector, expires_at) VALUES (?, ?, ?)",
+                (key, vector, time.time() + self.ttl_seconds)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM query_embeddings WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+
+class RedisEmbeddingBackend:
+    """Shared cache on a local Redis (or Redis-compatible) server."""
+
+    KEY_PREFIX = "studduo:qemb:"
+
+    def __init__(self, url: str, ttl_seconds: float):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError(
+                "QUERY_CACHE_BACKEND=redis requires the `redis` package") from e
+        self.ttl_seconds = ttl_seconds
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(self.KEY_PREFIX + key)
+
+    def put(self, key: str, vector: bytes) -> None:
+        self._client.setex(self.KEY_PREFIX + key, int(self.ttl_seconds), vector)
+
+
+class QueryEmbeddingCache:
+    """
+    Two-level query-embedding cache.
+
+    Level 1 is an in-process LRU/TTL cache storing vectors as float32 arrays.
+    Level 2 is an optional shared backend ("disk" or "redis"). A level-2 hit
+    is promoted into level 1. Shared-backend errors are logged and treated
+    as misses so the cache never fails a search. Async callers use
+    `get_async`/`put_async`, which keep backend I/O off the event loop.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        backend: str = "memory",
+        disk_path: Optional[str] = None,
+        redis_url: Optional[str] = None
+    ):
+        self._local = LRUTTLCache(max_bytes, ttl_seconds)
+        self._shared = None
+        if backend == "disk":
+            self._shared = SqliteEmbeddingBackend(disk_path, ttl_seconds)
+        elif backend == "redis":
+            self._shared = RedisEmbeddingBackend(redis_url, ttl_seconds)
+        elif backend != "memory":
+            raise ValueError(f"Unknown query cache backend: {backend}")
+        self.backend = backend
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0}
+
+    def _key(self, query: str) -> str:
+        # Include the model so a model change never serves stale vectors
+        payload = f"{EMBEDDING_MODEL_NAME}\n{normalize_query(query)}"
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self._stats[stat] += 1
+
+    def _put_local(self, key: str, vector: array) -> None:
+        self._local.put(key, vector, vector.itemsize * len(vector) + ENTRY_OVERHEAD_BYTES)
+
+    def _get_shared(self, key: str) -> Optional[bytes]:
+        try:
+            return self._shared.get(key)
+        except Exception as e:
+            logger.warning(f"Shared query cache read failed: {str(e)}")
+            return None
+
+    def _put_shared(self, key: str, raw: bytes) -> None:
+        try:
+            self._shared.put(key, raw)
+        except Exception as e:
+            logger.warning(f"Shared query cache write failed: {str(e)}")
+
+    def _promote(self, key: str, raw: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(raw)
+        self._put_local(key, vector)
+        self._count("shared_hits")
+        return vector.tolist()
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        vector = self._local.get(key)
+        if vector is None:
+            return None
+        self._count("hits")
+        return vector.tolist()
+
+    def get(self, query: str) -> Optional[List[float]]:
+        """Return the cached embedding for a query, or None."""
+        key = self._key(query)
+        embedding = self._get_local(key)
+        if embedding is not None:
+            return embedding
+
+        if self._shared is not None:
+            raw = self._get_shared(key)
+            if raw is not None:
+                return self._promote(key, raw)
+
+        self._count("misses")
+        return None
+
+    async def get_async(self, query: str) -> Optional[List[float]]:
+        """`get` for the event loop: shared-backend reads run in a worker thread."""
+        key = self._key(query)
+        embedding = self._get_local(key)
+        if embedding is not None:
+            return embedding
+
+        if self._shared is not None:
+            raw = await asyncio.to_thread(self._get_shared, key)
+            if raw is not None:
+                return self._promote(key, raw)
+
+        self._count("misses")
+        return None
+
+    def put(self, query: str, embedding: List[float]) -> None:
+        """Cache the embedding for a query."""
+        key = self._key(query)
+        vector = array("f", embedding)
+        self._put_local(key, vector)
+        if self._shared is not None:
+            self._put_shared(key, vector.tobytes())
+
+    async def put_async(self, query: str, embedding: List[float]) -> None:
+        """
+        `put` for the event loop: the shared-backend write runs in a worker
+        thread without the caller waiting for it.
+        """
+        key = self._key(query)
+        vector = array("f", embedding)
+        self._put_local(key, vector)
+        if self._shared is not None:
+            asyncio.get_running_loop().run_in_executor(
+                None, self._put_shared, key, vector.tobytes())
+
+    def clear(self) -> None:
+        """Clear the in-process level (shared entries expire via TTL)."""
+        self._local.clear()
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and memory use."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+        return {
+            **stats,
+            "hit_rate": round((stats["hits"] + stats["shared_hits"]) / lookups, 3) if lookups else 0.0,
+            "entries": len(self._local),
+            "size_bytes": self._local.size_bytes,
+            "max_bytes": self._local.max_bytes,
+            "backend": self.backend,
+        }
+
+
+def create_query_embedding_cache() -> QueryEmbeddingCache:
+    """Build the cache configured in settings."""
+    return QueryEmbeddingCache(
+        max_bytes=settings.query_cache_max_bytes,
+        ttl_seconds=settings.query_cache_ttl_seconds,
+        backend=settings.query_cache_backend,
+        disk_path=settings.query_cache_disk_path,
+        redis_url=settings.query_cache_redis_url,
+    )
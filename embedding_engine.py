@@ -0,0 +1,278 @@
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
+import asyncio
+import logging
+import threading
+import time
+
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Use smaller model for memory efficiency on Render (512MB limit)
+# sentence-transformers/all-MiniLM-L6-v2 is ~90MB vs larger models
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EmbeddingEngine:
+    """
+    Batched sentence embedder for all-MiniLM-L6-v2.
+
+    Texts are sorted by length and encoded in fixed-size batches so each
+    batch pads to similar lengths, then returned in the caller's order.
+    Two backends are available:
+        - "torch": sentence-transformers on CPU (default)
+        - "onnx": ONNX Runtime session over an exported (optionally
+          int8-quantized) model file, see `quantize_onnx_model`
+    Vectors are L2-normalized in both cases.
+    """
+
+    def __init__(
+        self,
+        backend: str = "torch",
+        batch_size: int = 32,
+        num_threads: int = 0,
+        onnx_model_path: Optional[str] = None
+    ):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.onnx_model_path = onnx_model_path
+        self._model = None
+        self._tokenizer = None
+        self._session = None
+        self._stats_lock = threading.Lock()
+        self._texts_embedded = 0
+        self._seconds_spent = 0.0
+
+        if backend == "onnx":
+            self._load_onnx()
+        elif backend == "torch":
+            self._load_torch()
+        else:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+
+    def _load_torch(self) -> None:
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+        self._model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+        logger.info(
+            f"Loaded torch embedding backend ({EMBEDDING_MODEL_NAME}, "
+            f"{torch.get_num_threads()} intra-op threads)")
+
+    def _load_onnx(self) -> None:
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The onnx embedding backend requires `onnxruntime` and `transformers`"
+            ) from e
+        if not self.onnx_model_path:
+            raise ValueError(
+                "EMBEDDING_ONNX_PATH must point to an exported model for the onnx backend")
+
+        options = ort.SessionOptions()
+        if self.num_threads > 0:
+            options.intra_op_num_threads = self.num_threads
+        self._session = ort.InferenceSession(
+            self.onnx_model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+        logger.info(f"Loaded onnx embedding backend ({self.onnx_model_path})")
+
+    def _encode_batch(self, texts: List[str]) -> List[List[float]]:
+        """Encode one batch of texts into normalized vectors."""
+        if self.backend == "torch":
+            vectors = self._model.encode(
+                texts,
+                batch_size=len(texts),
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            return vectors.tolist()
+
+        import numpy as np
+
+        encoded = self._tokenizer(
+            texts, padding=True, truncation=True, max_length=256, return_tensors="np")
+        input_names = {i.name for i in self._session.get_inputs()}
+        feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in input_names}
+        token_embeddings = self._session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalize (as sentence-transformers does)
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in length-bucketed batches, preserving input order."""
+        if not texts:
+            return []
+
+        start = time.perf_counter()
+        # Match the newline handling of the previous langchain embedder so
+        # vectors stay comparable with already-indexed chunks
+        texts = [text.replace("\n", " ") for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+
+        for i in range(0, len(order), self.batch_size):
+            batch_indices = order[i:i + self.batch_size]
+            batch_vectors = self._encode_batch([texts[j] for j in batch_indices])
+            for j, vector in zip(batch_indices, batch_vectors):
+                vectors[j] = vector
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._texts_embedded += len(texts)
+            self._seconds_spent += elapsed
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query."""
+        return self.embed_documents([text])[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cumulative embedding throughput."""
+        with self._stats_lock:
+            texts = self._texts_embedded
+            seconds = self._seconds_spent
+        return {
+            "backend": self.backend,
+            "batch_size": self.batch_size,
+            "texts_embedded": texts,
+            "seconds": round(seconds, 2),
+            "chunks_per_second": round(texts / seconds, 1) if seconds > 0 else 0.0,
+        }
+
+
+def quantize_onnx_model(model_path: str, output_path: str) -> None:
+    """Write a dynamically int8-quantized copy of an exported ONNX model."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    logger.info(f"Wrote int8-quantized model to {output_path}")
+
+
+def create_embedding_engine() -> EmbeddingEngine:
+    """Build the engine configured in settings."""
+    return EmbeddingEngine(
+        backend=settings.embedding_backend,
+        batch_size=settings.embedding_batch_size,
+        num_threads=settings.embedding_threads,
+        onnx_model_path=settings.embedding_onnx_path or None,
+    )
+
+
+class QueryEmbeddingBatcher:
+    """
+    Groups concurrent query embeddings into a single forward pass.
+
+    The first query in a window starts a short timer; every query that
+    arrives before it fires (or until `max_batch` is reached) is embedded
+    in the same `embed_documents` call on a worker thread, and each caller
+    gets its own vector back. Must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        max_batch: int = 16,
+        max_wait_ms: float = 5.0
+    ):
+        self._embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Running batches; the event loop only keeps weak references to tasks
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._stats = {"queries": 0, "batches": 0, "max_batch_size": 0}
+        self._size_histogram = {"1": 0, "2-4": 0, "5-8": 0, "9-16": 0, "17+": 0}
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one query, sharing a forward pass with concurrent callers."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task) -> None:
+        self._batch_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Query embedding batch failed: {str(task.exception())}")
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Identical concurrent queries share one row of the batch
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        self._record(len(batch), len(unique_texts))
+
+        try:
+            vectors = await asyncio.to_thread(self._embed_fn, unique_texts)
+            by_text = dict(zip(unique_texts, vectors))
+            results = [(future, by_text[text]) for text, future in batch]
+        except BaseException as e:
+            # Every caller hears about the failure (logged once by `_batch_done`)
+            for _, future in batch:
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            raise
+
+        for future, vector in results:
+            # Callers may have been cancelled while the batch was running
+            if not future.done():
+                future.set_result(vector)
+
+    def _record(self, queries: int, batch_size: int) -> None:
+        self._stats["queries"] += queries
+        self._stats["batches"] += 1
+        self._stats["max_batch_size"] = max(self._stats["max_batch_size"], batch_size)
+        if batch_size == 1:
+            bucket = "1"
+        elif batch_size <= 4:
+            bucket = "2-4"
+        elif batch_size <= 8:
+            bucket = "5-8"
+        elif batch_size <= 16:
+            bucket = "9-16"
+        else:
+            bucket = "17+"
+        self._size_histogram[bucket] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batch-size metrics."""
+        batches = self._stats["batches"]
+        return {
+            **self._stats,
+            "avg_queries_per_batch": round(self._stats["queries"] / batches, 2) if batches else 0.0,
+            "batch_size_histogram": dict(self._size_histogram),
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
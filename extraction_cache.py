@@ -0,0 +1,67 @@
+from typing import Dict, Any, List, Optional
+import os
+import gzip
+import json
+import hashlib
+import logging
+
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump when the extraction output format changes to invalidate old entries
+CACHE_FORMAT_VERSION = 1
+
+
+class ExtractionCache:
+    """On-disk, gzip-compressed cache of per-page PDF text."""
+
+    def __init__(self, cache_dir: Optional[str] = None, enabled: bool = True):
+        self.cache_dir = cache_dir or settings.extraction_cache_dir
+        self.enabled = enabled
+
+    def make_key(self, file_hash: str, options: Dict[str, Any]) -> str:
+        """
+        Build a cache key from the file's content hash and extraction options.
+
+        Any option that changes the extracted text (DPI, grayscale, OCR
+        language, ...) must be part of `options`.
+        """
+        payload = json.dumps(
+            {"file": file_hash, "options": options, "v": CACHE_FORMAT_VERSION},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Return cached page texts, or None on a miss."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)["pages"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable extraction cache entry {path}: {str(e)}")
+            return None
+
+    def put(self, key: str, pages: List[str]) -> None:
+        """Store page texts atomically; failures are logged, not raised."""
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump({"pages": pages}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write extraction cache entry {path}: {str(e)}")
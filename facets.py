@@ -0,0 +1,212 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import re
+
+# Subject codes as students name their files, first match wins. Each entry
+# is (subject, file name pattern, content keywords for unlabeled files).
+SUBJECTS: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ("chemistry", r"\bchem", ("electrochemistry", "polymer", "corrosion", "spectroscopy", "electrode")),
+    ("environment", r"ecosy|pollution|renewable|solid waste",
+     ("ecosystem", "pollution", "biodiversity", "renewable energy", "solid waste")),
+    ("dbms", r"\bdbms\b|database", ("relational", "sql", "normalization", "er diagram", "transaction")),
+    ("oops", r"\boops?\b", ("inheritance", "polymorphism", "encapsulation", "constructor", "java")),
+    ("dos", r"\bd\s?\.?o\s?\.?s\b", ()),
+    ("os", r"\bos\b", ("process scheduling", "deadlock", "semaphore", "paging", "kernel")),
+    ("ccn", r"\bccn\b", ("tcp", "routing", "osi model", "ethernet", "protocol")),
+    ("cmse", r"\bcm\s*&?\s*se\b|\bcmse\b", ()),
+    ("pmse", r"\bpm\s*&?\s*se\b|\bpmse\b", ("software engineering", "project management", "sdlc")),
+    ("se", r"\bse\b", ()),
+    ("co", r"\bco\b", ("instruction set", "cache memory", "pipelining", "alu", "addressing mode")),
+    ("iot", r"\biot\b", ("internet of things", "sensor", "actuator", "mqtt")),
+    ("es", r"\bes\b", ("embedded system", "microcontroller")),
+    ("em", r"\bem\b", ()),
+    ("dcf", r"\bdcf\b", ()),
+    ("design_of_structures", r"design of structures?|\bds\s*&\s*rcc\b|\brcc\b",
+     ("reinforced concrete", "rcc", "limit state", "beam", "column")),
+    ("data_structures", r"data structures?|\bds\b", ("linked list", "binary tree", "stack", "queue", "sorting")),
+    ("tos", r"\btos\b|theory of structure", ("bending moment", "shear force", "deflection", "truss")),
+    ("transport", r"\bte\b|\btre\b|transport", ("pavement", "highway", "traffic", "railway")),
+    ("survey", r"\bsurv|\badv\.? sur", ("levelling", "theodolite", "traverse", "total station")),
+    ("habitat", r"habitat", ()),
+    ("irrigation", r"irrigation", ("irrigation", "canal", "reservoir")),
+    ("town_planning", r"town planning", ("town planning", "zoning", "master plan")),
+    ("gt", r"\bgt\b", ()),
+    ("vtcc", r"\bvtcc\b", ()),
+    ("bccm", r"\bbccm\b", ()),
+]
+
+# (doc type, file name pattern), first match wins; everything else is "notes"
+DOC_TYPES: List[Tuple[str, str]] = [
+    ("answer_key", r"\bkey\b|solved"),
+    ("question_bank", r"\bqb\b|questions\b|\bq\s*&\s*a\b"),
+    ("question_paper", r"\bqp\b|question paper"),
+]
+
+_ROMAN = {"i": 1, "ii": 2, "iii": 3, "iv": 4, "v": 5, "vi": 6}
+_MODULE_NUMBER = r"(?:vi|v|iv|iii|ii|i|\d)"
+# "-" and "to" join a range, the rest a list: "1-4", "3&4", "i, ii and iii".
+# A "-" not followed by a larger number is a copy/part suffix ("module 4-1").
+_MODULE_SEPARATOR = r"\s*(?:,|&|\band\b|\bto\b|-)\s*"
+_MODULE_RE = re.compile(
+    rf"\b(?:m[o0]dules?|mods?|units?|m)\s*[-:]?\s*"
+    rf"({_MODULE_NUMBER}(?:{_MODULE_SEPARATOR}{_MODULE_NUMBER})*)\b")
+# A bare list in a file name, e.g. "dbms 2,3,4"
+_MODULE_LIST_RE = re.compile(r"\b(\d(?:\s*[,&]\s*\d)+)\b")
+_ORDINAL_MODULE_RE = re.compile(r"\b(\d)(?:st|nd|rd|th)\s+module\b")
+_QUESTION_PAPER_RE = re.compile(r"answer (?:any|all)\b|max(?:imum)?\.? marks")
+
+# Leading text of a document inspected for content-based facets
+CONTENT_SAMPLE_CHARS = 5000
+# Keyword hits needed before a subject is inferred from content
+MIN_SUBJECT_KEYWORD_HITS = 3
+
+
+def _normalize_name(filename: str, keep_hyphens: bool = False) -> str:
+    name = re.sub(r"\.pdf$", "", filename.lower())
+    return re.sub(r"[_\[\]]+" if keep_hyphens else r"[_\-\[\]]+", " ", name)
+
+
+def _module_number(value: str) -> int:
+    return int(value) if value.isdigit() else _ROMAN[value]
+
+
+def _expand_modules(spec: str) -> List[int]:
+    parts = re.split(r"\s*(,|&|\band\b|\bto\b|-)\s*", spec)
+    modules = [_module_number(parts[0])]
+    for separator, value in zip(parts[1::2], parts[2::2]):
+        number = _module_number(value)
+        if separator in ("-", "to"):
+            if number <= modules[-1]:
+                break
+            modules.extend(range(modules[-1] + 1, number + 1))
+        else:
+            modules.append(number)
+    return sorted(set(modules))
+
+
+def _parse_modules(text: str, bare_lists: bool = False) -> List[int]:
+    match = _MODULE_RE.search(text) or _ORDINAL_MODULE_RE.search(text)
+    if not match and bare_lists:
+        match = _MODULE_LIST_RE.search(text)
+    return _expand_modules(match.group(1)) if match else []
+
+
+def _module_flag(module: int) -> str:
+    return f"module_{module}"
+
+
+def _modules_of(metadata: Dict[str, Any]) -> List[Any]:
+    flagged = [
+        int(key[len("module_"):]) for key, value in metadata.items()
+        if key.startswith("module_") and value is True
+    ]
+    if flagged:
+        return sorted(flagged)
+    return [metadata["module"]] if metadata.get("module") is not None else []
+
+
+def _subject_from_content(sample: str) -> Optional[str]:
+    best, best_hits = None, 0
+    for subject, _, keywords in SUBJECTS:
+        hits = sum(sample.count(keyword) for keyword in keywords)
+        if hits > best_hits:
+            best, best_hits = subject, hits
+    return best if best_hits >= MIN_SUBJECT_KEYWORD_HITS else None
+
+
+def derive_facets(filename: str, text: str = "") -> Dict[str, Any]:
+    """
+    Derive search facets for a document from its file name and contents.
+
+    The file name is trusted first; the opening text is only used when the
+    name says nothing (e.g. "MODULE 3.pdf").
+
+    A file covering several modules ("m3&4", "module 1-4") gets its first
+    module as `module` plus a `module_<n>: True` flag for each one, since
+    ChromaDB metadata can't hold lists.
+
+    Returns:
+        Dict with `doc_type` and, when known, `subject`, `module` and the
+        module flags. Unknown facets are omitted because ChromaDB metadata
+        can't hold None.
+    """
+    name = _normalize_name(filename)
+    sample = text[:CONTENT_SAMPLE_CHARS].lower()
+    facets: Dict[str, Any] = {}
+
+    subject = next(
+        (subject for subject, pattern, _ in SUBJECTS if re.search(pattern, name)),
+        None
+    ) or _subject_from_content(sample)
+    if subject:
+        facets["subject"] = subject
+
+    modules = _parse_modules(_normalize_name(filename, keep_hyphens=True), bare_lists=True)
+    if not modules:
+        modules = _parse_modules(sample)[:1]
+    if modules:
+        facets["module"] = modules[0]
+        facets.update((_module_flag(module), True) for module in modules)
+
+    doc_type = next(
+        (doc_type for doc_type, pattern in DOC_TYPES if re.search(pattern, name)),
+        None
+    )
+    if doc_type is None:
+        doc_type = "question_paper" if _QUESTION_PAPER_RE.search(sample) else "notes"
+    facets["doc_type"] = doc_type
+
+    return facets
+
+
+def facet_filter(
+    subject: Optional[str] = None,
+    module: Optional[int] = None,
+    doc_type: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Build a ChromaDB `where` filter for a facet scope (None if unscoped)."""
+    conditions: List[Dict[str, Any]] = [
+        {key: value}
+        for key, value in (("subject", subject), ("doc_type", doc_type))
+        if value is not None
+    ]
+    if module is not None:
+        # `module` alone still matches chunks ingested before the flags
+        conditions.append({"$or": [{"module": module}, {_module_flag(module): True}]})
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def count_facets(metadatas: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Count documents and chunks per facet value.
+
+    Returns:
+        Dict mapping each facet name to a list of
+        {"value", "documents", "chunks"}, most documents first
+    """
+    chunks: Dict[str, Dict[Any, int]] = {"subject": {}, "module": {}, "doc_type": {}}
+    sources: Dict[str, Dict[Any, set]] = {"subject": {}, "module": {}, "doc_type": {}}
+
+    for metadata in metadatas:
+        for facet in chunks:
+            if facet == "module":
+                values = _modules_of(metadata)
+            else:
+                values = [metadata[facet]] if metadata.get(facet) is not None else []
+            for value in values:
+                chunks[facet][value] = chunks[facet].get(value, 0) + 1
+                sources[facet].setdefault(value, set()).add(metadata.get("source"))
+
+    return {
+        facet: sorted(
+            (
+                {"value": value, "documents": len(sources[facet][value]), "chunks": count}
+                for value, count in counts.items()
+            ),
+            key=lambda item: (-item["documents"], str(item["value"]))
+        )
+        for facet, counts in chunks.items()
+    }
@@ -1,11 +1,13 @@
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 import logging
+import re
 from datetime import datetime
 import uuid
 import asyncio
 
 from firebase_admin import firestore
 from config import settings
+from conversation_cache import conversation_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,11 +17,347 @@ db = firestore.client()
 
 CONVERSATIONS_COLLECTION = "conversations"
 MESSAGES_COLLECTION = "messages"
+DELETE_JOBS_COLLECTION = "delete_jobs"
+# Characters of the latest message kept on the conversation for listings
+LAST_MESSAGE_PREVIEW_CHARS = 100
+# Maximum writes in one Firestore batch
+BATCH_WRITE_LIMIT = 500
+
+# Longest title-word prefix indexed for search
+TITLE_TOKEN_MAX_PREFIX = 20
+# Pages scanned per search request when extra query words filter results out
+MAX_SEARCH_PAGES = 5
+
+
+def title_tokens(title: str) -> List[str]:
+    """
+    Index terms for a title: every prefix of every word, lowercased.
+
+    Stored as the `title_tokens` array so search can run as a server-side
+    `array_contains` query and still match partially typed words.
+    """
+    tokens = set()
+    for word in re.findall(r"\w+", title.lower()):
+        word = word[:TITLE_TOKEN_MAX_PREFIX]
+        tokens.update(word[:end] for end in range(1, len(word) + 1))
+    return sorted(tokens)
+
+
+def _search_terms(search_query: str) -> List[str]:
+    return [
+        word[:TITLE_TOKEN_MAX_PREFIX]
+        for word in re.findall(r"\w+", search_query.lower())
+    ]
+
+
+def _conversation_summary(conv_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a listing entry from a conversation document."""
+    return {
+        "conversation_id": conv_data["id"],
+        "title": conv_data.get("title", "Conversation"),
+        "last_message": conv_data.get("last_message", ""),
+        "message_count": conv_data.get("message_count", 0),
+        "created_at": conv_data.get("created_at"),
+        "updated_at": conv_data.get("updated_at"),
+        "prompt_type": conv_data.get("prompt_type", "explanation"),
+        "is_temporary": conv_data.get("is_temporary", False),
+    }
+
+
+def _backfill_conversation_fields(user_id: str, conversations: List[Dict[str, Any]]) -> None:
+    """
+    Fill in denormalized fields for conversations written before they existed.
+
+    `last_message` costs one extra query per legacy conversation and
+    `title_tokens` is computed locally; both are stored the first time the
+    conversation is listed, so later listings stay single-query and the
+    conversation becomes searchable.
+    """
+    for conv_data in conversations:
+        updates: Dict[str, Any] = {}
+        conv_ref = (
+            db.collection("users")
+            .document(user_id)
+            .collection(CONVERSATIONS_COLLECTION)
+            .document(conv_data["id"])
+        )
+
+        if "last_message" not in conv_data and conv_data.get("message_count"):
+            last_msg_docs = (
+                conv_ref.collection(MESSAGES_COLLECTION)
+                .order_by("timestamp", direction=firestore.Query.DESCENDING)
+                .limit(1)
+                .stream()
+            )
+            for msg_doc in last_msg_docs:
+                msg_data = msg_doc.to_dict()
+                updates["last_message"] = msg_data.get("content", "")[:LAST_MESSAGE_PREVIEW_CHARS]
+                updates["last_message_at"] = msg_data.get("timestamp")
+
+        if "title_tokens" not in conv_data:
+            updates["title_tokens"] = title_tokens(conv_data.get("title", ""))
+
+        if updates:
+            conv_data.update(updates)
+            conv_ref.update(updates)
+
+
+def _delete_job_ref(user_id: str, job_id: str):
+    return (
+        db.collection("users")
+        .document(user_id)
+        .collection(DELETE_JOBS_COLLECTION)
+        .document(job_id)
+    )
+
+
+def _delete_conversation_tree(user_id: str, conversation_id: str) -> int:
+    """
+    Delete a conversation document and its messages.
+
+    Messages are deleted in batches of up to BATCH_WRITE_LIMIT, or through
+    a BulkWriter (parallel, automatically throttled) when
+    `firestore_use_bulk_writer` is set. Only document references are read.
+
+    Returns:
+        Number of messages deleted
+    """
+    conv_ref = (
+        db.collection("users")
+        .document(user_id)
+        .collection(CONVERSATIONS_COLLECTION)
+        .document(conversation_id)
+    )
+    messages_ref = conv_ref.collection(MESSAGES_COLLECTION)
+    deleted = 0
+
+    if settings.firestore_use_bulk_writer:
+        bulk_writer = db.bulk_writer()
+        for doc_ref in messages_ref.list_documents(page_size=BATCH_WRITE_LIMIT):
+            bulk_writer.delete(doc_ref)
+            deleted += 1
+        bulk_writer.delete(conv_ref)
+        bulk_writer.close()
+        return deleted
+
+    while True:
+        # select([]) fetches references only, not message contents
+        docs = list(messages_ref.select([]).limit(BATCH_WRITE_LIMIT).stream())
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        if len(docs) < BATCH_WRITE_LIMIT:
+            # Last page: the conversation is deleted in the same batch
+            batch.delete(conv_ref)
+            batch.commit()
+            return deleted + len(docs)
+        batch.commit()
+        deleted += len(docs)
+
+
+class TurnWriteBatch:
+    """
+    Unit of work collecting every Firestore write of one chat turn.
+
+    The conversation upsert, the turn's messages and (for new
+    conversations) the generated title are buffered in memory and written
+    with a single WriteBatch commit instead of one RPC each.
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        conversation_id: str,
+        exists: bool,
+        prompt_type: str = "explanation",
+        is_temporary: bool = False,
+        version: int = 0,
+        summary: str = "",
+        summary_message_count: int = 0
+    ):
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.exists = exists
+        # The conversation's message_count as last seen by this turn
+        self.version = version
+        # Rolling summary of the oldest `summary_message_count` messages
+        self.summary = summary
+        self.summary_message_count = summary_message_count
+        self.prompt_type = prompt_type
+        self.is_temporary = is_temporary
+        self._messages: List[Dict[str, Any]] = []
+        self._title: Optional[str] = None
+        self._touched = True
+        self._commit_lock = asyncio.Lock()
+
+    def add_message(
+        self,
+        role: str,
+        content: str,
+        sources: Optional[List[Dict]] = None
+    ) -> str:
+        """Buffer a message; returns its ID."""
+        message_id = str(uuid.uuid4())
+        self._messages.append({
+            "id": message_id,
+            "role": role,
+            "content": content,
+            "sources": sources or [],
+            "timestamp": datetime.utcnow(),
+        })
+        return message_id
+
+    def set_title(self, title: str) -> None:
+        """Buffer a conversation title."""
+        self._title = title
+
+    @property
+    def has_title(self) -> bool:
+        return self._title is not None
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._messages) or self._title is not None or self._touched
+
+    async def commit(self) -> None:
+        """
+        Write everything buffered so far in one batch.
+
+        Commits run one at a time, so the first creates the conversation
+        before a later one (a title, a retry) updates it. Buffered writes
+        are taken before the RPC, so repeated commits never write a message
+        twice; on failure they are put back so a retry writes them again.
+        """
+        async with self._commit_lock:
+            await self._commit_pending()
+
+    async def _commit_pending(self) -> None:
+        if not self.pending:
+            return
+        messages, self._messages = self._messages, []
+        title, self._title = self._title, None
+        touched, self._touched = self._touched, False
+
+        def _commit():
+            conv_ref = (
+                db.collection("users")
+                .document(self.user_id)
+                .collection(CONVERSATIONS_COLLECTION)
+                .document(self.conversation_id)
+            )
+            now = datetime.utcnow()
+            batch = db.batch()
+
+            for message in messages:
+                batch.set(
+                    conv_ref.collection(MESSAGES_COLLECTION).document(message["id"]),
+                    message
+                )
+
+            conv_update: Dict[str, Any] = {
+                "updated_at": now,
+                "prompt_type": self.prompt_type,
+                "is_temporary": self.is_temporary,
+            }
+            if messages:
+                conv_update["last_message"] = messages[-1]["content"][:LAST_MESSAGE_PREVIEW_CHARS]
+                conv_update["last_message_at"] = messages[-1]["timestamp"]
+            if title is not None:
+                conv_update["title"] = title
+                conv_update["title_tokens"] = title_tokens(title)
+
+            if self.exists:
+                if messages:
+                    conv_update["message_count"] = firestore.Increment(len(messages))
+                batch.update(conv_ref, conv_update)
+            else:
+                batch.set(conv_ref, {
+                    "id": self.conversation_id,
+                    "user_id": self.user_id,
+                    # Placeholder until a title is generated from the first answer
+                    "title": "New Conversation",
+                    "title_tokens": title_tokens("New Conversation"),
+                    "created_at": now,
+                    "message_count": len(messages),
+                    "last_message": "",
+                    "last_message_at": None,
+                    **conv_update,
+                })
+
+            batch.commit()
+
+        try:
+            await asyncio.to_thread(_commit)
+        except Exception:
+            self._messages = messages + self._messages
+            if self._title is None:
+                self._title = title
+            self._touched = self._touched or touched
+            raise
+
+        self.exists = True
+        conversation_cache.record_write(
+            self.user_id, self.conversation_id, self.version, messages,
+            title, self.prompt_type)
+        self.version += len(messages)
+        logger.info(
+            f"Committed {len(messages)} message(s) to conversation {self.conversation_id}")
 
 
 class FirestoreDB:
     """Firestore database operations for chat history and conversations."""
 
+    @staticmethod
+    async def begin_turn(
+        user_id: str,
+        conversation_id: Optional[str] = None,
+        prompt_type: str = "explanation",
+        is_temporary: bool = False
+    ) -> TurnWriteBatch:
+        """
+        Start a unit of work for one chat turn.
+
+        Looks the conversation up (no read at all for new conversations, or
+        for conversations this worker wrote within the conversation cache's
+        trust window); an unknown ID starts a new conversation, as
+        `get_or_create_conversation` does. Nothing is written until
+        `TurnWriteBatch.commit`.
+        """
+        try:
+            if conversation_id:
+                conv_data = conversation_cache.lookup(user_id, conversation_id)
+                if conv_data is None:
+                    def _get_conversation() -> Optional[Dict[str, Any]]:
+                        conv_doc = (
+                            db.collection("users")
+                            .document(user_id)
+                            .collection(CONVERSATIONS_COLLECTION)
+                            .document(conversation_id)
+                            .get()
+                        )
+                        if not conv_doc.exists:
+                            return None
+                        conv_data = conv_doc.to_dict()
+                        conv_data["version"] = conv_data.get("message_count", 0)
+                        return conv_data
+
+                    conv_data = await asyncio.to_thread(_get_conversation)
+                    conversation_cache.verify(
+                        user_id, conversation_id,
+                        conv_data["version"] if conv_data else None, conv_data)
+
+                if conv_data is not None:
+                    return TurnWriteBatch(
+                        user_id, conversation_id, True, prompt_type, is_temporary,
+                        version=conv_data["version"],
+                        summary=conv_data.get("summary") or "",
+                        summary_message_count=conv_data.get("summary_message_count") or 0)
+            return TurnWriteBatch(
+                user_id, str(uuid.uuid4()), False, prompt_type, is_temporary)
+        except Exception as e:
+            logger.error(f"Error starting conversation turn: {str(e)}")
+            raise
+
     @staticmethod
     async def create_conversation(
         user_id: str,
@@ -36,11 +374,14 @@ class FirestoreDB:
             "id": conversation_id,
             "user_id": user_id,
             "title": title,
+            "title_tokens": title_tokens(title),
             "prompt_type": prompt_type,
             "is_temporary": is_temporary,
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow(),
             "message_count": 0,
+            "last_message": "",
+            "last_message_at": None,
         }
 
         try:
@@ -67,40 +408,52 @@ class FirestoreDB:
         content: str,
         sources: Optional[List[Dict]] = None
     ) -> str:
-        """Save a message to a conversation."""
+        """
+        Save a message to a conversation.
+
+        The message and the conversation's counters and last-message
+        preview are written in one batch, so listings never need to read
+        the messages subcollection.
+        """
         message_id = str(uuid.uuid4())
+        timestamp = datetime.utcnow()
 
         message_data = {
             "id": message_id,
             "role": role,
             "content": content,
             "sources": sources or [],
-            "timestamp": datetime.utcnow(),
+            "timestamp": timestamp,
         }
 
         try:
             # Wrap synchronous Firestore operations in thread
             def _save_msg():
-                # Store in: users/{user_id}/conversations/{conversation_id}/messages/{message_id}
-                db.collection("users").document(user_id).collection(
-                    CONVERSATIONS_COLLECTION
-                ).document(conversation_id).collection(MESSAGES_COLLECTION).document(
-                    message_id
-                ).set(message_data)
-
-                # Update conversation's updated_at and message_count
                 conversation_ref = (
                     db.collection("users")
                     .document(user_id)
                     .collection(CONVERSATIONS_COLLECTION)
                     .document(conversation_id)
                 )
-                conversation_ref.update({
-                    "updated_at": datetime.utcnow(),
+
+                batch = db.batch()
+                # Store in: users/{user_id}/conversations/{conversation_id}/messages/{message_id}
+                batch.set(
+                    conversation_ref.collection(MESSAGES_COLLECTION).document(message_id),
+                    message_data
+                )
+                # Update conversation's updated_at, message_count and preview
+                batch.update(conversation_ref, {
+                    "updated_at": timestamp,
                     "message_count": firestore.Increment(1),
+                    "last_message": content[:LAST_MESSAGE_PREVIEW_CHARS],
+                    "last_message_at": timestamp,
                 })
+                batch.commit()
             
             await asyncio.to_thread(_save_msg)
+            # Message written outside a turn; this worker's copy is behind
+            conversation_cache.invalidate(user_id, conversation_id)
 
             logger.info(
                 f"Saved message {message_id} to conversation {conversation_id}")
@@ -113,9 +466,34 @@ class FirestoreDB:
     async def get_conversation_messages(
         user_id: str,
         conversation_id: str,
-        limit: int = 100
+        limit: int = 100,
+        version: Optional[int] = None,
+        tail: bool = False,
+        offset: int = 0
     ) -> List[Dict[str, Any]]:
-        """Get all messages in a conversation."""
+        """
+        Get messages in a conversation, oldest first.
+
+        Args:
+            limit: Maximum number of messages
+            version: The conversation's `message_count` as verified by
+                `begin_turn`; lets the conversation cache answer the read
+            tail: Return the latest `limit` messages instead of the first
+            offset: Skip this many of the oldest messages (not with `tail`)
+        """
+        if version is not None:
+            if offset:
+                # Messages past `offset` are the latest `version - offset`
+                cached = conversation_cache.get_messages(
+                    user_id, conversation_id, version - offset, version, tail=True)
+                if cached is not None:
+                    return cached[:limit]
+            else:
+                cached = conversation_cache.get_messages(
+                    user_id, conversation_id, limit, version, tail)
+                if cached is not None:
+                    return cached
+
         try:
             # Wrap synchronous Firestore operations in thread
             def _get_messages():
@@ -125,14 +503,27 @@ class FirestoreDB:
                     .collection(CONVERSATIONS_COLLECTION)
                     .document(conversation_id)
                     .collection(MESSAGES_COLLECTION)
-                    .order_by("timestamp")
-                    .limit(limit)
+                    .order_by(
+                        "timestamp",
+                        direction=firestore.Query.DESCENDING if tail else firestore.Query.ASCENDING)
                 )
+                if offset:
+                    messages_ref = messages_ref.offset(offset)
+                messages_ref = messages_ref.limit(limit)
 
                 docs = messages_ref.stream()
                 return [doc.to_dict() for doc in docs]
             
             messages = await asyncio.to_thread(_get_messages)
+            if tail:
+                # Tail reads run newest first
+                messages.reverse()
+
+            if tail and version is not None:
+                conversation_cache.put(user_id, conversation_id, version, messages)
+            elif len(messages) < limit and not offset:
+                # The whole conversation was read
+                conversation_cache.put(user_id, conversation_id, len(messages), messages)
 
             logger.info(
                 f"Retrieved {len(messages)} messages from conversation {conversation_id}")
@@ -141,12 +532,36 @@ class FirestoreDB:
             logger.error(f"Error retrieving messages: {str(e)}")
             return []
 
+    @staticmethod
+    def _after_cursor(query, conversations_ref, cursor: Optional[str]):
+        """Continue `query` after the conversation ID given as cursor."""
+        if not cursor:
+            return query
+        cursor_doc = conversations_ref.document(cursor).get()
+        if not cursor_doc.exists:
+            raise ValueError("Invalid or expired cursor")
+        return query.start_after(cursor_doc)
+
     @staticmethod
     async def get_user_conversations(
         user_id: str,
-        limit: int = 20
-    ) -> List[Dict[str, Any]]:
-        """Get all conversations for a user."""
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get one page of a user's conversations, most recently updated first.
+
+        Args:
+            user_id: Owner of the conversations
+            limit: Page size
+            cursor: `next_cursor` from the previous page, if any
+
+        Returns:
+            Dict with `conversations` and `next_cursor` (None on the last page)
+
+        Raises:
+            ValueError: If the cursor does not point at a conversation
+        """
         try:
             # Wrap synchronous Firestore operations in thread
             def _get_conversations():
@@ -154,53 +569,29 @@ class FirestoreDB:
                     db.collection("users")
                     .document(user_id)
                     .collection(CONVERSATIONS_COLLECTION)
-                    .order_by("updated_at", direction=firestore.Query.DESCENDING)
-                    .limit(limit)
                 )
+                query = conversations_ref.order_by(
+                    "updated_at", direction=firestore.Query.DESCENDING)
+                query = FirestoreDB._after_cursor(query, conversations_ref, cursor)
 
-                docs = conversations_ref.stream()
-                conversations = []
-
-                for doc in docs:
-                    conv_data = doc.to_dict()
-                    # Get last message
-                    messages_ref = (
-                        db.collection("users")
-                        .document(user_id)
-                        .collection(CONVERSATIONS_COLLECTION)
-                        .document(conv_data["id"])
-                        .collection(MESSAGES_COLLECTION)
-                        .order_by("timestamp", direction=firestore.Query.DESCENDING)
-                        .limit(1)
-                    )
-
-                    last_msg_docs = messages_ref.stream()
-                    last_message = ""
-
-                    for msg_doc in last_msg_docs:
-                        last_message = msg_doc.to_dict().get("content", "")[:100]
-
-                    conversations.append({
-                        "conversation_id": conv_data["id"],
-                        "title": conv_data.get("title", "Conversation"),
-                        "last_message": last_message,
-                        "message_count": conv_data.get("message_count", 0),
-                        "created_at": conv_data.get("created_at"),
-                        "updated_at": conv_data.get("updated_at"),
-                        "prompt_type": conv_data.get("prompt_type", "explanation"),
-                        "is_temporary": conv_data.get("is_temporary", False),
-                    })
-
-                return conversations
+                # The last-message preview is stored on each conversation
+                all_convs = [doc.to_dict() for doc in query.limit(limit).stream()]
+                _backfill_conversation_fields(user_id, all_convs)
+                return {
+                    "conversations": [_conversation_summary(conv) for conv in all_convs],
+                    "next_cursor": all_convs[-1]["id"] if len(all_convs) == limit else None,
+                }
             
-            conversations = await asyncio.to_thread(_get_conversations)
+            page = await asyncio.to_thread(_get_conversations)
 
             logger.info(
-                f"Retrieved {len(conversations)} conversations for user {user_id}")
-            return conversations
+                f"Retrieved {len(page['conversations'])} conversations for user {user_id}")
+            return page
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving conversations: {str(e)}")
-            return []
+            return {"conversations": [], "next_cursor": None}
 
     @staticmethod
     async def get_or_create_conversation(
@@ -242,11 +633,14 @@ class FirestoreDB:
                     "id": new_conv_id,
                     "user_id": user_id,
                     "title": title,
+                    "title_tokens": title_tokens(title),
                     "prompt_type": prompt_type,
                     "is_temporary": is_temporary,
                     "created_at": datetime.utcnow(),
                     "updated_at": datetime.utcnow(),
                     "message_count": 0,
+                    "last_message": "",
+                    "last_message_at": None,
                 }
                 
                 db.collection("users").document(user_id).collection(
@@ -270,23 +664,9 @@ class FirestoreDB:
         """Delete a conversation and all its messages."""
         try:
             # Wrap synchronous Firestore operations in thread
-            def _delete():
-                conv_ref = (
-                    db.collection("users")
-                    .document(user_id)
-                    .collection(CONVERSATIONS_COLLECTION)
-                    .document(conversation_id)
-                )
-
-                # Delete all messages first
-                messages_ref = conv_ref.collection(MESSAGES_COLLECTION)
-                for doc in messages_ref.stream():
-                    doc.reference.delete()
-
-                # Delete the conversation
-                conv_ref.delete()
-            
-            await asyncio.to_thread(_delete)
+            await asyncio.to_thread(
+                _delete_conversation_tree, user_id, conversation_id)
+            conversation_cache.invalidate(user_id, conversation_id)
 
             logger.info(
                 f"Deleted conversation {conversation_id} for user {user_id}")
@@ -295,12 +675,143 @@ class FirestoreDB:
             logger.error(f"Error deleting conversation: {str(e)}")
             return False
 
+    @staticmethod
+    async def list_conversation_ids(
+        user_id: str,
+        temporary_only: bool = False
+    ) -> List[str]:
+        """List a user's conversation IDs, optionally only temporary ones."""
+        try:
+            def _list_ids():
+                conversations_ref = (
+                    db.collection("users")
+                    .document(user_id)
+                    .collection(CONVERSATIONS_COLLECTION)
+                )
+                if temporary_only:
+                    conversations_ref = conversations_ref.where(
+                        "is_temporary", "==", True)
+                return [doc.id for doc in conversations_ref.select([]).stream()]
+
+            return await asyncio.to_thread(_list_ids)
+        except Exception as e:
+            logger.error(f"Error listing conversations: {str(e)}")
+            raise
+
+    @staticmethod
+    async def delete_conversations(
+        user_id: str,
+        conversation_ids: List[str],
+        on_progress: Optional[Callable[[str, bool], None]] = None
+    ) -> int:
+        """
+        Delete several conversations one after another.
+
+        Args:
+            user_id: Owner of the conversations
+            conversation_ids: Conversations to delete
+            on_progress: Called with (conversation_id, succeeded) after each one
+
+        Returns:
+            Number of conversations deleted
+        """
+        deleted = 0
+        for conversation_id in conversation_ids:
+            try:
+                await asyncio.to_thread(
+                    _delete_conversation_tree, user_id, conversation_id)
+                deleted += 1
+                succeeded = True
+            except Exception as e:
+                logger.error(
+                    f"Error deleting conversation {conversation_id}: {str(e)}")
+                succeeded = False
+            conversation_cache.invalidate(user_id, conversation_id)
+            if on_progress is not None:
+                on_progress(conversation_id, succeeded)
+
+        logger.info(
+            f"Deleted {deleted}/{len(conversation_ids)} conversations for user {user_id}")
+        return deleted
+
+    @staticmethod
+    async def save_delete_job(user_id: str, job: Dict[str, Any]) -> None:
+        """Store a new bulk delete job under `users/{uid}/delete_jobs`."""
+        await asyncio.to_thread(_delete_job_ref(user_id, job["job_id"]).set, job)
+
+    @staticmethod
+    async def update_delete_job(user_id: str, job_id: str, fields: Dict[str, Any]) -> None:
+        """Record a bulk delete job's progress."""
+        await asyncio.to_thread(_delete_job_ref(user_id, job_id).update, fields)
+
+    @staticmethod
+    async def get_delete_job(user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a bulk delete job (None if the user has no such job)."""
+        snapshot = await asyncio.to_thread(_delete_job_ref(user_id, job_id).get)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    @staticmethod
+    async def backfill_conversations(user_id: Optional[str] = None) -> int:
+        """
+        Fill in denormalized fields on every conversation that lacks them.
+
+        Listing and search only backfill the conversations they return, so
+        a legacy conversation no listing page has shown has no
+        `title_tokens` and can't be found by search. Run once after
+        upgrading (see backfill_conversations.py).
+
+        Args:
+            user_id: Only backfill this user's conversations
+
+        Returns:
+            Number of conversations updated
+        """
+        def _backfill():
+            users_ref = db.collection("users")
+            user_ids = [user_id] if user_id else [doc.id for doc in users_ref.list_documents()]
+            updated = 0
+            for uid in user_ids:
+                legacy = [
+                    conv for conv in (
+                        doc.to_dict()
+                        for doc in users_ref.document(uid).collection(CONVERSATIONS_COLLECTION).stream()
+                    )
+                    if "title_tokens" not in conv
+                    or ("last_message" not in conv and conv.get("message_count"))
+                ]
+                _backfill_conversation_fields(uid, legacy)
+                updated += len(legacy)
+                if legacy:
+                    logger.info(f"Backfilled {len(legacy)} conversation(s) for user {uid}")
+            return updated
+
+        return await asyncio.to_thread(_backfill)
+
     @staticmethod
     async def search_conversations(
         user_id: str,
-        search_query: str
-    ) -> List[Dict[str, Any]]:
-        """Search conversations by title or last message."""
+        search_query: str,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Search conversations whose title words start with every query word.
+
+        The longest query word runs server-side as an `array_contains`
+        query on `title_tokens`; other words are checked on the returned
+        page. Requires a composite index on (title_tokens, updated_at desc).
+
+        Returns:
+            Dict with `conversations` and `next_cursor` (None when exhausted)
+
+        Raises:
+            ValueError: If the cursor does not point at a conversation
+        """
+        terms = _search_terms(search_query)
+        if not terms:
+            return {"conversations": [], "next_cursor": None}
+        index_term = max(terms, key=len)
+
         try:
             # Wrap synchronous Firestore operations in thread
             def _search():
@@ -308,29 +819,50 @@ class FirestoreDB:
                     db.collection("users")
                     .document(user_id)
                     .collection(CONVERSATIONS_COLLECTION)
+                )
+                query = (
+                    conversations_ref
+                    .where("title_tokens", "array_contains", index_term)
                     .order_by("updated_at", direction=firestore.Query.DESCENDING)
                 )
 
-                all_convs = [doc.to_dict() for doc in conversations_ref.stream()]
+                matches: List[Dict[str, Any]] = []
+                last_scanned = None
+                exhausted = False
+                page_query = FirestoreDB._after_cursor(query, conversations_ref, cursor)
+                for _ in range(MAX_SEARCH_PAGES):
+                    page = list(page_query.limit(limit).stream())
+                    for doc in page:
+                        last_scanned = doc
+                        conv = doc.to_dict()
+                        tokens = set(conv.get("title_tokens", []))
+                        if all(term in tokens for term in terms):
+                            matches.append(conv)
+                            if len(matches) == limit:
+                                break
+                    else:
+                        # Whole page scanned; a short page means nothing is left
+                        exhausted = len(page) < limit
+                    if exhausted or len(matches) == limit:
+                        break
+                    page_query = query.start_after(last_scanned)
 
-                # Client-side filtering for title matching
-                search_lower = search_query.lower()
-                filtered = [
-                    conv
-                    for conv in all_convs
-                    if search_lower in conv.get("title", "").lower()
-                ]
-
-                return filtered[:20]  # Return top 20
+                _backfill_conversation_fields(user_id, matches)
+                return {
+                    "conversations": [_conversation_summary(conv) for conv in matches],
+                    "next_cursor": None if exhausted or last_scanned is None else last_scanned.id,
+                }
             
-            filtered = await asyncio.to_thread(_search)
+            result = await asyncio.to_thread(_search)
 
             logger.info(
-                f"Found {len(filtered)} conversations matching '{search_query}'")
-            return filtered
+                f"Found {len(result['conversations'])} conversations matching '{search_query}'")
+            return result
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error searching conversations: {str(e)}")
-            return []
+            return {"conversations": [], "next_cursor": None}
 
     @staticmethod
     async def update_conversation_title(
@@ -356,6 +888,7 @@ class FirestoreDB:
 
                 conv_ref.update({
                     "title": new_title,
+                    "title_tokens": title_tokens(new_title),
                     "updated_at": datetime.utcnow()
                 })
                 return True
@@ -363,6 +896,7 @@ class FirestoreDB:
             result = await asyncio.to_thread(_update)
             
             if result:
+                conversation_cache.update_metadata(user_id, conversation_id, title=new_title)
                 logger.info(
                     f"Updated conversation {conversation_id} title to '{new_title}'")
             return result
@@ -370,6 +904,47 @@ class FirestoreDB:
             logger.error(f"Error updating conversation title: {str(e)}")
             return False
 
+    @staticmethod
+    async def update_conversation_summary(
+        user_id: str,
+        conversation_id: str,
+        summary: str,
+        summary_message_count: int
+    ) -> None:
+        """
+        Store a conversation's rolling summary.
+
+        `updated_at` is left alone so summarizing doesn't reorder listings.
+
+        Args:
+            summary: Summary of the conversation's oldest messages
+            summary_message_count: How many messages the summary covers
+        """
+        try:
+            # Wrap synchronous Firestore operations in thread
+            def _update():
+                (
+                    db.collection("users")
+                    .document(user_id)
+                    .collection(CONVERSATIONS_COLLECTION)
+                    .document(conversation_id)
+                    .update({
+                        "summary": summary,
+                        "summary_message_count": summary_message_count,
+                    })
+                )
+
+            await asyncio.to_thread(_update)
+            conversation_cache.update_metadata(
+                user_id, conversation_id,
+                summary=summary, summary_message_count=summary_message_count)
+
+            logger.info(
+                f"Summarized {summary_message_count} messages of conversation {conversation_id}")
+        except Exception as e:
+            logger.error(f"Error updating conversation summary: {str(e)}")
+            raise
+
     @staticmethod
     async def add_message_feedback(
         user_id: str,
@@ -404,6 +979,8 @@ class FirestoreDB:
             result = await asyncio.to_thread(_add_feedback)
             
             if result:
+                # Cached messages don't carry feedback
+                conversation_cache.invalidate(user_id, conversation_id)
                 logger.info(f"Added feedback to message {message_id}: {feedback}")
             return result
         except Exception as e:
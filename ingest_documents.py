@@ -3,18 +3,32 @@ Ingest PDF documents from the knowledge folder into the vector store.
 Run this script to process and index all PDFs before starting the API.
 
 Usage:
-    python ingest_documents.py [--force]
+    python ingest_documents.py [--force | --sync] [--workers N]
     
+Without a flag, documents are added to the existing collection after a
+confirmation prompt; when stdin is not a terminal there is no prompt and
+an incremental --sync runs instead.
+
 Options:
     --force: Force reingestion of all documents (deletes existing collection)
+    --sync: Incremental, non-interactive sync. Only new or changed PDFs are
+            embedded; chunks of removed or changed PDFs are deleted
+    --workers N: Number of PDF processing worker processes
+                 (default: INGEST_WORKERS; 0 = one per CPU)
 """
 
 import asyncio
+import os
 import sys
 import time
 import logging
+from pathlib import Path
+from typing import Optional
 
+from bm25_index import default_index_path
+from config import settings
 from document_processor import document_processor
+from ingest_manifest import IngestManifest
 from vector_store import vector_store
 
 logging.basicConfig(
@@ -24,67 +38,155 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def ingest_documents(force: bool = False):
+def _log_summary(start_time: float) -> None:
+    """Log final collection stats and elapsed time."""
+    stats = vector_store.get_collection_stats()
+    time_taken = time.time() - start_time
+
+    logger.info("=" * 60)
+    logger.info("Document Ingestion Complete!")
+    logger.info("=" * 60)
+    logger.info(
+        f"Total documents in vector store: {stats['document_count']}")
+    logger.info(f"Time taken: {time_taken:.2f} seconds")
+    logger.info(f"Persist directory: {stats['persist_directory']}")
+    if vector_store.embeddings is not None:
+        embedding_stats = vector_store.embeddings.get_stats()
+        logger.info(
+            f"Embedding throughput: {embedding_stats['chunks_per_second']} chunks/s "
+            f"({embedding_stats['texts_embedded']} chunks in {embedding_stats['seconds']}s, "
+            f"{embedding_stats['backend']} backend)")
+    logger.info("=" * 60)
+
+
+async def ingest_documents(force: bool = False, workers: Optional[int] = None):
     """Ingest all PDF documents from the knowledge folder."""
     try:
         logger.info("Starting document ingestion...")
         start_time = time.time()
+        manifest = IngestManifest().load()
 
         # Check if we need to reingest
         if force:
             logger.info(
                 "Force reingestion requested - deleting existing collection...")
             vector_store.delete_collection()
+            manifest.clear()
         else:
             stats = vector_store.get_collection_stats()
             if stats["document_count"] > 0:
                 logger.info(
                     f"Vector store already contains {stats['document_count']} documents")
+                if not sys.stdin.isatty():
+                    # Nobody to ask (cron, CI, containers): only embed what changed
+                    logger.info("Non-interactive run - performing an incremental sync instead")
+                    await sync_documents(workers=workers)
+                    return
                 response = input(
                     "Do you want to continue and add more documents? (y/n): ")
                 if response.lower() != 'y':
                     logger.info("Ingestion cancelled")
                     return
 
-        # Process all PDFs in the knowledge directory
+        # Stream PDFs from the knowledge directory into the vector store one
+        # file at a time so memory does not grow with the corpus
         logger.info("Processing PDF documents...")
-        documents = document_processor.process_directory()
+        pdf_files = sorted(Path(settings.knowledge_dir).glob("*.pdf"))
+        total_chunks = 0
 
-        if not documents:
+        for pdf_path, docs, sha256 in document_processor.iter_files(pdf_files, workers):
+            if docs:
+                total_chunks += vector_store.add_documents(docs)
+            # Hashed once while processing, for the extraction cache too
+            manifest.record(pdf_path, sha256, len(docs))
+            manifest.save()
+
+        if total_chunks == 0:
             logger.error("No documents were processed successfully")
             return
 
-        logger.info(f"Processed {len(documents)} chunks from PDFs")
+        logger.info(f"Processed {total_chunks} chunks from PDFs")
+
+        vector_store.rebuild_bm25_index()
+        _log_summary(start_time)
+
+    except Exception as e:
+        logger.error(f"Error during ingestion: {str(e)}")
+        raise
+
+
+async def sync_documents(workers: Optional[int] = None):
+    """
+    Incrementally sync the knowledge folder with the vector store.
 
-        # Add to vector store
-        logger.info("Adding documents to vector store...")
-        vector_store.add_documents(documents)
+    Uses the ingest manifest to embed only new or changed PDFs and to delete
+    the chunks of PDFs that were changed or removed. Never prompts.
+    """
+    try:
+        logger.info("Starting incremental document sync...")
+        start_time = time.time()
+        manifest = IngestManifest().load()
 
-        # Get final stats
-        stats = vector_store.get_collection_stats()
-        time_taken = time.time() - start_time
+        pdf_files = sorted(Path(settings.knowledge_dir).glob("*.pdf"))
+        diff = manifest.diff(pdf_files)
+        to_process = sorted(diff["new"] + diff["changed"])
 
-        logger.info("=" * 60)
-        logger.info("Document Ingestion Complete!")
-        logger.info("=" * 60)
         logger.info(
-            f"Total documents in vector store: {stats['document_count']}")
-        logger.info(f"Time taken: {time_taken:.2f} seconds")
-        logger.info(f"Persist directory: {stats['persist_directory']}")
-        logger.info("=" * 60)
+            f"Sync plan: {len(diff['new'])} new, {len(diff['changed'])} changed, "
+            f"{len(diff['removed'])} removed, {diff['unchanged']} unchanged")
+
+        # Drop stale chunks first so a changed file never has mixed versions
+        for filename in diff["removed"]:
+            vector_store.delete_documents_by_source(filename)
+            manifest.remove(filename)
+        for pdf_path in diff["changed"]:
+            vector_store.delete_documents_by_source(pdf_path.name)
+            manifest.remove(pdf_path.name)
+        manifest.save()
+
+        if to_process:
+            # The diff already hashed these, so processing doesn't hash them again
+            for pdf_path, docs, sha256 in document_processor.iter_files(
+                to_process, workers, hashes=diff["hashes"]
+            ):
+                if docs:
+                    vector_store.add_documents(docs)
+                # Record even empty results so unreadable files aren't retried every run
+                manifest.record(pdf_path, sha256, len(docs))
+                manifest.save()
+        else:
+            logger.info("Knowledge folder is already in sync")
+            manifest.save()
+
+        if to_process or diff["removed"] or not os.path.exists(default_index_path()):
+            vector_store.rebuild_bm25_index()
+        _log_summary(start_time)
 
     except Exception as e:
-        logger.error(f"Error during ingestion: {str(e)}")
+        logger.error(f"Error during sync: {str(e)}")
         raise
 
 
 if __name__ == "__main__":
-    # Check for --force flag
+    # Check for --force / --sync flags
     force = "--force" in sys.argv
+    sync = "--sync" in sys.argv
+
+    # Optional worker count: --workers N
+    workers = None
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+
+    if force and sync:
+        logger.error("--force and --sync cannot be combined")
+        sys.exit(1)
 
     if force:
         logger.warning(
             "Force reingestion mode - all existing data will be deleted!")
 
     # Run ingestion
-    asyncio.run(ingest_documents(force=force))
+    if sync:
+        asyncio.run(sync_documents(workers=workers))
+    else:
+        asyncio.run(ingest_documents(force=force, workers=workers))
@@ -0,0 +1,132 @@
+from typing import Dict, Any, List, Optional
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stored next to the Chroma data it describes
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    """Hash a file's contents without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """Record of which PDFs are indexed, keyed by file name, with content hashes."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(
+            settings.chroma_persist_dir, MANIFEST_FILENAME)
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    def load(self) -> "IngestManifest":
+        """Load the manifest from disk (empty if it does not exist yet)."""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f).get("files", {})
+            except (OSError, ValueError) as e:
+                logger.warning(
+                    f"Could not read ingest manifest {self.path}, starting fresh: {str(e)}")
+                self.files = {}
+        return self
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        self.files = {}
+
+    def diff(self, pdf_files: List[Path]) -> Dict[str, Any]:
+        """
+        Compare files on disk with the manifest.
+
+        Files whose size and mtime match the manifest are assumed unchanged;
+        only the rest are hashed.
+
+        Returns:
+            Dict with `new` and `changed` lists of paths, `removed` list of
+            file names, `unchanged` count and `hashes` for every file on disk
+        """
+        new: List[Path] = []
+        changed: List[Path] = []
+        hashes: Dict[str, str] = {}
+        unchanged = 0
+
+        for pdf_path in pdf_files:
+            stat = pdf_path.stat()
+            entry = self.files.get(pdf_path.name)
+            if (
+                entry
+                and entry.get("size") == stat.st_size
+                and entry.get("mtime") == stat.st_mtime
+            ):
+                hashes[pdf_path.name] = entry["sha256"]
+                unchanged += 1
+                continue
+
+            sha256 = file_sha256(str(pdf_path))
+            hashes[pdf_path.name] = sha256
+            if entry is None:
+                new.append(pdf_path)
+            elif entry.get("sha256") != sha256:
+                changed.append(pdf_path)
+            else:
+                # Touched but identical: refresh stat info only
+                self.record(pdf_path, sha256, entry.get("chunks", 0))
+                unchanged += 1
+
+        on_disk = {p.name for p in pdf_files}
+        removed = sorted(name for name in self.files if name not in on_disk)
+
+        return {
+            "new": new,
+            "changed": changed,
+            "removed": removed,
+            "unchanged": unchanged,
+            "hashes": hashes,
+        }
+
+    def record(self, pdf_path: Path, sha256: str, chunks: int) -> None:
+        """Record a file as indexed."""
+        stat = pdf_path.stat()
+        self.files[pdf_path.name] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "chunks": chunks,
+        }
+
+    def remove(self, filename: str) -> None:
+        self.files.pop(filename, None)
+
+
+def corpus_version(path: Optional[str] = None) -> float:
+    """
+    Return a value that changes whenever an ingestion run updates the index.
+
+    Every ingestion path rewrites the manifest, so its mtime works as a
+    cheap cross-process version stamp (0.0 if nothing was ingested yet).
+    """
+    path = path or os.path.join(settings.chroma_persist_dir, MANIFEST_FILENAME)
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
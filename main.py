@@ -29,6 +29,21 @@ async def lifespan(app: FastAPI):
         logger.error(f"Failed to pre-load vector store: {e}")
         logger.warning("Vector store will initialize on first request")
 
+    from background_tasks import background_tasks
+    await background_tasks.start()
+
+    # Load the reranker before serving so no request pays for it
+    if settings.rerank_enabled:
+        from reranker import reranker
+        try:
+            await reranker.warm_up_async()
+        except Exception as e:
+            logger.error(f"Failed to warm up reranker: {e}")
+
+    # Keep Firebase's token-signing certificates warm for auth
+    from auth import token_verifier
+    await token_verifier.start()
+
     logger.info(f"Vector store directory: {settings.chroma_persist_dir}")
     logger.info(f"Knowledge directory: {settings.knowledge_dir}")
     logger.info("API startup complete - Ready for requests!")
@@ -37,6 +52,9 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down StudduoAI API...")
+    # Let deferred titles and message saves finish before the process exits
+    await background_tasks.drain(timeout=settings.background_drain_timeout)
+    await token_verifier.stop()
 
 
 # Create FastAPI app
@@ -54,6 +72,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers hide other response headers from scripts
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -33,6 +33,10 @@ class ChatRequest(BaseModel):
         "explanation", description="Type of response: 'explanation', 'plan', 'example', 'summary', 'problem_solving', 'quiz'")
     is_temporary: bool = Field(
         False, description="If True, conversation won't be saved to database")
+    subject: Optional[str] = Field(
+        None, description="Only search material for this subject (see /api/chat/facets)")
+    module: Optional[int] = Field(
+        None, ge=1, description="Only search material for this module number")
 
 
 class Source(BaseModel):
@@ -115,6 +119,8 @@ class SearchResponse(BaseModel):
     query: str
     total_results: int
     results: List[SearchResult]
+    next_cursor: Optional[str] = Field(
+        None, description="Pass as `cursor` to get the next page of results")
 
 
 class UpdateTitleRequest(BaseModel):
@@ -143,6 +149,35 @@ class DeleteConversationResponse(BaseModel):
     message: str
 
 
+class BulkDeleteRequest(BaseModel):
+    """Request to delete several conversations in the background."""
+    conversation_ids: List[str] = Field(
+        default_factory=list, max_length=500,
+        description="Conversations to delete")
+    temporary_only: bool = Field(
+        False, description="Delete all of the user's temporary conversations instead")
+
+    @model_validator(mode="after")
+    def ids_or_temporary(self) -> "BulkDeleteRequest":
+        """Require exactly one way of choosing conversations."""
+        if bool(self.conversation_ids) == self.temporary_only:
+            raise ValueError(
+                "Provide either conversation_ids or temporary_only=true")
+        return self
+
+
+class BulkDeleteJobResponse(BaseModel):
+    """Progress of a background bulk delete."""
+    job_id: str
+    status: str = Field(...,
+                        description="'queued', 'running', 'completed' or 'completed_with_errors'")
+    total: int
+    deleted: int
+    failed: int
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
 class MessageFeedbackResponse(BaseModel):
     """Response after adding message feedback."""
     status: str
@@ -154,3 +189,17 @@ class ConversationMessagesResponse(BaseModel):
     """Response containing conversation messages with sources."""
     conversation_id: str
     messages: List[ChatMessageWithSources]
+
+
+class FacetCount(BaseModel):
+    """Number of documents and chunks with one facet value."""
+    value: Any = Field(..., description="Facet value, e.g. 'dbms' or 2")
+    documents: int
+    chunks: int
+
+
+class FacetsResponse(BaseModel):
+    """Available retrieval scopes with counts."""
+    subject: List[FacetCount] = Field(default_factory=list)
+    module: List[FacetCount] = Field(default_factory=list)
+    doc_type: List[FacetCount] = Field(default_factory=list)
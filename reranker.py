@@ -0,0 +1,180 @@
+from typing import Any, Dict, List
+import asyncio
+import logging
+import threading
+import time
+
+from config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Weight of the newest observation in the per-pair latency average
+LATENCY_EWMA_ALPHA = 0.2
+# After this many budget skips in a row, one probe rerank re-measures the cost
+PROBE_AFTER_SKIPS = 20
+# Pairs scored when warming the model up, to seed the latency estimate
+WARMUP_PAIRS = 8
+
+
+class CrossEncoderReranker:
+    """
+    Optional cross-encoder rerank stage with a latency budget.
+
+    Retrieval over-fetches N candidates, which are scored against the query
+    in one CPU batch and cut to the best k. N adapts to the measured
+    per-candidate cost so a rerank fits in `budget_ms`. Reranking is
+    skipped (falling back to retrieval order) when the budget can't fit
+    more than k candidates, when too many reranks are already running, or
+    when a rerank overruns the budget. A probe rerank after a run of budget
+    skips lets the estimate recover from a slow spell.
+
+    The model is loaded by `warm_up` (at startup), never inside a budgeted
+    rerank, so load time doesn't count as scoring cost.
+    """
+
+    def __init__(
+        self,
+        max_candidates: int = 20,
+        budget_ms: float = 150.0,
+        max_concurrency: int = 2
+    ):
+        self.max_candidates = max_candidates
+        self.budget_ms = budget_ms
+        self.max_concurrency = max_concurrency
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._in_flight = 0
+        self._warmup_started = False
+        # Optimistic start; corrected by warm_up and every rerank
+        self._ms_per_pair = 2.0
+        self._budget_skips = 0
+        self._probe_pending = False
+        self._stats = {
+            "reranked": 0, "skipped_budget": 0, "skipped_load": 0,
+            "skipped_cold": 0, "probes": 0, "timeouts": 0,
+        }
+
+    def _get_model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(
+                        RERANK_MODEL_NAME, device="cpu", max_length=512)
+                    logger.info(f"Loaded reranker model {RERANK_MODEL_NAME}")
+        return self._model
+
+    def warm_up(self) -> None:
+        """Load the model and measure its per-pair cost (blocking)."""
+        self._warmup_started = True
+        self._get_model()
+        self._score("warm up", [{"text": "warm up passage"}] * WARMUP_PAIRS, seed=True)
+        logger.info(f"Reranker warmed up at {self._ms_per_pair:.2f} ms per pair")
+
+    def _warm_up_logged(self) -> None:
+        try:
+            self.warm_up()
+        except Exception as e:
+            logger.error(f"Failed to load reranker model: {str(e)}")
+
+    async def warm_up_async(self) -> None:
+        """Load the model in a worker thread."""
+        await asyncio.to_thread(self.warm_up)
+
+    def candidate_count(self, k: int) -> int:
+        """How many candidates to fetch so scoring fits the budget."""
+        affordable = int(self.budget_ms / max(self._ms_per_pair, 1e-3))
+        if affordable > k:
+            self._budget_skips = 0
+            return min(self.max_candidates, affordable)
+
+        self._budget_skips += 1
+        if self._budget_skips >= PROBE_AFTER_SKIPS:
+            # Re-measure; the estimate only moves when something is scored
+            self._budget_skips = 0
+            self._probe_pending = True
+            self._stats["probes"] += 1
+            return min(self.max_candidates, k + 1)
+        self._stats["skipped_budget"] += 1
+        return k
+
+    def _score(self, query: str, docs: List[Dict[str, Any]], seed: bool = False) -> List[float]:
+        model = self._get_model()
+        start = time.perf_counter()
+        scores = model.predict(
+            [(query, doc.get("text", "")) for doc in docs],
+            batch_size=len(docs),
+            show_progress_bar=False
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        per_pair = elapsed_ms / len(docs)
+        if seed or self._probe_pending:
+            # Warm-ups and probes are fresh measurements, not one sample of many
+            self._probe_pending = False
+            self._ms_per_pair = per_pair
+        else:
+            self._ms_per_pair = (
+                LATENCY_EWMA_ALPHA * per_pair + (1 - LATENCY_EWMA_ALPHA) * self._ms_per_pair)
+        return [float(score) for score in scores]
+
+    async def rerank_async(
+        self,
+        query: str,
+        docs: List[Dict[str, Any]],
+        k: int
+    ) -> List[Dict[str, Any]]:
+        """Return the best `k` of `docs`, reranked when the budget allows."""
+        if len(docs) <= k:
+            return docs
+        if self._model is None:
+            # Never load inside the budget; warm up in the background instead
+            self._stats["skipped_cold"] += 1
+            if not self._warmup_started:
+                self._warmup_started = True
+                asyncio.get_event_loop().run_in_executor(None, self._warm_up_logged)
+            return docs[:k]
+        if self._in_flight >= self.max_concurrency:
+            self._stats["skipped_load"] += 1
+            return docs[:k]
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_event_loop()
+            scores = await asyncio.wait_for(
+                loop.run_in_executor(None, self._score, query, docs),
+                timeout=self.budget_ms / 1000.0
+            )
+        except asyncio.TimeoutError:
+            # The scoring thread finishes in the background and still
+            # updates the latency estimate, shrinking N for next time
+            self._stats["timeouts"] += 1
+            logger.warning("Rerank exceeded latency budget - using retrieval order")
+            return docs[:k]
+        except Exception as e:
+            logger.error(f"Rerank failed - using retrieval order: {str(e)}")
+            return docs[:k]
+        finally:
+            self._in_flight -= 1
+
+        self._stats["reranked"] += 1
+        ranked = sorted(zip(scores, range(len(docs))), key=lambda item: item[0], reverse=True)
+        return [{**docs[i], "rerank_score": score} for score, i in ranked[:k]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "ms_per_pair": round(self._ms_per_pair, 3),
+            "budget_ms": self.budget_ms,
+            "in_flight": self._in_flight,
+        }
+
+
+# Singleton instance
+reranker = CrossEncoderReranker(
+    max_candidates=settings.rerank_max_candidates,
+    budget_ms=settings.rerank_budget_ms,
+    max_concurrency=settings.rerank_max_concurrency,
+)
@@ -3,6 +3,12 @@ from datetime import datetime
 import time
 
 from vector_store import vector_store
+from background_tasks import background_tasks
+from answer_cache import answer_cache
+from conversation_cache import conversation_cache
+from auth import token_verifier
+from admission import llm_admission
+from reranker import reranker
 from chat_service import chat_service
 from models import HealthResponse, ChatRequest, ChatResponse, Source
 
@@ -38,6 +44,12 @@ async def get_stats():
         return {
             "status": "success",
             "vector_store": stats,
+            "background_tasks": background_tasks.get_stats(),
+            "answer_cache": answer_cache.get_stats(),
+            "conversation_cache": conversation_cache.get_stats(),
+            "auth": token_verifier.get_stats(),
+            "llm_admission": llm_admission.get_stats(),
+            "reranker": reranker.get_stats(),
             "timestamp": datetime.utcnow()
         }
     except Exception as e:
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse, FileResponse
-from typing import List
+from typing import Any, AsyncIterator, List, Awaitable, Optional, TypeVar
+import asyncio
+import json
+import logging
 
 from auth import get_current_user
 from chat_service import chat_service
@@ -16,15 +19,50 @@ from models import (
     MessageFeedbackResponse,
     MessageFeedback,
     SearchResponse,
-    SearchResult
+    SearchResult,
+    FacetsResponse,
+    BulkDeleteRequest,
+    BulkDeleteJobResponse
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
+T = TypeVar("T")
+
+# How often to poll the connection while a long-running chat is in flight
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+async def _run_until_disconnect(request: Request, coro: Awaitable[T]) -> T:
+    """
+    Await `coro`, cancelling it if the client disconnects first.
+
+    Raises:
+        HTTPException: 499 if the client went away before the result was ready
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(
+                    status_code=499,
+                    detail="Client disconnected"
+                )
+    finally:
+        if not task.done():
+            task.cancel()
+
 
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -33,16 +71,19 @@ async def chat(
     - **message**: The user's question or message
     - **conversation_id**: Optional ID to continue existing conversation
     - **include_history**: Whether to use conversation history (default: True)
+    - **subject** / **module**: Optional scope to search only matching course material
     """
     try:
-        result = await chat_service.chat(
+        result = await _run_until_disconnect(http_request, chat_service.chat(
             user_id=current_user["uid"],
             query=request.message,
             conversation_id=request.conversation_id,
             include_history=request.include_history,
             prompt_type=request.prompt_type,
-            is_temporary=request.is_temporary
-        )
+            is_temporary=request.is_temporary,
+            subject=request.subject,
+            module=request.module
+        ))
 
         return ChatResponse(
             message=result["message"],
@@ -53,6 +94,8 @@ async def chat(
             is_temporary=result["is_temporary"]
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -60,24 +103,101 @@ async def chat(
         )
 
 
+def _format_sse(event: str, data: Any) -> str:
+    """Format a single server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Send a message and stream the AI response as server-sent events.
+
+    Events are sent in order: `meta`, `sources`, one `token` per answer
+    fragment, an optional `replace`, `title` (new conversations only),
+    `follow_ups` and finally `done`. Failures are reported as `error`.
+
+    - **message**: The user's question or message
+    - **conversation_id**: Optional ID to continue existing conversation
+    - **include_history**: Whether to use conversation history (default: True)
+    - **subject** / **module**: Optional scope to search only matching course material
+    """
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async for event, data in chat_service.chat_stream(
+                user_id=current_user["uid"],
+                query=request.message,
+                conversation_id=request.conversation_id,
+                include_history=request.include_history,
+                prompt_type=request.prompt_type,
+                is_temporary=request.is_temporary,
+                subject=request.subject,
+                module=request.module
+            ):
+                yield _format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming chat: {str(e)}")
+            yield _format_sse("error", {"message": f"Error processing chat: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
+@router.get("/facets", response_model=FacetsResponse)
+async def get_facets(
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    List the subjects, modules and document types that chat can be scoped to,
+    with the number of documents and chunks for each.
+    """
+    try:
+        return FacetsResponse(**await chat_service.get_facets())
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error retrieving facets: {str(e)}"
+        )
+
+
 @router.get("/conversations", response_model=List[ConversationSummary])
 async def get_conversations(
+    response: Response,
     current_user: dict = Depends(get_current_user),
-    limit: int = 20
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
 ):
     """
-    Get all conversations for the current user.
+    Get the current user's conversations, most recently updated first.
 
-    - **limit**: Maximum number of conversations to return (default: 20)
+    - **limit**: Maximum number of conversations to return (default: 20, max: 100)
+    - **cursor**: Value of the `X-Next-Cursor` header from the previous page
+
+    The `X-Next-Cursor` response header is set while more pages remain.
     """
     try:
-        conversations = await chat_service.get_user_conversations(
+        page = await chat_service.get_user_conversations(
             user_id=current_user["uid"],
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
 
-        return [ConversationSummary(**conv) for conv in conversations]
+        if page["next_cursor"]:
+            response.headers["X-Next-Cursor"] = page["next_cursor"]
+        return [ConversationSummary(**conv) for conv in page["conversations"]]
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -88,12 +208,18 @@ async def get_conversations(
 @router.get("/conversations/search", response_model=SearchResponse)
 async def search_conversations(
     q: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
 ):
     """
     Search conversations by title.
 
+    Every word in the query must match the start of a word in the title.
+
     - **q**: Search query string
+    - **limit**: Maximum number of results to return (default: 20, max: 100)
+    - **cursor**: `next_cursor` from the previous page of results
     """
     try:
         if not q or len(q.strip()) == 0:
@@ -102,19 +228,25 @@ async def search_conversations(
                 detail="Search query cannot be empty"
             )
 
-        results = await chat_service.search_conversations(
+        page = await chat_service.search_conversations(
             user_id=current_user["uid"],
-            search_query=q
+            search_query=q,
+            limit=limit,
+            cursor=cursor
         )
+        results = page["conversations"]
 
         return SearchResponse(
             query=q,
             total_results=len(results),
-            results=[SearchResult(**result) for result in results]
+            results=[SearchResult(**result) for result in results],
+            next_cursor=page["next_cursor"]
         )
 
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -122,6 +254,66 @@ async def search_conversations(
         )
 
 
+def _bulk_delete_job_response(job: dict) -> BulkDeleteJobResponse:
+    return BulkDeleteJobResponse(**{
+        key: value for key, value in job.items()
+        if key not in ("user_id", "conversation_ids", "heartbeat_at")
+    })
+
+
+@router.post("/conversations/bulk-delete", response_model=BulkDeleteJobResponse, status_code=202)
+async def bulk_delete_conversations(
+    request: BulkDeleteRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Delete several conversations in the background.
+
+    - **conversation_ids**: Conversations to delete (up to 500)
+    - **temporary_only**: Delete all temporary conversations instead
+
+    Poll `GET /conversations/bulk-delete/{job_id}` for progress.
+    """
+    try:
+        job = await chat_service.start_bulk_delete(
+            user_id=current_user["uid"],
+            conversation_ids=request.conversation_ids,
+            temporary_only=request.temporary_only
+        )
+        return _bulk_delete_job_response(job)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error starting bulk delete: {str(e)}"
+        )
+
+
+@router.get("/conversations/bulk-delete/{job_id}", response_model=BulkDeleteJobResponse)
+async def get_bulk_delete_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the progress of a bulk delete.
+
+    - **job_id**: ID returned when the bulk delete was started
+    """
+    try:
+        job = await chat_service.get_bulk_delete_job(current_user["uid"], job_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error retrieving bulk delete job: {str(e)}"
+        )
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Bulk delete job not found"
+        )
+    return _bulk_delete_job_response(job)
+
+
 @router.get("/conversations/{conversation_id}/messages", response_model=ConversationMessagesResponse)
 async def get_conversation_messages(
     conversation_id: str,
@@ -0,0 +1,223 @@
+"""Shared test setup: settings from the environment and offline stand-ins for Gemini and Firestore."""
+import asyncio
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-google-api-key")
+os.environ.setdefault("FIREBASE_PROJECT_ID", "test-project")
+
+# firestore_db creates its client at import time; tests never reach Firestore
+mock.patch("firebase_admin.firestore.client", return_value=mock.MagicMock()).start()
+
+from google.cloud.firestore_v1.transforms import Increment  # noqa: E402
+
+FAKE_ANSWER = (
+    "A recursive function solves a problem by calling itself on a smaller "
+    "version of the same problem until it reaches a base case."
+)
+
+
+class FakeGemini:
+    """Stand-in for the Gemini model; every call takes `delay` seconds."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.prompts = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @property
+    def calls(self) -> int:
+        return len(self.prompts)
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        self.prompts.append(prompt)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(text=FAKE_ANSWER)
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data, reference=None):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+        self.reference = reference
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self._path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return FakeQuery(self._db, self._path + (name,))
+
+    def get(self):
+        self._db.reads += 1
+        return FakeSnapshot(self.id, self._db.docs.get(self._path))
+
+    def set(self, data):
+        self._db.apply_set(self._path, data)
+
+    def update(self, data):
+        self._db.apply_update(self._path, data)
+
+
+class FakeQuery:
+    def __init__(self, db, path, order=None, limit=None, offset=0):
+        self._db = db
+        self._path = path
+        self._order = order
+        self._limit = limit
+        self._offset = offset
+
+    def _with(self, **changes):
+        query = FakeQuery(self._db, self._path, self._order, self._limit, self._offset)
+        query.__dict__.update({f"_{key}": value for key, value in changes.items()})
+        return query
+
+    def document(self, doc_id):
+        return FakeDocument(self._db, self._path + (doc_id,))
+
+    def list_documents(self):
+        depth = len(self._path)
+        doc_ids = {path[depth] for path in self._db.docs if len(path) > depth and path[:depth] == self._path}
+        return [FakeDocument(self._db, self._path + (doc_id,)) for doc_id in sorted(doc_ids)]
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._with(order=(field, direction))
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def offset(self, count):
+        return self._with(offset=count)
+
+    def select(self, fields):
+        return self
+
+    def stream(self):
+        self._db.queries += 1
+        docs = [
+            (path[-1], data) for path, data in self._db.docs.items()
+            if path[:-1] == self._path
+        ]
+        if self._order:
+            field, direction = self._order
+            docs.sort(key=lambda item: item[1][field], reverse=direction == "DESCENDING")
+        docs = docs[self._offset:]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return iter([
+            FakeSnapshot(doc_id, data, FakeDocument(self._db, self._path + (doc_id,)))
+            for doc_id, data in docs
+        ])
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, ref, data):
+        self._writes.append((self._db.apply_set, ref._path, data))
+
+    def update(self, ref, data):
+        self._writes.append((self._db.apply_update, ref._path, data))
+
+    def delete(self, ref):
+        self._writes.append((lambda path, _: self._db.docs.pop(path, None), ref._path, None))
+
+    def commit(self):
+        self._db.commits += 1
+        if self._db.failing_commits:
+            self._db.failing_commits -= 1
+            raise RuntimeError("Simulated commit failure")
+        for apply, path, data in self._writes:
+            apply(path, data)
+
+
+class FakeFirestore:
+    """In-memory Firestore client counting document reads, queries and batch commits."""
+
+    def __init__(self):
+        self.docs = {}
+        # Commits to fail before any succeeds
+        self.failing_commits = 0
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.reads = 0
+        self.queries = 0
+        self.commits = 0
+
+    def collection(self, name):
+        return FakeQuery(self, (name,))
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def apply_set(self, path, data):
+        self.docs[path] = dict(data)
+
+    def apply_update(self, path, data):
+        if path not in self.docs:
+            raise KeyError(f"No document to update: {'/'.join(path)}")
+        doc = self.docs[path]
+        for field, value in data.items():
+            doc[field] = doc.get(field, 0) + value.value if isinstance(value, Increment) else value
+
+    def documents(self, *path):
+        """Data of the documents directly under a collection path."""
+        return [data for doc_path, data in self.docs.items() if doc_path[:-1] == path]
+
+
+@pytest.fixture
+def fake_firestore(monkeypatch):
+    import firestore_db
+
+    db = FakeFirestore()
+    monkeypatch.setattr(firestore_db, "db", db)
+    return db
+
+
+@pytest.fixture
+def offline_chat(monkeypatch):
+    """Run chat turns against a FakeGemini and an empty vector store."""
+    import chat_service as chat_service_module
+    from admission import LLMAdmissionController
+    from chat_service import chat_service
+    from config import settings
+    from vector_store import vector_store
+
+    gemini = FakeGemini()
+    monkeypatch.setattr(chat_service, "model", gemini)
+    # Generous limits, so admission never shapes what a test measures
+    monkeypatch.setattr(chat_service_module, "llm_admission", LLMAdmissionController(
+        global_rate_per_minute=60000, global_burst=100,
+        user_rate_per_minute=60000, user_burst=100,
+        max_concurrency=100, max_queue=100))
+
+    async def embed_query_async(query):
+        return [0.0] * 8
+
+    async def search_async(query, k=5, filter_metadata=None):
+        return []
+
+    monkeypatch.setattr(vector_store, "embed_query_async", embed_query_async)
+    monkeypatch.setattr(vector_store, "search_async", search_async)
+    monkeypatch.setattr(settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(settings, "rerank_enabled", False)
+    return gemini
@@ -0,0 +1,221 @@
+"""Cached Firebase ID-token verification against tokens signed with a throwaway key."""
+import asyncio
+import datetime
+import threading
+import time
+from types import SimpleNamespace
+
+import firebase_admin
+import google.auth._helpers
+import google.auth.credentials
+import google.auth.crypt
+import google.auth.jwt
+import google.oauth2.id_token
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from firebase_admin import auth, credentials
+
+import auth as auth_module
+from auth import CachedTokenVerifier, verify_firebase_token
+
+PROJECT_ID = "test-project"
+KEY_ID = "test-key"
+FETCH_DELAY = 0.2
+
+
+class _AnonymousCredential(credentials.Base):
+    def get_credential(self):
+        return google.auth.credentials.AnonymousCredentials()
+
+
+def _signing_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "studduo-tests")])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    signer = google.auth.crypt.RSASigner.from_string(private_pem, key_id=KEY_ID)
+    return signer, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+SIGNER, CERT_PEM = _signing_key()
+
+
+def _token(uid="student-1", issued_at=None, lifetime=3600, signer=SIGNER):
+    issued_at = int(issued_at if issued_at is not None else time.time())
+    return google.auth.jwt.encode(signer, {
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "aud": PROJECT_ID,
+        "sub": uid,
+        "iat": issued_at,
+        "auth_time": issued_at,
+        "exp": issued_at + lifetime,
+        "email": f"{uid}@example.com",
+    }).decode()
+
+
+@pytest.fixture
+def firebase_app():
+    app = firebase_admin.initialize_app(_AnonymousCredential(), {"projectId": PROJECT_ID})
+    yield app
+    firebase_admin.delete_app(app)
+
+
+@pytest.fixture
+def cert_fetches(monkeypatch, firebase_app):
+    """Serve the test certificate in place of Google's, recording the fetching threads."""
+    threads = []
+
+    def fetch_certs(request, certs_url):
+        threads.append(threading.get_ident())
+        # Blocking, like the real download
+        time.sleep(FETCH_DELAY)
+        return {KEY_ID: CERT_PEM}
+
+    monkeypatch.setattr(google.oauth2.id_token, "_fetch_certs", fetch_certs)
+    return threads
+
+
+@pytest.fixture
+def verifier(monkeypatch):
+    verifier = CachedTokenVerifier(max_entries=100)
+    monkeypatch.setattr(auth_module, "token_verifier", verifier)
+    return verifier
+
+
+def _bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_verified_tokens_are_served_from_cache(cert_fetches, verifier):
+    token = _token()
+
+    async def run():
+        return [await verify_firebase_token(_bearer(token)) for _ in range(3)]
+
+    users = asyncio.run(run())
+
+    assert [user["uid"] for user in users] == ["student-1"] * 3
+    assert len(cert_fetches) == 1
+    stats = verifier.get_stats()
+    assert (stats["misses"], stats["hits"], stats["cached_tokens"]) == (1, 2, 1)
+
+
+def test_verification_runs_off_the_event_loop(cert_fetches, verifier):
+    async def run():
+        loop_thread = threading.get_ident()
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        await verifier.verify(_token())
+        ticker.cancel()
+        return loop_thread, ticks
+
+    loop_thread, ticks = asyncio.run(run())
+
+    assert cert_fetches and loop_thread not in cert_fetches
+    # The loop kept running while the certificates were being fetched
+    assert ticks >= FETCH_DELAY / 0.01 / 2
+
+
+def test_cached_tokens_expire_with_the_token(cert_fetches, verifier, monkeypatch):
+    issued_at = time.time()
+    token = _token(issued_at=issued_at, lifetime=60)
+
+    async def run():
+        first = await verify_firebase_token(_bearer(token))
+        # Two minutes later, for both the cache and google-auth
+        later = issued_at + 120
+        monkeypatch.setattr(auth_module, "time", SimpleNamespace(time=lambda: later))
+        monkeypatch.setattr(
+            google.auth._helpers, "utcnow",
+            lambda: datetime.datetime.utcfromtimestamp(later))
+        with pytest.raises(HTTPException) as expired:
+            await verify_firebase_token(_bearer(token))
+        return first, expired.value
+
+    first, error = asyncio.run(run())
+
+    assert first["uid"] == "student-1"
+    assert error.status_code == 401
+    assert "expired" in error.detail
+    stats = verifier.get_stats()
+    assert (stats["misses"], stats["hits"], stats["cached_tokens"]) == (2, 0, 0)
+
+
+def test_rejected_tokens_are_never_cached(verifier, monkeypatch):
+    calls = []
+
+    def revoked(token):
+        calls.append(token)
+        raise auth.RevokedIdTokenError("Token has been revoked")
+
+    monkeypatch.setattr(auth_module.auth, "verify_id_token", revoked)
+    token = _token()
+
+    async def run():
+        errors = []
+        for _ in range(2):
+            with pytest.raises(HTTPException) as rejected:
+                await verify_firebase_token(_bearer(token))
+            errors.append(rejected.value)
+        return errors
+
+    errors = asyncio.run(run())
+
+    assert [error.status_code for error in errors] == [401, 401]
+    assert "revoked" in errors[0].detail
+    # Each attempt is verified again
+    assert len(calls) == 2
+    assert verifier.get_stats()["cached_tokens"] == 0
+
+
+def test_tokens_from_an_unknown_key_are_rejected(cert_fetches, verifier):
+    # Same key ID, different key
+    other_signer, _ = _signing_key()
+    token = _token(signer=other_signer)
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(verify_firebase_token(_bearer(token)))
+
+    assert rejected.value.status_code == 401
+    assert verifier.get_stats()["cached_tokens"] == 0
+
+
+def test_prefetch_is_skipped_when_sdk_internals_change(firebase_app, verifier, monkeypatch):
+    def missing(app):
+        raise AttributeError("'_AuthService' object has no attribute '_token_verifier'")
+
+    monkeypatch.setattr(auth_module.auth, "_get_client", missing)
+
+    async def run():
+        await verifier.start()
+        started = verifier._refresh_task is not None
+        await verifier.stop()
+        return started
+
+    assert asyncio.run(run()) is False
@@ -0,0 +1,60 @@
+"""Bulk delete jobs are tracked in Firestore, so any worker can report or resume them."""
+import asyncio
+
+from background_tasks import background_tasks
+from chat_service import ChatService, chat_service
+
+USER_ID = "student-1"
+
+
+def _add_conversations(db, count):
+    conversation_ids = [f"conv-{index}" for index in range(count)]
+    for conversation_id in conversation_ids:
+        conversation = ("users", USER_ID, "conversations", conversation_id)
+        db.apply_set(conversation, {"id": conversation_id, "message_count": 1})
+        db.apply_set(conversation + ("messages", "m1"), {"id": "m1", "content": "hi"})
+    return conversation_ids
+
+
+def _remaining_conversations(db):
+    return db.documents("users", USER_ID, "conversations")
+
+
+def test_job_progress_is_visible_from_another_worker(fake_firestore):
+    conversation_ids = _add_conversations(fake_firestore, 25)
+
+    async def run():
+        job = await chat_service.start_bulk_delete(USER_ID, conversation_ids)
+        await background_tasks.drain()
+        return await ChatService().get_bulk_delete_job(USER_ID, job["job_id"])
+
+    job = asyncio.run(run())
+
+    assert job["status"] == "completed"
+    assert (job["total"], job["deleted"], job["failed"]) == (25, 25, 0)
+    assert _remaining_conversations(fake_firestore) == []
+    assert asyncio.run(ChatService().get_bulk_delete_job("someone-else", job["job_id"])) is None
+
+
+def test_job_interrupted_by_a_restart_is_resumed_when_polled(fake_firestore):
+    conversation_ids = _add_conversations(fake_firestore, 15)
+    # A worker recorded the first 10 deletions, then restarted
+    for conversation_id in conversation_ids[:10]:
+        fake_firestore.docs.pop(("users", USER_ID, "conversations", conversation_id))
+    fake_firestore.apply_set(("users", USER_ID, "delete_jobs", "job-1"), {
+        "job_id": "job-1", "user_id": USER_ID, "status": "running",
+        "total": 15, "deleted": 10, "failed": 0, "created_at": None, "finished_at": None,
+        "conversation_ids": conversation_ids, "heartbeat_at": 0.0,
+    })
+
+    async def run():
+        worker = ChatService()
+        await worker.get_bulk_delete_job(USER_ID, "job-1")
+        await background_tasks.drain()
+        return await worker.get_bulk_delete_job(USER_ID, "job-1")
+
+    job = asyncio.run(run())
+
+    assert job["status"] == "completed"
+    assert job["deleted"] == 15
+    assert _remaining_conversations(fake_firestore) == []
@@ -0,0 +1,47 @@
+"""Concurrent /api/chat/ requests must not serialize on the Gemini call."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from auth import get_current_user
+from background_tasks import background_tasks
+from main import app
+
+GEMINI_DELAY = 0.3
+CONCURRENT_REQUESTS = 10
+
+
+@pytest.fixture
+def client_app(offline_chat):
+    app.dependency_overrides[get_current_user] = lambda: {"uid": "student-1"}
+    yield app
+    app.dependency_overrides.clear()
+
+
+def test_concurrent_chats_overlap_gemini_calls(client_app, offline_chat):
+    offline_chat.delay = GEMINI_DELAY
+
+    async def run():
+        transport = httpx.ASGITransport(app=client_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post("/api/chat/", json={
+                    "message": f"Explain recursion, question {i}",
+                    "is_temporary": True,
+                })
+                for i in range(CONCURRENT_REQUESTS)
+            ))
+            elapsed = time.perf_counter() - started
+        await background_tasks.drain()
+        return responses, elapsed
+
+    responses, elapsed = asyncio.run(run())
+
+    assert [response.status_code for response in responses] == [200] * CONCURRENT_REQUESTS
+    assert offline_chat.calls == CONCURRENT_REQUESTS
+    assert offline_chat.peak_in_flight == CONCURRENT_REQUESTS
+    # About one Gemini call in total, not one per request
+    assert elapsed < 2 * GEMINI_DELAY
@@ -0,0 +1,19 @@
+"""Backfilling search tokens onto conversations no listing has shown."""
+import asyncio
+
+from firestore_db import firestore_db, title_tokens
+
+
+def test_backfill_indexes_legacy_conversation_titles(fake_firestore):
+    conversations = ("users", "student-1", "conversations")
+    fake_firestore.apply_set(conversations + ("old",), {
+        "id": "old", "title": "Recursion basics", "message_count": 0})
+    fake_firestore.apply_set(conversations + ("new",), {
+        "id": "new", "title": "Sorting", "title_tokens": title_tokens("Sorting"),
+        "message_count": 0, "last_message": ""})
+
+    assert asyncio.run(firestore_db.backfill_conversations()) == 1
+
+    old = fake_firestore.docs[conversations + ("old",)]
+    assert "recur" in old["title_tokens"] and "basics" in old["title_tokens"]
+    assert asyncio.run(firestore_db.backfill_conversations()) == 0
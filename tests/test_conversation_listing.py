@@ -0,0 +1,29 @@
+"""Cursor pagination of the conversation listing, as seen by a browser."""
+import asyncio
+
+import httpx
+
+from auth import get_current_user
+from chat_service import chat_service
+from main import app
+
+ORIGIN = "http://localhost:3000"
+
+
+def test_next_cursor_header_is_exposed_to_browsers(monkeypatch):
+    async def get_user_conversations(user_id, limit=20, cursor=None):
+        return {"conversations": [], "next_cursor": "page-2"}
+
+    monkeypatch.setattr(chat_service, "get_user_conversations", get_user_conversations)
+    monkeypatch.setitem(app.dependency_overrides, get_current_user, lambda: {"uid": "student-1"})
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/chat/conversations", headers={"Origin": ORIGIN})
+
+    response = asyncio.run(run())
+
+    assert response.status_code == 200
+    assert response.headers["X-Next-Cursor"] == "page-2"
+    assert "x-next-cursor" in response.headers["Access-Control-Expose-Headers"].lower()
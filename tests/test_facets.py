@@ -0,0 +1,44 @@
+import pytest
+
+from facets import count_facets, derive_facets, facet_filter
+
+
+@pytest.mark.parametrize("filename, modules", [
+    ("MODULE 3.pdf", [3]),
+    ("Sem 1 chem Module -1-4 notes .pdf", [1, 2, 3, 4]),
+    ("adv. surveying m3&4.pdf", [3, 4]),
+    ("dbms 2,3,4.pdf", [2, 3, 4]),
+    ("os unit i and ii.pdf", [1, 2]),
+    ("dbms module 1 - 2023.pdf", [1]),
+    ("MODULE 4-1.pdf", [4]),
+    ("MODULE 3-1.pdf", [3]),
+    ("Module 2-1.pdf", [2]),
+    ("module 3-2-1.pdf", [3]),
+    ("module 4-2.pdf", [4]),
+    ("module 1-3-1.pdf", [1, 2, 3]),
+    ("sem 1 os.pdf", []),
+])
+def test_module_ranges_and_lists(filename, modules):
+    facets = derive_facets(filename)
+    assert facets.get("module") == (modules[0] if modules else None)
+    assert sorted(int(key[7:]) for key in facets if key.startswith("module_")) == modules
+
+
+@pytest.mark.parametrize("filename, subject", [
+    ("DS & RCC m1.pdf", "design_of_structures"),
+    ("Design of structures module 2.pdf", "design_of_structures"),
+    ("ds module 5.pdf", "data_structures"),
+])
+def test_structures_subjects_are_distinct(filename, subject):
+    assert derive_facets(filename)["subject"] == subject
+
+
+def test_module_filter_and_counts_cover_every_module():
+    assert facet_filter(module=4) == {"$or": [{"module": 4}, {"module_4": True}]}
+
+    metadatas = [
+        {**derive_facets("adv. surveying m3&4.pdf"), "source": "a.pdf"},
+        {"module": 4, "source": "b.pdf"},  # ingested before module flags
+    ]
+    counts = {item["value"]: item["documents"] for item in count_facets(metadatas)["module"]}
+    assert counts == {3: 1, 4: 2}
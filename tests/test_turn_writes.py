@@ -0,0 +1,126 @@
+"""Firestore round trips per chat turn, and visibility of a turn to the next one."""
+import asyncio
+
+import pytest
+
+from background_tasks import background_tasks
+from chat_service import chat_service
+from conversation_cache import conversation_cache
+from firestore_db import TurnWriteBatch
+
+USER_ID = "student-1"
+FIRST_QUESTION = "What is recursion in programming?"
+FOLLOW_UP = "Can you show an example of it?"
+
+
+def _messages(db, conversation_id):
+    return db.documents("users", USER_ID, "conversations", conversation_id, "messages")
+
+
+def _conversation(db, conversation_id):
+    return db.docs.get(("users", USER_ID, "conversations", conversation_id))
+
+
+async def _turn(conversation_id=None, query=FIRST_QUESTION):
+    return await chat_service.chat(USER_ID, query, conversation_id=conversation_id)
+
+
+def test_new_conversation_is_committed_before_the_response(fake_firestore, offline_chat):
+    async def run():
+        result = await _turn()
+        conversation_id = result["conversation_id"]
+        # Checked before any background job has had a chance to run
+        conversation = _conversation(fake_firestore, conversation_id)
+        messages = _messages(fake_firestore, conversation_id)
+        counts = (fake_firestore.reads, fake_firestore.queries, fake_firestore.commits)
+        await background_tasks.drain()
+        return conversation_id, conversation, messages, counts
+
+    conversation_id, conversation, messages, counts = asyncio.run(run())
+
+    assert conversation is not None
+    assert conversation["message_count"] == 2
+    assert [message["role"] for message in sorted(messages, key=lambda m: m["timestamp"])] == [
+        "user", "assistant"]
+    # A new conversation needs no reads and one batch commit
+    assert counts == (0, 0, 1)
+    # The title lands afterwards in a second, metadata-only write
+    assert fake_firestore.commits == 2
+    assert _conversation(fake_firestore, conversation_id)["title"] != "New Conversation"
+    assert len(_messages(fake_firestore, conversation_id)) == 2
+
+
+def test_new_conversation_is_titled_after_a_failed_turn_commit(fake_firestore, offline_chat):
+    async def run():
+        writes = TurnWriteBatch(USER_ID, "conv-1", exists=False)
+        writes.add_message("user", FIRST_QUESTION)
+        writes.add_message("assistant", "Recursion is when a function calls itself.")
+        fake_firestore.failing_commits = 1
+        with pytest.raises(RuntimeError):
+            await writes.commit()
+        # The title job finds the turn still buffered
+        await chat_service._title_conversation(writes, FIRST_QUESTION, "Recursion explained")
+
+    asyncio.run(run())
+
+    conversation = _conversation(fake_firestore, "conv-1")
+    assert conversation["message_count"] == 2
+    assert conversation["title"] != "New Conversation"
+    assert len(_messages(fake_firestore, "conv-1")) == 2
+
+
+def test_immediate_follow_up_on_another_worker_sees_the_first_turn(fake_firestore, offline_chat):
+    async def run():
+        first = await _turn()
+        conversation_id = first["conversation_id"]
+        # Sent right away (title still pending) to a worker with nothing cached
+        conversation_cache.invalidate(USER_ID, conversation_id)
+        second = await _turn(conversation_id, FOLLOW_UP)
+        await background_tasks.drain()
+        return conversation_id, second
+
+    conversation_id, second = asyncio.run(run())
+
+    assert second["conversation_id"] == conversation_id
+    follow_up_prompt = next(p for p in offline_chat.prompts if FOLLOW_UP in p and "Previous conversation" in p)
+    assert FIRST_QUESTION in follow_up_prompt
+    assert _conversation(fake_firestore, conversation_id)["message_count"] == 4
+    assert len(_messages(fake_firestore, conversation_id)) == 4
+
+
+def test_existing_conversation_turn_round_trips(fake_firestore, offline_chat):
+    async def run():
+        first = await _turn()
+        conversation_id = first["conversation_id"]
+        await background_tasks.drain()
+        conversation_cache.invalidate(USER_ID, conversation_id)
+        fake_firestore.reset_counts()
+        await _turn(conversation_id, FOLLOW_UP)
+        counts = (fake_firestore.reads, fake_firestore.queries, fake_firestore.commits)
+        await background_tasks.drain()
+        return counts
+
+    # One conversation read, one history query, one batch commit
+    assert asyncio.run(run()) == (1, 1, 1)
+
+
+def test_follow_up_on_the_same_worker_is_served_from_cache(fake_firestore, offline_chat, monkeypatch):
+    monkeypatch.setattr(conversation_cache, "trust_seconds", 60.0)
+
+    async def run():
+        first = await _turn()
+        conversation_id = first["conversation_id"]
+        await background_tasks.drain()
+        fake_firestore.reset_counts()
+        await _turn(conversation_id, FOLLOW_UP)
+        counts = (fake_firestore.reads, fake_firestore.queries, fake_firestore.commits)
+        await background_tasks.drain()
+        return conversation_id, counts
+
+    conversation_id, counts = asyncio.run(run())
+
+    # Conversation and history come from this worker's cache; only the commit remains
+    assert counts == (0, 0, 1)
+    follow_up_prompt = next(p for p in offline_chat.prompts if FOLLOW_UP in p and "Previous conversation" in p)
+    assert FIRST_QUESTION in follow_up_prompt
+    assert _conversation(fake_firestore, conversation_id)["message_count"] == 4
@@ -1,18 +1,40 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from collections import OrderedDict
+import json
 import logging
-import hashlib
 import asyncio
 import threading
+import time
 
 import chromadb
+import numpy as np
 from chromadb.config import Settings as ChromaSettings
-from langchain_community.embeddings import HuggingFaceEmbeddings
 
 from config import settings
+from embedding_engine import QueryEmbeddingBatcher, create_embedding_engine
+from embedding_cache import create_query_embedding_cache
+from bm25_index import (
+    BM25Index,
+    BM25IndexHolder,
+    BUILD_PAGE_SIZE,
+    default_index_path,
+    reciprocal_rank_fusion,
+)
+from context_packer import merge_adjacent
+from facets import count_facets
+from ingest_manifest import corpus_version
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Facet scopes whose BM25 chunk masks are kept for the loaded index
+BM25_SCOPE_MASK_CACHE_SIZE = 64
+
+
+def document_id(metadata: Dict[str, Any]) -> str:
+    """Build the ChromaDB ID of a chunk from its metadata."""
+    return f"{metadata['source']}_{metadata['chunk_id']}"
+
 
 class VectorStore:
     """ChromaDB vector store for document embeddings with async support."""
@@ -20,10 +42,18 @@ class VectorStore:
     def __init__(self, preload: bool = False):
         # Eager or lazy initialization based on preload flag
         self.embeddings = None
+        self.query_batcher: Optional[QueryEmbeddingBatcher] = None
         self.client = None
         self.collection = None
         self.collection_name = "notegpt_documents"
-        self.query_embedding_cache: Dict[str, List[float]] = {}
+        self.query_embedding_cache = create_query_embedding_cache()
+        self.bm25 = BM25IndexHolder()
+        # Facet scope -> mask of the chunks it covers, for the index it was built for
+        self._scope_masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._scope_masks_index: Optional[BM25Index] = None
+        self._scope_masks_lock = threading.Lock()
+        # (corpus version, counts) so facet counts are only recomputed after a reingest
+        self._facet_counts: Optional[Tuple[float, Dict[str, Any]]] = None
         self._initialized = False
         self._init_lock = threading.Lock()
 
@@ -45,14 +75,14 @@ class VectorStore:
         
         # Load embeddings model (this may take a moment)
         try:
-            # Use smaller model for memory efficiency on Render (512MB limit)
-            # sentence-transformers/all-MiniLM-L6-v2 is ~90MB vs larger models
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="all-MiniLM-L6-v2",
-                encode_kwargs={"normalize_embeddings": True},
-                model_kwargs={"device": "cpu"},
+            self.embeddings = create_embedding_engine()
+            self.query_batcher = QueryEmbeddingBatcher(
+                self.embeddings.embed_documents,
+                max_batch=settings.query_batch_max_size,
+                max_wait_ms=settings.query_batch_max_wait_ms
             )
-            logger.info("HuggingFace embeddings loaded successfully (all-MiniLM-L6-v2)")
+            logger.info(
+                f"Embeddings loaded successfully (all-MiniLM-L6-v2, {settings.embedding_backend} backend)")
         except Exception as e:
             logger.error(f"Failed to load embeddings: {e}")
             raise
@@ -85,81 +115,86 @@ class VectorStore:
         
         self._initialized = True
         logger.info("Vector store initialized successfully")
-        self.query_embedding_cache: Dict[str, List[float]] = {}
 
     async def initialize_async(self):
         """Async initialization wrapper for startup."""
         loop = asyncio.get_event_loop()
         await loop.run_in_executor(None, self._initialize)
+        if settings.hybrid_search_enabled:
+            # Load the BM25 index up front; later reloads happen in the background
+            await self.bm25.refresh_async()
+
+    def add_documents(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add documents to the vector store.
 
-    def add_documents(self, documents: List[Dict[str, Any]]) -> None:
-        """Add documents to the vector store."""
+        Documents are consumed lazily and embedded and upserted one
+        micro-batch at a time, so peak memory is bounded by the batch size
+        rather than the number of documents.
+
+        Returns:
+            Number of documents added
+        """
         self._initialize()  # Ensure initialized
-        
-        if not documents:
+
+        batch_size = settings.ingest_batch_size
+        total = 0
+        batch_count = 0
+        batch: List[Dict[str, Any]] = []
+
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self._add_batch(batch)
+                total += len(batch)
+                batch_count += 1
+                logger.info(f"Added batch {batch_count} ({total} documents so far)")
+                batch = []
+
+        if batch:
+            self._add_batch(batch)
+            total += len(batch)
+            batch_count += 1
+            logger.info(f"Added batch {batch_count} ({total} documents so far)")
+
+        if total == 0:
             logger.warning("No documents to add")
-            return
+        else:
+            logger.info(
+                f"Successfully added {total} documents to vector store")
+        return total
 
+    def _add_batch(self, documents: List[Dict[str, Any]]) -> None:
+        """Embed one batch of documents and upsert it into ChromaDB."""
         texts = [doc["text"] for doc in documents]
         metadatas = [doc["metadata"] for doc in documents]
 
         # Generate IDs
-        ids = [
-            f"{doc['metadata']['source']}_{doc['metadata']['chunk_id']}"
-            for doc in documents
-        ]
+        ids = [document_id(doc["metadata"]) for doc in documents]
 
-        # Generate embeddings
-        logger.info(f"Generating embeddings for {len(texts)} documents...")
         embeddings = self.embeddings.embed_documents(texts)
 
-        # Add to ChromaDB in batches
-        batch_size = 100
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            batch_embeddings = embeddings[i:i + batch_size]
-            batch_metadatas = metadatas[i:i + batch_size]
-            batch_ids = ids[i:i + batch_size]
-
-            self.collection.add(
-                documents=batch_texts,
-                embeddings=batch_embeddings,
-                metadatas=batch_metadatas,
-                ids=batch_ids
-            )
-            logger.info(f"Added batch {i//batch_size + 1}")
-
-        logger.info(
-            f"Successfully added {len(documents)} documents to vector store")
-
-    def _get_query_cache_key(self, query: str) -> str:
-        """Generate cache key for query embedding."""
-        return hashlib.md5(query.encode()).hexdigest()
+        # Upsert so re-indexing a file overwrites its chunks instead of failing
+        self.collection.upsert(
+            documents=texts,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids
+        )
 
     def _get_cached_embedding(self, query: str) -> Optional[List[float]]:
         """Retrieve cached embedding for a query."""
-        cache_key = self._get_query_cache_key(query)
-        if cache_key in self.query_embedding_cache:
+        embedding = self.query_embedding_cache.get(query)
+        if embedding is not None:
             logger.debug(f"Cache hit for query embedding: {query[:50]}...")
-            return self.query_embedding_cache[cache_key]
-        return None
+        return embedding
 
     def _cache_embedding(self, query: str, embedding: List[float]) -> None:
         """Cache embedding for a query."""
-        cache_key = self._get_query_cache_key(query)
-        self.query_embedding_cache[cache_key] = embedding
+        self.query_embedding_cache.put(query, embedding)
         logger.debug(
             f"Cached embedding for query: {query[:50]}... (cache size: {len(self.query_embedding_cache)})")
 
-        # Limit cache size to prevent memory issues (keep last 1000 queries)
-        if len(self.query_embedding_cache) > 1000:
-            # Remove oldest entries (simple FIFO)
-            keys_to_remove = list(self.query_embedding_cache.keys())[:-1000]
-            for key in keys_to_remove:
-                del self.query_embedding_cache[key]
-            logger.info(
-                f"Cache pruned. Current size: {len(self.query_embedding_cache)}")
-
     def similarity_search(
         self,
         query: str,
@@ -181,7 +216,15 @@ class VectorStore:
             query_embedding = self.embeddings.embed_query(query)
             self._cache_embedding(query, query_embedding)
 
-        # Search in ChromaDB
+        return self._search_by_embedding(query_embedding, k, filter_metadata)
+
+    def _search_by_embedding(
+        self,
+        query_embedding: List[float],
+        k: int,
+        filter_metadata: Optional[Dict] = None
+    ) -> List[Dict[str, Any]]:
+        """Query ChromaDB with a precomputed embedding."""
         results = self.collection.query(
             query_embeddings=[query_embedding],
             n_results=k,
@@ -200,18 +243,216 @@ class VectorStore:
 
         return documents
 
+    async def embed_query_async(self, query: str) -> List[float]:
+        """Embed a query via the cache, then the micro-batcher on a miss."""
+        if not self._initialized:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._initialize)
+
+        query_embedding = await self.query_embedding_cache.get_async(query)
+        if query_embedding is None:
+            query_embedding = await self.query_batcher.embed(query)
+            await self.query_embedding_cache.put_async(query, query_embedding)
+        return query_embedding
+
     async def similarity_search_async(
         self,
         query: str,
         k: int = None,
         filter_metadata: Optional[Dict] = None
     ) -> List[Dict[str, Any]]:
-        """Async version of similarity search for better concurrency."""
+        """
+        Async version of similarity search for better concurrency.
+
+        Cache misses are embedded through the query micro-batcher, so
+        concurrent requests share one forward pass.
+        """
+        loop = asyncio.get_event_loop()
+        if k is None:
+            k = settings.top_k_results
+
+        query_embedding = await self.embed_query_async(query)
+
+        return await loop.run_in_executor(
+            None, self._search_by_embedding, query_embedding, k, filter_metadata)
+
+    async def search_async(
+        self,
+        query: str,
+        k: int = None,
+        filter_metadata: Optional[Dict] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve the best chunks for a query.
+
+        When hybrid search is enabled and a BM25 index has been built, the
+        vector and BM25 searches run concurrently and are fused with
+        reciprocal rank fusion; otherwise this is a plain vector search.
+        """
+        if k is None:
+            k = settings.top_k_results
+
+        index = self.bm25.get(time.monotonic()) if settings.hybrid_search_enabled else None
+        if index is None:
+            return await self.similarity_search_async(query, k, filter_metadata)
+
+        candidates = max(k, settings.hybrid_candidates)
+        loop = asyncio.get_event_loop()
+        vector_results, bm25_results = await asyncio.gather(
+            self.similarity_search_async(query, candidates, filter_metadata),
+            loop.run_in_executor(
+                None, self._bm25_search, index, query, candidates, filter_metadata)
+        )
+        return await loop.run_in_executor(
+            None, self._fuse_results, vector_results, bm25_results, k, filter_metadata)
+
+    def _bm25_scope_mask(self, index: BM25Index, filter_metadata: Dict) -> np.ndarray:
+        """Mask of the index's chunks inside a facet scope, cached per loaded index."""
+        key = json.dumps(filter_metadata, sort_keys=True)
+        with self._scope_masks_lock:
+            if self._scope_masks_index is not index:
+                self._scope_masks.clear()
+                self._scope_masks_index = index
+            mask = self._scope_masks.get(key)
+            if mask is not None:
+                self._scope_masks.move_to_end(key)
+                return mask
+
+        in_scope = self.collection.get(where=filter_metadata, include=[])["ids"]
+        mask = index.mask(in_scope)
+        with self._scope_masks_lock:
+            if self._scope_masks_index is index:
+                self._scope_masks[key] = mask
+                while len(self._scope_masks) > BM25_SCOPE_MASK_CACHE_SIZE:
+                    self._scope_masks.popitem(last=False)
+        return mask
+
+    def _bm25_search(
+        self,
+        index: BM25Index,
+        query: str,
+        n: int,
+        filter_metadata: Optional[Dict] = None
+    ) -> List[Tuple[str, float]]:
+        """BM25 search, restricted to the facet scope before the top `n` are taken."""
+        mask = self._bm25_scope_mask(index, filter_metadata) if filter_metadata else None
+        return index.search(query, n, mask)
+
+    def _fuse_results(
+        self,
+        vector_results: List[Dict[str, Any]],
+        bm25_results: List[Tuple[str, float]],
+        k: int,
+        filter_metadata: Optional[Dict] = None
+    ) -> List[Dict[str, Any]]:
+        """Fuse vector and BM25 rankings, fetching BM25-only chunks by ID."""
+        by_id = {
+            document_id(doc["metadata"]): doc for doc in vector_results
+            if doc.get("metadata", {}).get("source")
+        }
+        fused = reciprocal_rank_fusion(
+            [list(by_id), [doc_id for doc_id, _ in bm25_results]],
+            k=settings.rrf_k
+        )
+
+        # BM25 hits are already in scope; the filter below is a safety net
+        missing = [doc_id for doc_id, _ in fused[:k * 2] if doc_id not in by_id]
+        if missing:
+            fetched = self.collection.get(
+                ids=missing,
+                where=filter_metadata if filter_metadata else None,
+                include=["documents", "metadatas"]
+            )
+            for doc_id, text, metadata in zip(
+                fetched["ids"], fetched["documents"], fetched["metadatas"]
+            ):
+                # No vector distance for chunks only BM25 found
+                by_id[doc_id] = {"text": text, "metadata": metadata, "distance": None}
+
+        return [by_id[doc_id] for doc_id, _ in fused if doc_id in by_id][:k]
+
+    def expand_with_neighbors(
+        self,
+        docs: List[Dict[str, Any]],
+        window: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Stitch each retrieved chunk together with its neighbouring chunks.
+
+        Neighbour IDs are derived from `source`, `chunk_id` and `total_chunks`
+        and fetched in one batched `get`, so no extra embedding or vector
+        query is needed. Overlapping windows are merged and the splitter
+        overlap between consecutive chunks is removed.
+
+        Args:
+            docs: Retrieved documents, best first
+            window: Number of chunks to add on each side of every hit
+
+        Returns:
+            Passages in hit order, each keeping the best hit's `metadata` and
+            `distance` and listing the chunks it covers in `chunk_ids`
+        """
+        if window <= 0 or not docs:
+            return docs
+        self._initialize()  # Ensure initialized
+
+        known = {
+            document_id(doc["metadata"]) for doc in docs
+            if doc.get("metadata", {}).get("source") and doc["metadata"].get("chunk_id") is not None
+        }
+        wanted: List[str] = []
+        for doc in docs:
+            metadata = doc.get("metadata", {})
+            chunk_id = metadata.get("chunk_id")
+            if not metadata.get("source") or chunk_id is None:
+                continue
+            total = metadata.get("total_chunks", chunk_id + window + 1)
+            for neighbor in range(max(0, chunk_id - window), min(total, chunk_id + window + 1)):
+                neighbor_id = document_id({"source": metadata["source"], "chunk_id": neighbor})
+                if neighbor_id not in known:
+                    known.add(neighbor_id)
+                    wanted.append(neighbor_id)
+
+        neighbors: List[Dict[str, Any]] = []
+        if wanted:
+            fetched = self.collection.get(ids=wanted, include=["documents", "metadatas"])
+            for text, metadata in zip(fetched["documents"], fetched["metadatas"]):
+                neighbors.append({"text": text, "metadata": metadata, "distance": None})
+
+        # Neighbours rank after every hit so a passage keeps its hit's metadata
+        return [
+            {
+                "text": passage["text"],
+                "metadata": passage["metadata"],
+                "distance": passage["distance"],
+                "chunk_ids": passage["chunk_ids"],
+            }
+            for passage in merge_adjacent(docs + neighbors, settings.chunk_overlap)
+        ]
+
+    async def expand_with_neighbors_async(
+        self,
+        docs: List[Dict[str, Any]],
+        window: int
+    ) -> List[Dict[str, Any]]:
+        """Async wrapper for `expand_with_neighbors`."""
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.similarity_search, query, k, filter_metadata)
+        return await loop.run_in_executor(None, self.expand_with_neighbors, docs, window)
+
+    def rebuild_bm25_index(self) -> None:
+        """Rebuild the on-disk BM25 index from the current collection."""
+        self._initialize()  # Ensure initialized
+        logger.info("Building BM25 index...")
+        BM25Index.build_from_collection(self.collection).save(default_index_path())
+
+    def delete_documents_by_source(self, source: str) -> None:
+        """Delete all chunks that came from one source file."""
+        self._initialize()  # Ensure initialized
+        self.collection.delete(where={"source": source})
+        logger.info(f"Deleted chunks for source: {source}")
 
     def delete_collection(self) -> None:
-        """Delete the entire collection."""
+        """Delete the entire collection and start an empty one."""
         self._initialize()  # Ensure initialized
         try:
             self.client.delete_collection(name=self.collection_name)
@@ -219,6 +460,12 @@ class VectorStore:
         except Exception as e:
             logger.error(f"Error deleting collection: {str(e)}")
 
+        # Recreate so later writes don't target the deleted collection
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the collection."""
         self._initialize()  # Ensure initialized
@@ -226,9 +473,38 @@ class VectorStore:
         return {
             "collection_name": self.collection_name,
             "document_count": count,
-            "persist_directory": settings.chroma_persist_dir
+            "persist_directory": settings.chroma_persist_dir,
+            "query_batching": self.query_batcher.get_stats(),
+            "query_embedding_cache": self.query_embedding_cache.get_stats()
         }
 
+    def get_facet_counts(self) -> Dict[str, Any]:
+        """
+        Count documents and chunks per subject, module and document type.
+
+        Metadata is read page by page (no documents or embeddings) and the
+        result is cached until the next ingestion run.
+        """
+        self._initialize()  # Ensure initialized
+        version = corpus_version()
+        if self._facet_counts is not None and self._facet_counts[0] == version:
+            return self._facet_counts[1]
+
+        metadatas: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            page = self.collection.get(
+                limit=BUILD_PAGE_SIZE, offset=offset, include=["metadatas"])
+            page_metadatas = page.get("metadatas") or []
+            if not page_metadatas:
+                break
+            metadatas.extend(page_metadatas)
+            offset += len(page_metadatas)
+
+        counts = count_facets(metadatas)
+        self._facet_counts = (version, counts)
+        return counts
+
 
 # Singleton instance with preload=True for faster first requests
 vector_store = VectorStore(preload=False)  # Will be initialized on app startup